@@ -0,0 +1,526 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+import itertools
+import numpy as np
+
+from .propagation import Ray, find_intersection_bundle
+from .trace import BundleTrace, TraceStats
+from .polarization import transmission
+
+
+def chunks(ray: Ray, chunk_size: int):
+    """Split a ``Ray`` bundle into bundles of at most ``chunk_size`` rays."""
+    vector = np.broadcast_arrays(*ray.vector)
+    n_rays = np.size(vector[0])
+    wavelength = ray.wavelength
+    for start in range(0, n_rays, chunk_size):
+        part = slice(start, start + chunk_size)
+        yield Ray(
+            *(np.ravel(v)[part] for v in vector),
+            np.ravel(wavelength)[part] if np.ndim(wavelength) else wavelength,
+        )
+
+
+@dataclass
+class Spot:
+    """Centroid, RMS radius and number of the valid hits of a bundle."""
+
+    centroid: np.ndarray
+    rms_radius: float
+    rays: int
+
+
+def spot(x, y, valid, chunk_size: int = 2**20) -> Spot:
+    """Spot statistics read chunk by chunk.
+
+    ``x``, ``y`` and ``valid`` may be memory-mapped arrays (see
+    ``crayons.storage.RayFile``) that are never loaded whole. Sums are shifted
+    by the first chunk centroid to keep the one-pass variance accurate.
+    """
+    n, sums, squares, shift = 0, np.zeros(2), 0.0, None
+    for start in range(0, len(valid), chunk_size):
+        part = slice(start, start + chunk_size)
+        mask = np.asarray(valid[part])
+        points = np.array([np.asarray(x[part])[mask], np.asarray(y[part])[mask]])
+        if points.shape[1] == 0:
+            continue
+        if shift is None:
+            shift = points.mean(axis=1)
+        points -= shift[:, None]
+        n += points.shape[1]
+        sums += points.sum(axis=1)
+        squares += np.einsum("ij,ij->", points, points)
+    if n == 0:
+        return Spot(np.full(2, np.nan), np.nan, 0)
+    mean = sums / n
+    return Spot(mean + shift, np.sqrt(max(squares / n - mean @ mean, 0)), n)
+
+
+class Irradiance:
+    """Image-plane hit histogram accumulated chunk by chunk.
+
+    Hits of valid rays are binned with ``np.bincount`` on a fixed grid, each
+    ray weighted by the weight of its wavelength and by its own energy, so
+    memory and rendering cost do not depend on the number of rays. The
+    ``extent`` (xmin, xmax, ymin, ymax) is taken from the first chunk when not
+    given. Squared weights are accumulated in ``squares`` to estimate the
+    Monte Carlo noise of every bin.
+    """
+
+    def __init__(
+        self, bins=256, extent=None, wavelengths=None, wavelengths_weights=None
+    ):
+        self.bins = (bins, bins) if np.ndim(bins) == 0 else tuple(bins)
+        self.extent = None if extent is None else tuple(extent)
+        self.wavelengths = wavelengths
+        self.wavelengths_weights = wavelengths_weights
+        self.image = np.zeros(self.bins[::-1])
+        self.squares = np.zeros(self.bins[::-1])
+        self.rays = 0
+
+    @classmethod
+    def from_system(cls, system, **kwargs):
+        return cls(
+            wavelengths=system.wavelengths,
+            wavelengths_weights=system.wavelengths_weights,
+            **kwargs,
+        )
+
+    def wavelength_weights(self, wavelength):
+        if self.wavelengths is None:
+            return 1.0
+        lams, inverse = np.unique(wavelength, return_inverse=True)
+        table = dict(
+            zip(np.ravel(self.wavelengths), np.ravel(self.wavelengths_weights))
+        )
+        return np.array([table.get(lam, 1.0) for lam in lams.tolist()])[inverse]
+
+    def add(self, bundle: BundleTrace, weights=None):
+        """Bin the valid rays of a traced chunk, ``weights`` being ray energies.
+
+        Rays traced with polarization are also weighted by their unpolarized
+        transmission.
+        """
+        if bundle.prt is not None:
+            weights = (1 if weights is None else weights) * transmission(bundle.prt)
+        x, y = bundle.ray[0], bundle.ray[1]
+        valid = bundle.valid
+        weights = (
+            np.broadcast_to(1.0 if weights is None else weights, valid.shape)
+            * np.broadcast_to(
+                self.wavelength_weights(bundle.ray.wavelength), valid.shape
+            )
+        )[valid]
+        x, y = x[valid], y[valid]
+        self.rays += valid.size
+        if x.size == 0:
+            return self
+        if self.extent is None:
+            span = max(np.ptp(x), np.ptp(y)) * 0.05 or 1e-9
+            self.extent = (
+                x.min() - span,
+                x.max() + span,
+                y.min() - span,
+                y.max() + span,
+            )
+        xmin, xmax, ymin, ymax = self.extent
+        nx, ny = self.bins
+        ix = np.floor((x - xmin) * (nx / (xmax - xmin))).astype(np.intp)
+        iy = np.floor((y - ymin) * (ny / (ymax - ymin))).astype(np.intp)
+        inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        index, weights = iy[inside] * nx + ix[inside], weights[inside]
+        self.image += np.bincount(index, weights, minlength=nx * ny).reshape(ny, nx)
+        self.squares += np.bincount(index, weights**2, minlength=nx * ny).reshape(
+            ny, nx
+        )
+        return self
+
+    @property
+    def pixel_area(self):
+        xmin, xmax, ymin, ymax = self.extent
+        return (xmax - xmin) * (ymax - ymin) / (self.bins[0] * self.bins[1])
+
+    def irradiance(self, power: float = 1):
+        """Flux per unit area of every bin for a source emitting ``power``."""
+        return self.image * power / (max(self.rays, 1) * self.pixel_area)
+
+    def relative_noise(self, threshold: float = 0.1):
+        """RMS relative standard error of the bins above ``threshold`` * peak."""
+        lit = self.image > threshold * self.image.max(initial=0)
+        if not np.any(lit):
+            return np.inf
+        return np.sqrt(np.mean(self.squares[lit] / self.image[lit] ** 2))
+
+    def trace(
+        self,
+        plan,
+        rays,
+        key: int = 0,
+        chunk_size: int = 2**16,
+        weights=None,
+        polarization: bool = False,
+    ):
+        """Trace ``rays`` and bin them chunk by chunk.
+
+        ``plan`` is a ``System`` or a compiled ``TracePlan``. ``rays`` is a
+        bundle, traced ``chunk_size`` rays at a time with per-ray ``weights``
+        split alongside, or an iterable of chunks with ``weights`` None, a
+        scalar or an iterable of per-chunk weights. With ``polarization``,
+        rays are also weighted by their Fresnel transmission.
+        """
+        if hasattr(plan, "compile"):
+            plan = plan.compile()
+        if isinstance(rays, Ray):
+            if np.ndim(weights):
+                energy = np.ravel(weights)
+                weights = (
+                    energy[i : i + chunk_size]
+                    for i in range(0, energy.size, chunk_size)
+                )
+            rays = chunks(rays, chunk_size)
+        if not isinstance(weights, Iterable):
+            weights = itertools.repeat(weights)
+        for chunk, chunk_weights in zip(rays, weights):
+            self.add(
+                plan.trace(chunk, key=key, polarization=polarization), chunk_weights
+            )
+        return self
+
+    def plot(self, ax=None, **kwargs):
+        import matplotlib.pyplot as plt
+
+        if ax is None:
+            fig, ax = plt.subplots(1, 1)
+        kwargs.setdefault("cmap", "inferno")
+        return ax.imshow(self.image, origin="lower", extent=self.extent, **kwargs)
+
+
+@dataclass
+class FieldMap:
+    """Per-field metrics on a (ny, nx) grid of field points.
+
+    ``fields`` holds the (2, ny, nx) field coordinates. Image-plane lengths
+    are in system units: ``chief`` and ``centroid`` are (2, ny, nx) positions,
+    ``rms_radius`` is taken about the centroid and ``distortion`` is in
+    percent of the paraxial chief ray height. ``tangential`` and
+    ``sagittal`` are the best focus shifts along z of the fans along and
+    across the field direction. ``transmitted`` is the fraction of unvignetted
+    rays.
+    """
+
+    fields: np.ndarray
+    chief: np.ndarray
+    centroid: np.ndarray
+    rms_radius: np.ndarray
+    distortion: np.ndarray
+    tangential: np.ndarray
+    sagittal: np.ndarray
+    transmitted: np.ndarray
+
+    @property
+    def astigmatism(self):
+        return self.tangential - self.sagittal
+
+    @property
+    def field_curvature(self):
+        return (self.tangential + self.sagittal) / 2
+
+    def plot(self, metric: str = "rms_radius", ax=None, **kwargs):
+        import matplotlib.pyplot as plt
+
+        if ax is None:
+            fig, ax = plt.subplots(1, 1)
+        fx, fy = self.fields
+        return ax.imshow(
+            getattr(self, metric),
+            origin="lower",
+            extent=(fx.min(), fx.max(), fy.min(), fy.max()),
+            **kwargs,
+        )
+
+
+def pupil_grid(samples: int):
+    """(2, P) points of a square grid of ``samples`` across the unit disk."""
+    u = np.linspace(-1, 1, samples)
+    px, py = np.meshgrid(u, u)
+    inside = px**2 + py**2 <= 1
+    return np.array([px[inside], py[inside]])
+
+
+def __field_rays(fields, offsets, pupil, pupil_radius, angles):
+    """(6, F, P) ray vectors of every field and pupil point.
+
+    For angle fields the pupil spans start positions around ``offsets``, for
+    height fields it spans direction tangents.
+    """
+    points = offsets[:, :, None] + pupil_radius * pupil[:, None, :]
+    fields = np.broadcast_to(fields[:, :, None], points.shape)
+    position, tangent = (points, fields) if angles else (fields, points)
+    ones = np.ones(points.shape[1:])
+    return np.array([*position, 0 * ones, *tangent, ones])
+
+
+def __aim(plan, fields, stop, wavelength, angles, scale, iterations=3):
+    """Start offsets of the chief rays of ``fields`` through the stop center."""
+    offsets = np.zeros_like(fields)
+    step = 1e-4 * scale
+    probes = np.array([[0, 0], [step, 0], [0, step]]).T
+    for _ in range(iterations):
+        vector = __field_rays(fields, offsets, probes, 1, angles)
+        bundle = plan.trace(Ray(*vector.reshape(6, -1), wavelength), history=True)
+        hits = bundle.history[stop, :2].reshape(2, -1, 3)
+        jacobian = (hits[:, :, 1:] - hits[:, :, :1]).transpose(1, 0, 2) / step
+        correction = np.linalg.solve(jacobian, hits[:, :, 0].T[:, :, None])[:, :, 0]
+        offsets -= np.nan_to_num(correction.T)
+    return offsets
+
+
+def field_map(
+    system,
+    fields_x,
+    fields_y,
+    pupil_radius: float = 1,
+    pupil_samples: int = 16,
+    angles: bool = True,
+    aim: bool = True,
+) -> FieldMap:
+    """Trace a grid of fields once and reduce per-field metrics.
+
+    Fields are angles in degrees of collimated beams filling a disk of
+    ``pupil_radius`` on the start surface, or, with ``angles`` False, object
+    heights emitting into a cone of direction tangents up to ``pupil_radius``.
+    With ``aim``, chief rays are aimed at the center of ``system.stop``. All
+    fields x pupil samples x wavelengths go through a single bundle trace.
+    """
+    plan = system.compile()
+    fx, fy = np.meshgrid(fields_x, fields_y)
+    grid_shape = fx.shape
+    fields = np.array([fx.ravel(), fy.ravel()], dtype=float)
+    if angles:
+        fields = np.tan(np.radians(fields))
+    reference = system.wavelengths[system.reference_wavelength]
+    # two near-axis fields give the paraxial mapping used for distortion
+    epsilon = 1e-6 if angles else 1e-6 * max(np.abs(fields).max(), 1)
+    probes = np.c_[fields, [[epsilon, 0], [0, epsilon]]]
+    offsets = (
+        __aim(plan, probes, system.stop, reference, angles, pupil_radius)
+        if aim
+        else np.zeros_like(probes)
+    )
+
+    pupil = np.c_[[0, 0], pupil_grid(pupil_samples)]
+    wavelengths = np.asarray(system.wavelengths, dtype=float)
+    weights = np.asarray(system.wavelengths_weights, dtype=float)
+    vector = __field_rays(probes, offsets, pupil, pupil_radius, angles)
+    n_fields, n_pupil, n_wavelengths = probes.shape[1], pupil.shape[1], len(wavelengths)
+    vector = np.broadcast_to(
+        vector[:, :, None, :], (6, n_fields, n_wavelengths, n_pupil)
+    ).reshape(6, -1)
+    wavelength = np.broadcast_to(
+        wavelengths[None, :, None], (n_fields, n_wavelengths, n_pupil)
+    ).ravel()
+    bundle = plan.trace(Ray(*vector, wavelength))
+
+    shape = (n_fields, n_wavelengths, n_pupil)
+    x, y, _, l, m, n = (c.reshape(shape) for c in bundle.ray.vector)
+    valid = bundle.valid.reshape(shape)
+    chief = np.array([x, y])[:, :, system.reference_wavelength, 0]
+    paraxial = chief[:, -2:] / epsilon
+    ideal = paraxial @ fields
+    chief, fields_used = chief[:, :-2], probes[:, :-2]
+    height = np.hypot(*chief)
+    ideal_height = np.hypot(*ideal)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        distortion = np.where(
+            ideal_height > 0, 100 * (height - ideal_height) / ideal_height, 0
+        )
+
+    # marginal samples only, weighted by wavelength, invalid rays weigh 0
+    w = np.where(valid, weights[None, :, None], 0)[:-2, :, 1:]
+    total = w.sum(axis=(1, 2))
+    x, y, l, m, n = (np.where(valid, c, 0)[:-2, :, 1:] for c in (x, y, l, m, n))
+
+    def mean(values):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.einsum("fwp,fwp->f", w, values) / total
+
+    centroid = np.array([mean(x), mean(y)])
+    dx, dy = x - centroid[0, :, None, None], y - centroid[1, :, None, None]
+    rms_radius = np.sqrt(mean(dx**2 + dy**2))
+
+    # tangential axis along the field direction, sagittal across it
+    azimuth = np.arctan2(fields_used[1], fields_used[0])
+    azimuth = np.where(np.hypot(*fields_used) > 0, azimuth, np.pi / 2)
+    cos, sin = (f(azimuth)[:, None, None] for f in (np.cos, np.sin))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope_x, slope_y = np.nan_to_num(l / n), np.nan_to_num(m / n)
+
+    def focus(position, slope):
+        position = position - mean(position)[:, None, None]
+        slope = slope - mean(slope)[:, None, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return -mean(position * slope) / mean(slope**2)
+
+    tangential = focus(dx * cos + dy * sin, slope_x * cos + slope_y * sin)
+    sagittal = focus(-dx * sin + dy * cos, -slope_x * sin + slope_y * cos)
+
+    def grid(values):
+        return np.asarray(values).reshape(*np.shape(values)[:-1], *grid_shape)
+
+    return FieldMap(
+        fields=np.array([fx, fy]),
+        chief=grid(chief),
+        centroid=grid(centroid),
+        rms_radius=grid(rms_radius),
+        distortion=grid(distortion),
+        tangential=grid(tangential),
+        sagittal=grid(sagittal),
+        transmitted=grid(valid[:-2].mean(axis=(1, 2))),
+    )
+
+
+@dataclass
+class ClearApertures:
+    """Semi-diameters sized by a bundle of extreme rays.
+
+    ``semi_diameter`` is the largest local ray height on every surface over
+    the rays still unvignetted there and ``transmitted`` the fraction of the
+    rays of every field reaching the last surface.
+    """
+
+    semi_diameter: np.ndarray
+    transmitted: np.ndarray
+
+
+def __traced_heights(plan, ray, key, valid):
+    """(S, N) local ray heights and validity from surface ``key`` onwards."""
+    masks = []
+    stats = TraceStats(callbacks=[lambda stats, suri, ok: masks.append(ok.copy())])
+    bundle = plan.trace(ray, key=key, history=True, stats=stats)
+    local = np.einsum("sij,sjn->sin", plan.rotation[key:], bundle.history[:, :3])
+    return bundle.history, np.hypot(local[:, 0], local[:, 1]), np.array(masks) & valid
+
+
+def __restart_rays(plan, key, history):
+    """Rays starting on surface ``key`` along the traced rays of ``history``.
+
+    ``TracePlan.trace`` puts starting rays on the sag evaluated before the
+    decenter and tilt of the surface, so the rays are moved along their
+    direction to that point; the tilted surface is then intersected again
+    on the traced line.
+    """
+    position = (plan.rotation[key].T @ plan.unrotation[key].T) @ history[:3]
+    position -= plan.decenter[key][:, None]
+    cosine = (plan.rotation[key].T @ plan.unrotation[key].T) @ history[3:]
+    param, _, _, converged = find_intersection_bundle(
+        position, cosine, plan.kernels[key], plan.params[key]
+    )
+    position += np.where(converged, param, 0) * cosine
+    return np.concatenate([position, cosine])
+
+
+def clear_apertures(
+    system,
+    fields=0,
+    pupil_radius: float = 1,
+    rim_samples: int = 8,
+    angles: bool = True,
+    aim: bool = True,
+    margin: float = 0,
+    store: bool = True,
+) -> ClearApertures:
+    """Size the semi-diameter of every surface from marginal and chief rays.
+
+    ``fields`` are y fields or a (2, F) array of (x, y) fields, as angles in
+    degrees or object heights following ``field_map``. The chief ray and
+    ``rim_samples`` rays around the rim of the pupil of every field and
+    wavelength go through a single bundle trace. Rays stopped by surface
+    apertures only size the surfaces before them. With ``store``, the
+    semi-diameters plus ``margin`` are written to the ``semi_diameter`` args
+    used by ``System.plot``.
+
+    Bundles are cached on the system: when only surfaces after the stop
+    changed since the last call with the same settings, the cached rays are
+    traced again from the last unchanged surface only.
+    """
+    fields = np.asarray(fields, dtype=float)
+    if fields.ndim < 2:
+        fields = np.array([np.zeros(fields.size), fields.ravel()])
+    wavelengths = np.asarray(system.wavelengths, dtype=float)
+    settings = (
+        fields.tobytes(),
+        pupil_radius,
+        rim_samples,
+        angles,
+        aim,
+        wavelengths.tobytes(),
+        system.stop,
+        system.reference_wavelength,
+        len(system.surfaces),
+    )
+    signature = [s.signature() for s in system.surfaces]
+    cache = system.__dict__.get("_clear_aperture_cache")
+    changed = 0
+    if cache is not None and cache["settings"] == settings:
+        changed = next(
+            (
+                i
+                for i, (a, b) in enumerate(zip(signature, cache["signature"]))
+                if a != b
+            ),
+            len(signature),
+        )
+    plan = system.compile()
+    n_fields, n_wavelengths = fields.shape[1], len(wavelengths)
+
+    if changed > max(system.stop, 1):
+        # surfaces before ``changed`` see the same rays, restart from there
+        key = changed - 1
+        history, heights, valid = (c.copy() for c in cache["trace"])
+        if changed < len(signature):
+            start = __restart_rays(plan, key, history[key])
+            history[key:], heights[key:], valid[key:] = __traced_heights(
+                plan, Ray(*start, cache["wavelength"]), key, valid[key]
+            )
+    else:
+        tangents = np.tan(np.radians(fields)) if angles else fields
+        offsets = (
+            __aim(
+                plan,
+                tangents,
+                system.stop,
+                wavelengths[system.reference_wavelength],
+                angles,
+                pupil_radius,
+            )
+            if aim
+            else np.zeros_like(tangents)
+        )
+        phi = 2 * np.pi * np.arange(rim_samples) / rim_samples
+        pupil = np.c_[[0, 0], [np.cos(phi), np.sin(phi)]]
+        vector = __field_rays(tangents, offsets, pupil, pupil_radius, angles)
+        vector = np.broadcast_to(
+            vector[:, :, None, :], (6, n_fields, n_wavelengths, pupil.shape[1])
+        ).reshape(6, -1)
+        wavelength = np.broadcast_to(
+            wavelengths[None, :, None], (n_fields, n_wavelengths, pupil.shape[1])
+        ).ravel()
+        history, heights, valid = __traced_heights(
+            plan, Ray(*vector, wavelength), 0, True
+        )
+        cache = {"wavelength": wavelength}
+    cache.update(
+        settings=settings,
+        signature=signature,
+        trace=(history, heights, valid),
+    )
+    system.__dict__["_clear_aperture_cache"] = cache
+
+    semi_diameter = np.where(valid, heights, 0).max(axis=1)
+    if store:
+        for surface, radius in zip(system.surfaces, semi_diameter):
+            surface.args["semi_diameter"] = float(radius + margin)
+    return ClearApertures(
+        semi_diameter=semi_diameter,
+        transmitted=valid[-1].reshape(n_fields, -1).mean(axis=1),
+    )
@@ -0,0 +1,240 @@
+"""Timing suite for the hot paths of crayons.
+
+Run with ``python -m crayons.benchmark --output bench.json`` and pass
+``--baseline`` a previous output to flag regressions. Every fixture is built
+in memory, no file or network access is needed besides the output.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+from .system import System, Surface
+from .propagation import Ray
+from .materials import Material
+from .surfaces import surfaces_catalog
+from .file_import import parse_seq
+from .parameters import ParameterBinding
+from .util import parse_xml
+
+cooke_seq = """! Cooke triplet, f = 50 mm
+LEN "Cooke"
+WL 486.1 587.6 656.3
+S 22.01359 3.25896 6204.6030
+S -435.76044 6.00755
+S -22.21328 0.99997 6200.3640; STO
+S 20.29192 4.75041
+S 79.68360 2.95208 6204.6030
+S -18.39533 42.20778
+"""
+
+sizes = (10**3, 10**5, 10**6)
+
+
+def singlet():
+    s = System()
+    s.insert(
+        Surface(
+            type="asp",
+            args={"c": -0.25, "k": -0.5, "coef": [1e-2, 1e-3]},
+            thickness=1.5,
+            material=Material(n=1.5, vd=50),
+        ),
+        2,
+    )
+    s[1].thickness = 1.5
+    s[1].args.update({"c": 0.25})
+    s[1].material = Material(n=1.5, vd=50)
+    s[0].thickness = 1.5
+    return s
+
+
+def cooke_triplet():
+    return parse_seq(cooke_seq)
+
+
+def aspheric_zoom(n_surfaces: int = 30):
+    """Stack of weak aspheric lenses, a stand-in for a long zoom design."""
+    s = System()
+    s[0].thickness = 1
+    s[1].thickness = 1
+    glass = Material(n=1.6, vd=40)
+    for i in range(n_surfaces):
+        front = i % 2 == 0
+        s.insert(
+            Surface(
+                type="asp",
+                args={
+                    "c": 0.02 if front else -0.02,
+                    "k": -0.5,
+                    "coef": [1e-6, -1e-9],
+                },
+                thickness=2 if front else 3,
+                material=glass if front else Material(name="air"),
+            ),
+            len(s) - 1,
+        )
+    return s
+
+
+def bundle(n_rays: int, radius: float = 0.5, seed: int = 0):
+    """Collimated bundle of ``n_rays`` rays uniformly filling a disk."""
+    rng = np.random.default_rng(seed)
+    r = radius * np.sqrt(rng.random(n_rays))
+    theta = 2 * np.pi * rng.random(n_rays)
+    return Ray(r * np.cos(theta), r * np.sin(theta), 0, 0, 0.01, 1)
+
+
+def synthetic_catalog(filename, n_glasses: int = 200):
+    """Write a glass catalog in the layout read by ``parse_xml``."""
+    rng = np.random.default_rng(0)
+    glasses = "".join(
+        f"<Glass><GlassName>G{i}</GlassName><DispersionCoefficients>"
+        + "".join(
+            f"<Coefficient>{b}</Coefficient><Coefficient>{c}</Coefficient>"
+            for b, c in zip(rng.uniform(0.1, 1.5, 3), rng.uniform(1e-3, 100, 3))
+        )
+        + "</DispersionCoefficients></Glass>"
+        for i in range(n_glasses)
+    )
+    Path(filename).write_text(f"<Catalog><Info/><Glasses>{glasses}</Glasses></Catalog>")
+
+
+def timeit(func, repeat: int = 3):
+    """Best wall time of ``repeat`` calls of ``func``."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes=sizes, repeat: int = 3):
+    """Time every benchmark, ``rays_per_second`` being given for tracing."""
+    results = {}
+
+    def record(name, func, n_rays=None):
+        seconds = timeit(func, repeat)
+        results[name] = {"seconds": seconds}
+        if n_rays:
+            results[name]["rays_per_second"] = n_rays / seconds
+
+    systems = {
+        "singlet": singlet(),
+        "cooke": cooke_triplet(),
+        "zoom30": aspheric_zoom(),
+    }
+    for name, system in systems.items():
+        plan = system.compile()
+        for n_rays in sizes:
+            rays = bundle(n_rays)
+            record(f"trace/{name}/{n_rays}", lambda: plan.trace(rays), n_rays)
+
+    binding = ParameterBinding(systems["zoom30"], [(i, "c") for i in range(2, 32)])
+    values, rays = binding.values, bundle(100)
+
+    def recompile():
+        for surface, value in zip(systems["zoom30"].surfaces[2:32], values):
+            surface.args["c"] = value
+        systems["zoom30"].trace(rays)
+
+    def rebind():
+        binding.values = values
+        binding.plan.trace(rays)
+
+    record("update/zoom30/compile", recompile, 100)
+    record("update/zoom30/binding", rebind, 100)
+
+    s, ray = systems["singlet"], Ray(0.1, 0.2, 0, 0, 0.01, 1)
+    record("propagate/singlet/100", lambda: [s.propagate(ray) for _ in range(100)], 100)
+
+    sag = surfaces_catalog["asp"]["sag_and_gradient"]
+    params = surfaces_catalog["asp"]["pack"]({"c": 0.1, "k": -1, "coef": [1e-3] * 6})
+    for n_rays in sizes:
+        x, y = bundle(n_rays).position[:2]
+        record(f"sag/asp/{n_rays}", lambda: sag(x, y, params), n_rays)
+
+    with tempfile.TemporaryDirectory() as directory:
+        catalog = Path(directory) / "SYNTHETIC.xml"
+        synthetic_catalog(catalog)
+        record("catalog/parse_xml", lambda: parse_xml(catalog))
+
+    record("import/seq/cooke", lambda: parse_seq(cooke_seq))
+
+    import matplotlib.pyplot as plt
+
+    rays = bundle(10**4)
+
+    def layout():
+        fig, ax = plt.subplots()
+        systems["cooke"].plot_rays(rays, ax=ax, max_rays=10**4)
+        fig.canvas.draw()
+        plt.close(fig)
+
+    record("plot/cooke/10000", layout, 10**4)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.2):
+    """Benchmarks slower than ``baseline`` by more than ``tolerance``.
+
+    Returns ``(name, baseline_seconds, current_seconds)`` tuples, benchmarks
+    missing from either side being ignored.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        reference = baseline["results"][name]["seconds"]
+        if result["seconds"] > reference * (1 + tolerance):
+            regressions.append((name, reference, result["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="JSON file receiving the timings")
+    parser.add_argument("--baseline", help="JSON output of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sizes", type=int, nargs="+", default=sizes)
+    args = parser.parse_args(argv)
+
+    current = run(args.sizes, args.repeat)
+    for name, result in current["results"].items():
+        rate = result.get("rays_per_second")
+        print(
+            f"{name:<28} {result['seconds'] * 1e3:10.3f} ms"
+            + (f" {rate:14,.0f} rays/s" if rate else "")
+        )
+    if args.output:
+        Path(args.output).write_text(json.dumps(current, indent=2))
+    if args.baseline:
+        regressions = compare(
+            current, json.loads(Path(args.baseline).read_text()), args.tolerance
+        )
+        for name, reference, seconds in regressions:
+            print(
+                f"REGRESSION {name}: {reference * 1e3:.3f} ms -> {seconds * 1e3:.3f} ms"
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
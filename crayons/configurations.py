@@ -0,0 +1,105 @@
+"""Multi-configuration systems, e.g. the zoom positions of a zoom lens.
+
+A ``MultiConfiguration`` stores the surfaces once in a shared ``System`` and
+only the values that change in every configuration. Compiled, it gives a
+single ``TracePlan`` with a configuration axis, so all the configurations
+are traced in one bundle, every ray carrying its configuration index.
+"""
+
+import copy
+from dataclasses import dataclass, field
+import numpy as np
+
+from .parameters import global_angles, packed_index
+from .propagation import Ray
+from .trace import TracePlan
+
+
+@dataclass
+class MultiConfiguration:
+    """Shared ``system`` and one dict of overrides per configuration.
+
+    Overrides map ``(surface, name)`` or ``(surface, name, item)`` keys, as
+    in ``ParameterBinding``, to their value in that configuration.
+    """
+
+    system: object
+    overrides: list[dict] = field(default_factory=lambda: [{}])
+
+    def __len__(self):
+        return len(self.overrides)
+
+    def configuration(self, index: int):
+        """Copy of the system in configuration ``index``."""
+        system = copy.deepcopy(self.system)
+        for (surface, name, *item), value in self.overrides[index].items():
+            args = system.surfaces[surface].args
+            if name == "thickness":
+                system.surfaces[surface].thickness = value
+            elif not item:
+                args[name] = value
+            else:
+                args[name] = np.array(args[name], dtype=float)
+                args[name][item[0]] = value
+        return system
+
+    def compile(self) -> TracePlan:
+        """Trace plan with a leading configuration axis on its arrays."""
+        plan = TracePlan.from_system(self.system)
+        n = len(self)
+        rotation = np.array(
+            [s.args["rotation"] for s in self.system.surfaces], dtype=float
+        )
+        thickness = np.repeat(plan.thickness[None], n, axis=0)
+        decenter = np.repeat(plan.decenter[None], n, axis=0)
+        rotation = np.repeat(rotation[None], n, axis=0)
+        params = {}
+        for index, overrides in enumerate(self.overrides):
+            for (surface, name, *item), value in overrides.items():
+                if name == "thickness":
+                    thickness[index, surface] = value
+                elif name in ("decenter", "rotation"):
+                    array = decenter if name == "decenter" else rotation
+                    array[index, surface, item[0] if item else slice(None)] = value
+                else:
+                    if surface not in params:
+                        packed = plan.params[surface]
+                        assert (
+                            np.ndim(packed) == 1
+                        ), f"Surface {surface} parameters are not a packed array"
+                        params[surface] = np.repeat(packed[None], n, 0)
+                    position = packed_index(self.system.surfaces[surface], name, *item)
+                    params[surface][index, position] = value
+        for surface, values in params.items():
+            plan.params[surface] = values
+        positionning = [s.positionning for s in self.system.surfaces]
+        plan.thickness, plan.decenter = thickness, decenter
+        plan.angles = np.array([global_angles(r, positionning) for r in rotation])
+        plan.update_rotations()
+        return plan
+
+    def trace(self, ray: Ray, key: int = 0, plan: TracePlan = None, **kwargs):
+        """Trace ``ray`` in every configuration as one bundle.
+
+        Returns the ``BundleTrace`` of the N rays repeated for each
+        configuration, configuration-major, and the configuration index of
+        every ray. A compiled ``plan`` can be reused across calls.
+        """
+        if plan is None:
+            plan = self.compile()
+        vector = np.array(np.broadcast_arrays(*ray.vector), dtype=float)
+        vector = vector.reshape(6, -1)
+        n_rays = vector.shape[1]
+        wavelength = (
+            None
+            if ray.wavelength is None
+            else np.tile(np.broadcast_to(ray.wavelength, (n_rays,)), len(self))
+        )
+        configuration = np.repeat(np.arange(len(self)), n_rays)
+        bundle = plan.trace(
+            Ray(*np.tile(vector, len(self)), wavelength),
+            key=key,
+            configuration=configuration,
+            **kwargs,
+        )
+        return bundle, configuration
@@ -1,214 +1,419 @@
 from .system import System, Surface, Material
+from .materials import glass_catalog
+from contextlib import suppress
+from dataclasses import dataclass, field
+from hashlib import sha256
 from pathlib import Path
-import pyparsing as pp
 from re import match
+import os
+import pickle
 import numpy as np
 
-__accepted_extensions = [".seq"]
+__accepted_extensions = [".seq", ".zmx"]
+__cache_version = b"1"
 
-codev_parser = pp.ZeroOrMore(
-    pp.Word(pp.alphanums) + pp.Group(pp.ZeroOrMore(pp.Word(pp.printables)))
-)
+
+@dataclass
+class SurfaceRecord:
+    """Plain surface data accumulated while reading a lens file."""
+
+    type: str = "sph"
+    comment: str = ""
+    args: dict = field(default_factory=lambda: {"c": 0})
+    thickness: float = 0
+    material: Material = field(default=None)
+    positionning: str = "loc"
+    decenter: list = field(default=None)
+    rotation: list = field(default=None)
+
+    def build(self):
+        args = dict(self.args)
+        if self.decenter is not None:
+            args["decenter"] = np.array(self.decenter)
+        if self.rotation is not None:
+            args["rotation"] = np.array(self.rotation)
+        return Surface(
+            type=self.type,
+            comment=self.comment,
+            args=args,
+            thickness=self.thickness,
+            material=self.material if self.material else Material(name="air"),
+            positionning=self.positionning,
+        )
+
+
+@dataclass
+class SystemBuilder:
+    """Single-pass accumulator of lens file commands.
+
+    Surfaces and their modifiers are collected as ``SurfaceRecord`` and the
+    ``System`` is constructed once by ``build``, instead of being edited (and
+    its surface list rebuilt) on every command.
+    """
+
+    records: list = field(
+        default_factory=lambda: [
+            SurfaceRecord(comment="Object"),
+            SurfaceRecord(comment="Stop"),
+            SurfaceRecord(comment="Image"),
+        ]
+    )
+    wavelengths: list = field(default=None)
+    wavelengths_weights: list = field(default=None)
+    stop: int = 1
+    surface_pointer: int = 0
+    rdm: bool = True
+    state: dict = field(default_factory=dict)  # format specific parser state
+
+    @property
+    def current(self):
+        return self.records[self.surface_pointer]
+
+    def insert(self, record):
+        self.surface_pointer += 1
+        self.records.insert(self.surface_pointer, record)
+
+    def set_decenter(self, axis, value):
+        if self.current.decenter is None:
+            self.current.decenter = [0.0, 0.0, 0.0]
+        self.current.decenter[axis] = value
+
+    def set_rotation(self, axis, value):
+        if self.current.rotation is None:
+            self.current.rotation = [0.0, 0.0, 0.0]
+        self.current.rotation[axis] = value
+
+    def build(self):
+        system = System(
+            stop=self.stop, surfaces=[record.build() for record in self.records]
+        )
+        if self.wavelengths is not None:
+            system.wavelengths = self.wavelengths
+        if self.wavelengths_weights is not None:
+            system.wavelengths_weights = self.wavelengths_weights
+        return system
+
+
+def tokenize(text):
+    """Yield the command and argument tokens of every CODE V statement."""
+    for line in text.replace(";", "\n").splitlines():
+        tokens = line.split("!", 1)[0].split()
+        if tokens and tokens[0].isalnum():
+            yield tokens[0].upper(), tokens[1:]
+
+
+def read_seq(text):
+    builder = SystemBuilder()
+    for command, args in tokenize(text):
+        if command in codev_commands:
+            codev_commands[command](builder, args)
+    return builder
+
+
+def parse_seq(text):
+    return read_seq(text).build()
+
+
+def decode(data):
+    """Text of a lens file, Zemax files being often UTF-16 encoded."""
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16")
+    return data.decode("utf-8-sig", errors="replace")
+
+
+def read_file(filename, text=None):
+    """``SystemBuilder`` of a lens file, read from disk unless ``text`` is given."""
+    suffix = Path(filename).suffix.lower()
+    assert suffix in __accepted_extensions, f"File extension not supported: {suffix}"
+    if text is None:
+        with open(Path(filename), "rb") as f:
+            text = decode(f.read())
+    return file_readers[suffix](text)
 
 
 def file_import(filename):
-    assert (
-        Path(filename).suffix in __accepted_extensions
-    ), f"File extension not supported: {Path(filename).suffix}"
-    # init system
-
-    with open(Path(filename)) as f:
-        raw_file = f.read()
-    raw_file = raw_file.replace(";", "\n")
-    system = System()
-    locals = {"RDM": True, "surface_pointer": 0}
-    for line in raw_file.split("\n"):
-        command_line = codev_parser.parse_string(line)
-        if len(command_line) > 0:
-            if command_line[0].upper() in codev_commands.keys():
-                codev_commands[command_line[0].upper()](
-                    locals, system, command_line[1].asList()
+    return read_file(filename).build()
+
+
+@dataclass
+class ImportResult:
+    filename: str
+    system: System = field(default=None)
+    error: Exception = field(default=None)
+    cached: bool = False
+
+
+def __read_text(filename, text):
+    try:
+        return read_file(filename, text), None
+    except Exception as error:
+        return None, error
+
+
+def bulk_import(filenames, processes=None, cache_dir=None):
+    """Import many lens files, one ``ImportResult`` per file.
+
+    Files are parsed across a pool of ``processes`` worker processes (in
+    process when ``processes=1``). With a ``cache_dir``, the parsed surface
+    records, glasses included, are pickled under the SHA-256 of the file
+    content so unchanged files are only rebuilt. Errors are stored in the
+    result of the failing file instead of aborting the batch.
+    """
+    results = [ImportResult(str(filename)) for filename in filenames]
+    pending = []
+    for result in results:
+        path = Path(result.filename)
+        try:
+            assert (
+                path.suffix.lower() in __accepted_extensions
+            ), f"File extension not supported: {path.suffix}"
+            data = path.read_bytes()
+        except (AssertionError, OSError) as error:
+            result.error = error
+            continue
+        cached = None
+        if cache_dir is not None:
+            digest = sha256(__cache_version + path.suffix.lower().encode() + data)
+            cached = Path(cache_dir) / f"{digest.hexdigest()}.pkl"
+            if cached.exists():
+                try:
+                    result.system = pickle.loads(cached.read_bytes()).build()
+                    result.cached = True
+                    continue
+                except Exception:
+                    pass
+        pending.append((result, decode(data), cached))
+
+    names = [result.filename for result, _, _ in pending]
+    texts = [text for _, text, _ in pending]
+    if processes == 1 or len(pending) <= 1:
+        outputs = list(map(__read_text, names, texts))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        workers = processes or os.cpu_count()
+        with ProcessPoolExecutor(workers) as executor:
+            outputs = list(
+                executor.map(
+                    __read_text,
+                    names,
+                    texts,
+                    chunksize=max(1, len(pending) // (4 * workers)),
                 )
-    return system
+            )
+
+    for (result, _, cached), (builder, error) in zip(pending, outputs):
+        try:
+            if error is not None:
+                raise error
+            result.system = builder.build()
+        except Exception as error:
+            result.error = error
+            continue
+        if cached is not None:
+            # the cache is optional, a failed write only loses the speedup
+            temporary = cached.with_suffix(f".{os.getpid()}.tmp")
+            try:
+                cached.parent.mkdir(parents=True, exist_ok=True)
+                temporary.write_bytes(pickle.dumps(builder))
+                os.replace(temporary, cached)
+            except OSError:
+                with suppress(OSError):
+                    temporary.unlink(missing_ok=True)
+    return results
+
+
+def __len(builder, args):
+    builder.records = [SurfaceRecord(comment="Object"), SurfaceRecord(comment="Image")]
+    builder.stop = 1
+    builder.wavelengths = []
+
+
+def __s(builder, args):
+    radius = float(args[0]) if len(args) > 0 else 0
+    builder.insert(
+        SurfaceRecord(
+            thickness=float(args[1]) if len(args) > 1 else 0,
+            args={"c": 0 if radius == 0 else 1 / radius if builder.rdm else radius},
+            material=parse_codev_material(args[2]) if len(args) > 2 else None,
+        )
+    )
+
+
+def __sto(builder, args):
+    builder.stop = (
+        int(args[0]) if args and args[0].isdigit() else builder.surface_pointer
+    )
+
+
+def __rdm(builder, args):
+    builder.rdm = len(args) == 0 or args[0].upper() in ("Y", "YES")
+
+
+def __glb(builder, args):
+    builder.current.positionning = int(args[0][1:])
+
+
+def __cir(builder, args):
+    if "EDG" in [x.upper() for x in args]:
+        return
+    apertures = builder.current.args.setdefault("aperture", [])
+    aperture = {"type": "circular", "cir": float(args[-1])}
+    if apertures:
+        apertures[0] = aperture
+    else:
+        apertures.append(aperture)
 
 
 codev_commands = {
-    "LEN": lambda locals, system, args: (
-        system.__init__(),
-        system.pop(1),
-        setattr(system, "wavelengths", list()),
-    ),
-    "WL": lambda locals, system, args: (
-        setattr(system, "wavelengths", [float(x) for x in args])
-    ),
-    "S": lambda locals, system, args: (
-        locals.update({"surface_pointer": locals["surface_pointer"] + 1}),
-        system.insert(
-            Surface(
-                type="sph",
-                thickness=float(args[1]) if len(args) > 1 else 0,
-                args={
-                    "c": 0
-                    if float(args[0]) == 0
-                    else 1 / float(args[0])
-                    if locals["RDM"]
-                    else float(args[0])
-                    if len(args) > 0
-                    else 0
-                },
-                material=parse_codev_material(args[2])
-                if len(args) > 2
-                else Material(name="air"),
-            ),
-            locals["surface_pointer"],
-        ),
-    ),
-    "YDE": lambda locals, system, args: (
-        system.surfaces[locals["surface_pointer"]].args.update(
-            {
-                "decenter": np.array(
-                    [
-                        system.surfaces[locals["surface_pointer"]].args["decenter"][0]
-                        if "decenter"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                        float(args[0]),
-                        system.surfaces[locals["surface_pointer"]].args["decenter"][2]
-                        if "decenter"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                    ]
-                ),
-            },
-        ),
-    ),
-    "XDE": lambda locals, system, args: (
-        system.surfaces[locals["surface_pointer"]].args.update(
-            {
-                "decenter": np.array(
-                    [
-                        float(args[0]),
-                        system.surfaces[locals["surface_pointer"]].args["decenter"][1]
-                        if "decenter"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                        system.surfaces[locals["surface_pointer"]].args["decenter"][2]
-                        if "decenter"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                    ]
-                ),
-            },
-        ),
-    ),
-    "ZDE": lambda locals, system, args: (
-        system.surfaces[locals["surface_pointer"]].args.update(
-            {
-                "decenter": np.array(
-                    [
-                        system.surfaces[locals["surface_pointer"]].args["decenter"][0]
-                        if "decenter"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                        system.surfaces[locals["surface_pointer"]].args["decenter"][1]
-                        if "decenter"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                        float(args[0]),
-                    ]
-                ),
-            },
-        ),
-    ),
-    "BDE": lambda locals, system, args: (
-        system.surfaces[locals["surface_pointer"]].args.update(
-            {
-                "rotation": np.array(
-                    [
-                        system.surfaces[locals["surface_pointer"]].args["rotation"][0]
-                        if "rotation"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                        float(args[0]),
-                        system.surfaces[locals["surface_pointer"]].args["rotation"][2]
-                        if "rotation"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                    ]
-                ),
-            },
-        ),
+    "LEN": __len,
+    "WL": lambda builder, args: setattr(
+        builder, "wavelengths", [float(x) for x in args]
     ),
-    "ADE": lambda locals, system, args: (
-        system.surfaces[locals["surface_pointer"]].args.update(
-            {
-                "rotation": np.array(
-                    [
-                        float(args[0]),
-                        system.surfaces[locals["surface_pointer"]].args["rotation"][1]
-                        if "rotation"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                        system.surfaces[locals["surface_pointer"]].args["rotation"][2]
-                        if "rotation"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                    ]
-                ),
-            },
-        ),
-    ),
-    "CDE": lambda locals, system, args: (
-        system.surfaces[locals["surface_pointer"]].args.update(
-            {
-                "rotation": np.array(
-                    [
-                        system.surfaces[locals["surface_pointer"]].args["rotation"][0]
-                        if "rotation"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                        system.surfaces[locals["surface_pointer"]].args["rotation"][1]
-                        if "rotation"
-                        in system.surfaces[locals["surface_pointer"]].args.keys()
-                        else 0,
-                        float(args[0]),
-                    ]
-                ),
-            },
-        ),
-    ),
-    "STO": lambda locals, system, args: (
-        setattr(system, "stop", args[0] if len(args) > 0 else locals["surface_pointer"])
+    "S": __s,
+    "XDE": lambda builder, args: builder.set_decenter(0, float(args[0])),
+    "YDE": lambda builder, args: builder.set_decenter(1, float(args[0])),
+    "ZDE": lambda builder, args: builder.set_decenter(2, float(args[0])),
+    "ADE": lambda builder, args: builder.set_rotation(0, float(args[0])),
+    "BDE": lambda builder, args: builder.set_rotation(1, float(args[0])),
+    "CDE": lambda builder, args: builder.set_rotation(2, float(args[0])),
+    "STO": __sto,
+    "RDM": __rdm,
+    "GLB": __glb,
+    "CIR": __cir,
+}
+
+
+def read_zmx(text):
+    builder = SystemBuilder(records=[], stop=0, surface_pointer=-1)
+    builder.state.update({"catalogs": [], "wavelengths": {}, "types": []})
+    for line in text.splitlines():
+        tokens = line.split()
+        if tokens and tokens[0].upper() in zmx_commands:
+            zmx_commands[tokens[0].upper()](builder, tokens[1:])
+    assert builder.records, "No surface found"
+    builder.records[0].comment = builder.records[0].comment or "Object"
+    builder.records[-1].comment = builder.records[-1].comment or "Image"
+    for i, type in enumerate(builder.state["types"]):
+        if type == "COORDBRK" and i > 0:
+            builder.records[i].material = builder.records[i - 1].material
+    wavelengths = builder.state["wavelengths"]
+    if wavelengths:
+        builder.wavelengths = [wavelengths[i][0] for i in sorted(wavelengths)]
+        builder.wavelengths_weights = [wavelengths[i][1] for i in sorted(wavelengths)]
+    return builder
+
+
+def __zmx_surf(builder, args):
+    builder.insert(SurfaceRecord())
+    builder.state["types"].append("STANDARD")
+
+
+def __zmx_type(builder, args):
+    type = args[0].upper()
+    assert type in ("STANDARD", "EVENASPH", "COORDBRK"), f"Surface {type} not supported"
+    builder.state["types"][-1] = type
+    if type == "EVENASPH":
+        builder.current.type = "asp"
+
+
+def __zmx_disz(builder, args):
+    # infinite object distances are kept at 0, as the CODE V reader does
+    thickness = float(args[0])
+    builder.current.thickness = thickness if np.isfinite(thickness) else 0
+
+
+def __zmx_coni(builder, args):
+    builder.current.type = "asp"
+    builder.current.args["k"] = float(args[0])
+
+
+def __zmx_parm(builder, args):
+    index, value = int(args[0]), float(args[1])
+    type = builder.state["types"][-1]
+    if type == "EVENASPH" and index > 0:
+        coef = builder.current.args.setdefault("coef", [])
+        coef.extend([0.0] * (index - len(coef)))
+        coef[index - 1] = value
+    elif type == "COORDBRK" and 1 <= index <= 2:
+        builder.set_decenter(index - 1, value)
+    elif type == "COORDBRK" and 3 <= index <= 5:
+        builder.set_rotation(index - 3, value)
+
+
+def __zmx_glas(builder, args):
+    builder.current.material = parse_zmx_material(args, builder.state["catalogs"])
+
+
+def __zmx_clap(builder, args):
+    builder.current.args.setdefault("aperture", []).append(
+        {"type": "circular", "cir": float(args[1])}
+    )
+
+
+def __zmx_obsc(builder, args):
+    builder.current.args.setdefault("aperture", []).append(
+        {"type": "circular", "cir": float(args[1]), "obscuration": True}
+    )
+
+
+def __zmx_wavm(builder, args):
+    builder.state["wavelengths"][int(args[0])] = (
+        float(args[1]) * 1000,
+        float(args[2]) if len(args) > 2 else 1.0,
+    )
+
+
+def __zmx_mode(builder, args):
+    assert args[0].upper() == "SEQ", f"Mode {args[0]} not supported"
+
+
+zmx_commands = {
+    "MODE": __zmx_mode,
+    "SURF": __zmx_surf,
+    "TYPE": __zmx_type,
+    "STOP": lambda builder, args: setattr(builder, "stop", builder.surface_pointer),
+    "COMM": lambda builder, args: setattr(
+        builder.current, "comment", " ".join(args).strip('"')
     ),
-    "RDM": lambda locals, system, args: (
-        locals.update(
-            {
-                "RDM": True
-                if len(args) == 0
-                else True
-                if args[0].upper in "YES"
-                else False,
-            }
-        )
+    "CURV": lambda builder, args: builder.current.args.update({"c": float(args[0])}),
+    "DISZ": __zmx_disz,
+    "CONI": __zmx_coni,
+    "PARM": __zmx_parm,
+    "GLAS": __zmx_glas,
+    "DIAM": lambda builder, args: builder.current.args.update(
+        {"semi_diameter": float(args[0])}
     ),
-    "GLB": lambda locals, system, args: (
-        setattr(
-            system.surfaces[locals["surface_pointer"]], "positionning", int(args[0][1:])
-        ),
+    "CLAP": __zmx_clap,
+    "OBSC": __zmx_obsc,
+    "GCAT": lambda builder, args: builder.state["catalogs"].extend(
+        x.upper() for x in args
     ),
-    "CIR": lambda locals, system, args: (
-        system.surfaces[locals["surface_pointer"]]
-        .args["aperture"][0]
-        .update({"type": "circular", "cir": float(args[-1])})
-        if len(system.surfaces[locals["surface_pointer"]].args["aperture"]) > 1
-        else system.surfaces[locals["surface_pointer"]]
-        .args["aperture"]
-        .append({"type": "circular", "cir": float(args[-1])})
-        if "EDG" not in [x.upper for x in args]
-        else None
+    "WAVM": __zmx_wavm,
+    "WAVL": lambda builder, args: builder.state["wavelengths"].update(
+        {i: (float(x) * 1000, 1.0) for i, x in enumerate(args, start=1)}
     ),
 }
 
+file_readers = {".seq": read_seq, ".zmx": read_zmx}
+
+
+def parse_zmx_material(args, catalogs=()):
+    """Material of a Zemax ``GLAS`` line.
+
+    Catalog glasses are looked up in the ``GCAT`` catalogs that are loaded,
+    other glasses (model glasses included) fall back to the nd and vd written
+    on the line. Lines without them are looked up in every catalog.
+    """
+    name = args[0].upper()
+    assert name != "MIRROR", "Mirrors are not supported"
+    truncated = len(args) < 5
+    for catalog in list(catalogs) + (list(glass_catalog) if truncated else []):
+        if name in glass_catalog.get(catalog, {}):
+            return Material(name=name, catalog=catalog)
+    assert not truncated, f"GLAS {' '.join(args)}: unknown glass without nd and vd"
+    return Material(n=float(args[3]), vd=float(args[4]) or None)
+
 
 def parse_codev_material(input):
     if input == "AIR":
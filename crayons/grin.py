@@ -0,0 +1,146 @@
+"""Gradient-index media traced with a batched Runge-Kutta integrator.
+
+Inside a ``GradientIndex`` medium the ray equation is integrated in the
+form of Sharma et al., d2r/dt2 = grad(n**2) / 2 with dt = ds / n, so the
+cosines scaled by the index used everywhere else in the tracer are the
+derivatives dr/dt. All the rays of a bundle advance together with a step
+shared by the batch, finished rays being dropped from the active set, and
+the optical path length n**2 dt is integrated along.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+
+from .materials import Material
+
+
+@dataclass(frozen=True, eq=True)
+class GradientIndex:
+    """Medium of index n0 + sum(radial[i] r**(2(i+1))) + sum(axial[j] z**(j+1)).
+
+    ``base`` gives the dispersive index n0 on the vertex; coordinates are
+    local to the surface the medium starts on. ``step`` is the geometric
+    integration step and, with a ``tolerance`` on the ray positions, the
+    largest step of the adaptive integration. Rays still inside the medium
+    after ``max_steps`` steps are lost.
+    """
+
+    base: Material
+    radial: tuple = ()
+    axial: tuple = ()
+    step: float = 0.1
+    tolerance: float = None
+    max_steps: int = 10000
+
+    def __repr__(self):
+        return f"GRIN {self.base!r}"
+
+    def index(self, lam):
+        return self.base.index(lam)
+
+    def delta(self, position):
+        """Index change from n0 and its gradient at (3, N) ``position``."""
+        x, y, z = position
+        radius2 = x * x + y * y
+        dn = dradial = daxial = 0
+        for i, a in reversed(list(enumerate(self.radial))):
+            dn = (dn + a) * radius2
+            dradial = dradial * radius2 + (i + 1) * a
+        axial = 0
+        for j, b in reversed(list(enumerate(self.axial))):
+            axial = (axial + b) * z
+            daxial = daxial * z + (j + 1) * b
+        gradient = np.empty_like(position)
+        gradient[0] = 2 * x * dradial
+        gradient[1] = 2 * y * dradial
+        gradient[2] = daxial
+        return dn + axial + 0 * radius2, gradient
+
+
+def __derivatives(medium, position, n0):
+    """grad(n**2) / 2 and n**2 along the rays."""
+    dn, gradient = medium.delta(position)
+    n = n0 + dn
+    return n * gradient, n * n
+
+
+def __rk4(medium, position, cosine, n0, h):
+    """One classic Runge-Kutta step of parameter ``h`` for every ray."""
+    a, n2_1 = __derivatives(medium, position, n0)
+    r2 = position + h / 2 * cosine
+    b, n2_2 = __derivatives(medium, r2, n0)
+    r3 = position + h / 2 * (cosine + h / 2 * a)
+    c, n2_3 = __derivatives(medium, r3, n0)
+    r4 = position + h * (cosine + h / 2 * b)
+    d, n2_4 = __derivatives(medium, r4, n0)
+    return (
+        position + h * (cosine + h / 6 * (a + b + c)),
+        cosine + h / 6 * (a + 2 * b + 2 * c + d),
+        h / 6 * (n2_1 + 2 * n2_2 + 2 * n2_3 + n2_4),
+    )
+
+
+def __step(medium, position, cosine, n0, h):
+    """RK4 step with a step doubling error estimate when adaptive."""
+    result = __rk4(medium, position, cosine, n0, h)
+    if medium.tolerance is None:
+        return result, 0
+    half = __rk4(medium, position, cosine, n0, h / 2)
+    second = __rk4(medium, half[0], half[1], n0, h / 2)
+    error = np.max(np.abs(result[0] - second[0]), initial=0)
+    return (second[0], second[1], half[2] + second[2]), error
+
+
+def integrate(medium: GradientIndex, position, cosine, n0, crossing):
+    """Advance rays through ``medium`` up to the next surface.
+
+    ``position`` and ``cosine`` are (3, N) arrays in the medium coordinates,
+    updated in place, and ``n0`` the base index of every ray.
+    ``crossing(position, rays)`` is negative while the points of the rays of
+    indices ``rays`` are before the next surface. The last step of every ray
+    stops just before the surface, which is then reached in a straight line.
+    Returns the optical path length of every ray and whether it got there.
+    """
+    n_rays = position.shape[1]
+    path = np.zeros(n_rays)
+    done = np.zeros(n_rays, dtype=bool)
+    scale = 1.0
+    # state of the active rays, compacted when some of them finish
+    rays = np.flatnonzero(np.isfinite(position).all(axis=0))
+    r, k, p = position[:, rays], cosine[:, rays], np.zeros(len(rays))
+    n0, h = n0[rays], medium.step / n0[rays]
+    before = crossing(r, rays)
+    for _ in range(medium.max_steps):
+        if not len(rays):
+            break
+        (r1, k1, p1), error = __step(medium, r, k, n0, scale * h)
+        if medium.tolerance and error > medium.tolerance and scale > 1e-6:
+            scale /= 2
+            continue
+        after = crossing(r1, rays)
+        crossed = after >= 0
+        if np.any(crossed):
+            # crossing rays stop short of the surface, the rest is straight
+            fraction = before[crossed] / (before[crossed] - after[crossed])
+            last = __rk4(
+                medium,
+                r[:, crossed],
+                k[:, crossed],
+                n0[crossed],
+                0.999 * fraction * scale * h[crossed],
+            )
+            inside = crossing(last[0], rays[crossed]) < 0
+            finished = rays[crossed]
+            position[:, finished] = np.where(inside, last[0], r[:, crossed])
+            cosine[:, finished] = np.where(inside, last[1], k[:, crossed])
+            path[finished] = p[crossed] + np.where(inside, last[2], 0)
+            done[finished] = True
+        going = ~crossed & np.isfinite(after)
+        if not np.all(going):
+            r1, k1, p, p1 = r1[:, going], k1[:, going], p[going], p1[going]
+            rays, n0, h, after = rays[going], n0[going], h[going], after[going]
+        r, k, p, before = r1, k1, p + p1, after
+        if medium.tolerance and error < medium.tolerance / 32:
+            scale = min(2 * scale, 1.0)
+    position[:, rays], cosine[:, rays], path[rays] = r, k, p
+    return path, done
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from collections.abc import Iterable
+from collections.abc import Iterable, MutableMapping
 from functools import cache
 import numpy as np
 from os import linesep
@@ -8,11 +8,39 @@ import glob
 
 from ..util import parse_agf, parse_xml
 
-glass_catalog = {}
-file_catalog_list = glob.glob(f"{Path(__file__).parent}/../catalogs/*.xml")
-catalog_name = [Path(file).stem for file in file_catalog_list]
-for file, name in zip(file_catalog_list, catalog_name):
-    glass_catalog[name] = parse_xml(file)
+
+class GlassCatalog(MutableMapping):
+    """Glass catalogs by name, each file being parsed on first access."""
+
+    def __init__(self, files=()):
+        self.files = {Path(file).stem: file for file in files}
+        self.loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            self.loaded[name] = parse_xml(self.files[name])
+        return self.loaded[name]
+
+    def __setitem__(self, name, catalog):
+        self.loaded[name] = catalog
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.files.pop(name, None)
+        self.loaded.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self.files or name in self.loaded
+
+    def __iter__(self):
+        return iter(self.files | self.loaded)
+
+    def __len__(self):
+        return len(self.files | self.loaded)
+
+
+glass_catalog = GlassCatalog(glob.glob(f"{Path(__file__).parent}/../catalogs/*.xml"))
 
 
 @dataclass(frozen=True, eq=True)
@@ -96,3 +124,39 @@ def refractive_index(lam: float, material: Material) -> float:
         return material.n
     elif material.n and material.vd:
         return index_abbe(lam, material.n, material.vd)
+
+
+def catalog_indices(wavelengths, catalogs=None):
+    """Indices of every catalog glass at ``wavelengths`` in one computation.
+
+    Sellmeier coefficients of all glasses of ``catalogs`` (every catalog of
+    ``glass_catalog`` by default) are zero-padded into (glasses, terms)
+    arrays, glasses given by n and vd using the Abbe model. Returns the
+    (catalog, name) of every glass and their (glasses, wavelengths) indices,
+    following ``refractive_index``.
+    """
+    lam2 = np.atleast_1d(np.asarray(wavelengths, dtype=float)) ** 2
+    sellmeier_glasses, abbe_glasses = [], []
+    for catalog in glass_catalog if catalogs is None else catalogs:
+        for name, glass in glass_catalog[catalog].items():
+            if glass.get("B") and glass.get("C"):
+                sellmeier_glasses.append(((catalog, name), glass["B"], glass["C"]))
+            elif glass.get("n"):
+                abbe_glasses.append(((catalog, name), glass["n"], glass.get("vd")))
+    terms = max([len(glass[1]) for glass in sellmeier_glasses], default=0)
+    B, C = (
+        np.array(
+            [np.pad(g[i], (0, terms - len(g[i]))) for g in sellmeier_glasses],
+            dtype=float,
+        ).reshape(len(sellmeier_glasses), terms, 1)
+        for i in (1, 2)
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sellmeier_indices = np.sqrt(1 + np.sum(B * lam2 / (lam2 - C), axis=1))
+    nd, vd = (
+        np.array([glass[i] or np.inf for glass in abbe_glasses], dtype=float)[:, None]
+        for i in (1, 2)
+    )
+    abbe_indices = nd + ((np.sqrt(lam2) - 589.3) * (1 - nd) / (170.2 * vd)) / 1000
+    names = [glass[0] for glass in sellmeier_glasses + abbe_glasses]
+    return names, np.concatenate([sellmeier_indices, abbe_indices])
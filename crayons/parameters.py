@@ -0,0 +1,122 @@
+"""Surface parameters of a compiled trace plan bound to one flat vector.
+
+``ParameterBinding`` re-homes the packed surface parameters, thicknesses,
+decenters and tilts of a ``TracePlan`` into a single ``buffer`` array the
+plan reads through views. Writing the bound values is then one scatter into
+that buffer: no ``Surface`` or args dict is touched until ``update_system``.
+"""
+
+import numpy as np
+
+from .trace import TracePlan
+
+placement = ("thickness", "decenter", "rotation")
+
+
+def global_angles(rotation, positionning):
+    """(S, 3) global tilt angles as ``System.get_global_vertex_coordinates``."""
+    if all(p == "loc" for p in positionning):
+        return rotation[0] + np.cumsum(rotation, axis=0)
+    directions = [rotation[0]]
+    for rotation_i, p in zip(rotation, positionning):
+        if isinstance(p, int):
+            directions[-1] = directions[p]
+        directions[-1] = directions[-1] + rotation_i
+        directions.append(directions[-1])
+    return np.array(directions[:-1])
+
+
+def packed_index(surface, name: str, item: int = None) -> int:
+    """Index of ``surface.args[name][item]`` in the packed parameters.
+
+    Found by packing the args with that entry changed, so it holds for any
+    surface type of the catalog.
+    """
+    args, pack = surface.args, surface.sag_func["pack"]
+    changed = dict(args)
+    if item is None:
+        changed[name] = args.get(name, 0) + 1
+    else:
+        assert item < len(args.get(name, ())), f"Surface has no {name}[{item}]"
+        changed[name] = np.array(args[name], dtype=float)
+        changed[name][item] += 1
+    index = np.flatnonzero(pack(args) != pack(changed))
+    assert len(index) == 1, f"{name} is not a packed parameter of the surface"
+    return index[0]
+
+
+class ParameterBinding:
+    """Selected surface parameters of ``system`` exposed as one flat vector.
+
+    ``parameters`` are ``(surface, name)`` or ``(surface, name, item)``
+    tuples, ``name`` being a packed surface argument (``c``, ``k``,
+    ``coef``...) or ``thickness``, ``decenter`` and ``rotation`` whose
+    ``item`` is the axis. ``plan`` traces with the current ``values``.
+    """
+
+    def __init__(self, system, parameters):
+        self.system = system
+        self.parameters = [tuple(p) + (None,) * (3 - len(p)) for p in parameters]
+        self.positionning = [s.positionning for s in system.surfaces]
+        plan = TracePlan.from_system(system)
+        n = len(plan)
+        rotation = np.array([s.args["rotation"] for s in system.surfaces], dtype=float)
+        # parameters packed into other objects (e.g. grid sags) stay as is
+        arrays = [np.ndim(p) == 1 for p in plan.params]
+        params = [p if array else [] for p, array in zip(plan.params, arrays)]
+        sizes = [n, 3 * n, 3 * n] + [len(p) for p in params]
+        offsets = np.r_[0, np.cumsum(sizes)]
+        self.buffer = np.concatenate(
+            [plan.thickness, plan.decenter.ravel(), rotation.ravel(), *params]
+        )
+        views = [self.buffer[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+        plan.thickness = views[0]
+        plan.decenter = views[1].reshape(n, 3)
+        self.rotation = views[2].reshape(n, 3)
+        plan.params = [
+            view if array else p
+            for view, p, array in zip(views[3:], plan.params, arrays)
+        ]
+        self.plan = plan
+
+        indices = []
+        for surface, name, item in self.parameters:
+            if name in placement:
+                start = offsets[placement.index(name)]
+                width = 1 if name == "thickness" else 3
+                indices.append(start + width * surface + (item or 0))
+            else:
+                index = packed_index(system.surfaces[surface], name, item)
+                indices.append(offsets[3 + surface] + index)
+        self.indices = np.array(indices, dtype=int)
+        self.tilts = any(name == "rotation" for _, name, _ in self.parameters)
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def values(self):
+        return self.buffer[self.indices]
+
+    @values.setter
+    def values(self, values):
+        self.buffer[self.indices] = values
+        if self.tilts:
+            self.update_rotations()
+
+    def update_rotations(self):
+        """Recompute the plan tilts after ``rotation`` entries changed."""
+        self.plan.angles = global_angles(self.rotation, self.positionning)
+        self.plan.update_rotations()
+
+    def update_system(self):
+        """Write the bound values back to the surfaces of ``system``."""
+        for (surface, name, item), value in zip(self.parameters, self.values):
+            args = self.system.surfaces[surface].args
+            if name == "thickness":
+                self.system.surfaces[surface].thickness = float(value)
+            elif item is None:
+                args[name] = float(value)
+            else:
+                args[name] = np.array(args[name], dtype=float)
+                args[name][item] = value
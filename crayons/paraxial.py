@@ -0,0 +1,191 @@
+"""Paraxial marginal and chief ray traces and third-order aberrations.
+
+Rays are traced with the y-nu method over every surface at once for all
+wavelengths, so every array is (surfaces, wavelengths). The object is at
+infinity: the marginal ray starts on the first surface at ``pupil_radius``
+parallel to the axis and the chief ray at ``field_angle`` through the stop
+center. Tilts, decenters and freeform terms are ignored.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+
+from .trace import material_indices
+
+
+def surface_profiles(system):
+    """Paraxial curvature and 4th order aspheric deviation of every surface.
+
+    The deviation is the r**4 sag coefficient in excess of the sphere of the
+    same paraxial curvature.
+    """
+    curvature, deviation = [], []
+    for surface in system.surfaces:
+        c, k = surface.args.get("c", 0), surface.args.get("k", 0)
+        coef = surface.args.get("coef") if surface.type == "asp" else None
+        coef = np.r_[coef if coef is not None else [], 0, 0]
+        paraxial = c + 2 * coef[0]
+        curvature.append(paraxial)
+        deviation.append((1 + k) * c**3 / 8 + coef[1] - paraxial**3 / 8)
+    return np.array(curvature, dtype=float), np.array(deviation, dtype=float)
+
+
+def indices(system, wavelengths=None):
+    """(surfaces, wavelengths) refractive indices after every surface."""
+    wavelengths = np.atleast_1d(
+        system.wavelengths if wavelengths is None else wavelengths
+    ).astype(float)
+    return np.array(
+        [material_indices(s.material, wavelengths) for s in system.surfaces]
+    )
+
+
+@dataclass
+class ParaxialTrace:
+    """Marginal (``y``, ``u``) and chief (``ybar``, ``ubar``) rays.
+
+    Heights are on every surface and angles after refraction by it, with
+    ``n`` the index after it, all as (surfaces, wavelengths) arrays.
+    ``curvature`` and ``deviation`` come from ``surface_profiles``.
+    """
+
+    y: np.ndarray
+    u: np.ndarray
+    ybar: np.ndarray
+    ubar: np.ndarray
+    n: np.ndarray
+    curvature: np.ndarray
+    deviation: np.ndarray
+
+    @property
+    def lagrange(self):
+        """Lagrange invariant of every wavelength."""
+        return self.n[0] * (self.ubar[0] * self.y[0] - self.u[0] * self.ybar[0])
+
+    @property
+    def image_distance(self):
+        """Distance from the last surface to the paraxial focus."""
+        return -self.y[-1] / self.u[-1]
+
+
+def __trace(y0, u0, thickness, curvature, n):
+    y, u = np.empty_like(n), np.empty_like(n)
+    y[0], u[0] = y0, u0
+    for j in range(1, len(n)):
+        y[j] = y[j - 1] + thickness[j - 1] * u[j - 1]
+        u[j] = (n[j - 1] * u[j - 1] - y[j] * curvature[j] * (n[j] - n[j - 1])) / n[j]
+    return y, u
+
+
+def marginal_ray(n, thickness, curvature, pupil_radius: float = 1):
+    """Marginal ray heights and angles for (surfaces, ...) indices ``n``.
+
+    Trailing axes of ``n`` batch independent systems, e.g. wavelengths or
+    glass candidates; ``curvature`` is (surfaces,) or broadcasts with ``n``.
+    """
+    ones = np.ones(n.shape[1:])
+    return __trace(pupil_radius * ones, 0 * ones, thickness, curvature, n)
+
+
+def paraxial_trace(
+    system, pupil_radius: float = 1, field_angle: float = 1, wavelengths=None
+) -> ParaxialTrace:
+    """Trace the marginal and chief paraxial rays, ``field_angle`` in degrees."""
+    n = indices(system, wavelengths)
+    thickness = np.array([s.thickness for s in system.surfaces], dtype=float)
+    curvature, deviation = surface_profiles(system)
+    ones = np.ones(n.shape[1])
+    y, u = __trace(pupil_radius * ones, 0 * ones, thickness, curvature, n)
+    slope = np.tan(np.radians(field_angle)) * ones
+    # chief ray: angle ray plus the marginal ray scaled to cross the stop center
+    ybar, ubar = __trace(0 * ones, slope, thickness, curvature, n)
+    scale = -ybar[system.stop] / y[system.stop]
+    return ParaxialTrace(
+        y=y,
+        u=u,
+        ybar=ybar + scale * y,
+        ubar=ubar + scale * u,
+        n=n,
+        curvature=curvature,
+        deviation=deviation,
+    )
+
+
+@dataclass
+class Seidel:
+    """Per-surface third-order aberration coefficients.
+
+    ``spherical``, ``coma``, ``astigmatism``, ``petzval`` and ``distortion``
+    are the Seidel sums S_I to S_V as (surfaces, wavelengths) arrays.
+    ``axial_color`` and ``lateral_color`` are C_L and C_T per surface for the
+    index difference between the shortest and longest wavelengths, at the
+    reference wavelength. Angles being slopes as in the tracer, the marginal
+    transverse aberration of S_I on the image is S_I / (2 n' u').
+    """
+
+    spherical: np.ndarray
+    coma: np.ndarray
+    astigmatism: np.ndarray
+    petzval: np.ndarray
+    distortion: np.ndarray
+    axial_color: np.ndarray
+    lateral_color: np.ndarray
+
+    def sums(self):
+        """Totals over the surfaces, per wavelength for the Seidel sums."""
+        return {name: values.sum(axis=0) for name, values in vars(self).items()}
+
+
+def seidel(
+    system, pupil_radius: float = 1, field_angle: float = 1, wavelengths=None
+) -> Seidel:
+    """Seidel and primary chromatic coefficients of every surface."""
+    trace = paraxial_trace(system, pupil_radius, field_angle, wavelengths)
+    y, u, ybar, ubar, n = trace.y, trace.u, trace.ybar, trace.ubar, trace.n
+    c = trace.curvature[1:, None]
+    n_before, u_before = n[:-1], u[:-1]
+    y, ybar, n_after, u_after = y[1:], ybar[1:], n[1:], u[1:]
+    a = n_before * (u_before + y * c)
+    abar = n_before * (ubar[:-1] + ybar * c)
+    lagrange = trace.lagrange
+    delta_u = u_after / n_after - u_before / n_before
+    delta_n = 1 / n_after - 1 / n_before
+    delta_n2 = 1 / n_after**2 - 1 / n_before**2
+
+    spherical = -(a**2) * y * delta_u
+    coma = -a * abar * y * delta_u
+    astigmatism = -(abar**2) * y * delta_u
+    petzval = -(lagrange**2) * c * delta_n
+    distortion = -(abar**3) * y * delta_n2 + abar * ybar * c * delta_n * (
+        abar * y + lagrange
+    )
+
+    # aspheric terms, scaled by powers of the chief to marginal height ratio
+    aspheric = 8 * trace.deviation[1:, None] * (n_after - n_before) * y**4
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where(y != 0, ybar / y, 0)
+    spherical = spherical + aspheric
+    coma = coma + aspheric * ratio
+    astigmatism = astigmatism + aspheric * ratio**2
+    distortion = distortion + aspheric * ratio**3
+
+    wavelengths = np.atleast_1d(
+        system.wavelengths if wavelengths is None else wavelengths
+    )
+    short, long = np.argmin(wavelengths), np.argmax(wavelengths)
+    dispersion = (n[:, short] - n[:, long]) / n[:, system.reference_wavelength]
+    delta_dispersion = dispersion[1:] - dispersion[:-1]
+    ref = system.reference_wavelength
+
+    def padded(values):
+        return np.concatenate([np.zeros_like(values[:1]), values])
+
+    return Seidel(
+        spherical=padded(spherical),
+        coma=padded(coma),
+        astigmatism=padded(astigmatism),
+        petzval=padded(petzval),
+        distortion=padded(distortion),
+        axial_color=padded(a[:, ref] * y[:, ref] * delta_dispersion),
+        lateral_color=padded(abar[:, ref] * y[:, ref] * delta_dispersion),
+    )
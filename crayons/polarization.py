@@ -0,0 +1,108 @@
+"""Polarization ray tracing with 3x3 matrices in global coordinates.
+
+Each interface is described by a polarization ray-tracing (PRT) matrix
+mapping the incident electric field to the transmitted one,
+
+    P = ts s s' + tp p_out p_in' + k_out k_in'
+
+with flux-normalized Fresnel coefficients, so that |P E|^2 is the fraction
+of the power carried by a field E that is transmitted. Mirrors replace the
+transmission coefficients by reflection ones. Matrices are stored
+ray-major, as (N, 3, 3) arrays composed with batched matmul.
+"""
+
+import numpy as np
+
+
+def fresnel_coefficients(cos_i, cos_t, n1, n2):
+    """Amplitude reflection and transmission coefficients (rs, rp, ts, tp)."""
+    ni, nt = n1 * cos_i, n2 * cos_t
+    rs = (ni - nt) / (ni + nt)
+    rp = (n2 * cos_i - n1 * cos_t) / (n2 * cos_i + n1 * cos_t)
+    ts = 2 * ni / (ni + nt)
+    tp = 2 * ni / (n2 * cos_i + n1 * cos_t)
+    return rs, rp, ts, tp
+
+
+def __unit(vector):
+    return vector / np.sqrt(np.einsum("ij,ij->j", vector, vector))
+
+
+def __s_direction(k_in, normal):
+    """Unit s vector, perpendicular to the plane of incidence."""
+    s = np.cross(k_in, normal, axis=0)
+    norm = np.sqrt(np.einsum("ij,ij->j", s, s))
+    normal_incidence = norm < 1e-12
+    if np.any(normal_incidence):
+        # any direction perpendicular to the ray is an s direction
+        k = k_in[:, normal_incidence]
+        fallback = np.cross(k, [[1], [0], [0]], axis=0)
+        parallel = np.einsum("ij,ij->j", fallback, fallback) < 1e-12
+        fallback[:, parallel] = np.cross(k[:, parallel], [[0], [1], [0]], axis=0)
+        s[:, normal_incidence] = fallback
+        norm = np.sqrt(np.einsum("ij,ij->j", s, s))
+    return s / norm
+
+
+def interface_matrices(k_in, k_out, normal, n1, n2):
+    """PRT and parallel transport matrices of a refraction or a reflection.
+
+    ``k_in`` and ``k_out`` are (3, N) propagation directions before and after
+    the interface and ``normal`` the (3, N) surface normals. Rays going back
+    across the normal were reflected by a mirror (negative index), an ideal
+    reflector with the rs = -1 and rp = 1 of a perfect conductor. Returns two
+    (N, 3, 3) arrays, the transport matrices having unit coefficients.
+    """
+    k_in, k_out, normal = __unit(k_in), __unit(k_out), __unit(normal)
+    s = __s_direction(k_in, normal)
+    p_in = np.cross(k_in, s, axis=0)
+    p_out = np.cross(k_out, s, axis=0)
+    cos_in = np.einsum("ij,ij->j", k_in, normal)
+    cos_out = np.einsum("ij,ij->j", k_out, normal)
+    reflected = cos_in * cos_out < 0
+    n1, n2 = np.abs(n1), np.abs(n2)
+    cos_i, cos_t = np.abs(cos_in), np.abs(cos_out)
+    _, _, ts, tp = fresnel_coefficients(cos_i, cos_t, n1, n2)
+    flux = np.sqrt(n2 * cos_t / (n1 * cos_i))
+    ts, tp = np.where(reflected, -1, ts * flux), np.where(reflected, 1, tp * flux)
+    s, p_in, p_out = s.T[:, :, None], p_in.T[:, None, :], p_out.T[:, :, None]
+    ss, pp = s * s.transpose(0, 2, 1), p_out * p_in
+    kk = k_out.T[:, :, None] * k_in.T[:, None, :]
+    return (
+        ts[:, None, None] * ss + tp[:, None, None] * pp + kk,
+        ss + pp + kk,
+    )
+
+
+def transmission(prt: np.ndarray) -> np.ndarray:
+    """Power transmission of unpolarized light for every ray.
+
+    The mean of the two transverse singular values squared, the axial one
+    being 1.
+    """
+    return (np.einsum("nij,nij->n", np.abs(prt), np.abs(prt)) - 1) / 2
+
+
+def diattenuation(prt: np.ndarray) -> np.ndarray:
+    """Diattenuation (Tmax - Tmin) / (Tmax + Tmin) of every ray."""
+    singular = np.linalg.svd(prt, compute_uv=False)
+    # the axial singular value is 1, the largest for a passive system
+    tmax, tmin = singular[:, 1] ** 2, singular[:, 2] ** 2
+    return (tmax - tmin) / (tmax + tmin)
+
+
+def retardance(prt: np.ndarray, transport: np.ndarray, k_in: np.ndarray):
+    """Retardance in radians of every ray.
+
+    The unitary part of ``prt`` is compared with the parallel ``transport``
+    matrix of the same path, and the phase difference of the resulting
+    retarder is taken in a basis transverse to the (3, N) input directions
+    ``k_in``, so that purely geometric rotations are not counted.
+    """
+    u, _, vh = np.linalg.svd(prt)
+    retarder = np.swapaxes(transport, 1, 2).conj() @ u @ vh
+    k_in = __unit(np.asarray(k_in, dtype=float))
+    s = __s_direction(k_in, np.zeros_like(k_in))
+    basis = np.stack([s, np.cross(k_in, s, axis=0)], axis=-1).transpose(1, 0, 2)
+    eigenvalues = np.linalg.eigvals(np.swapaxes(basis, 1, 2) @ retarder @ basis)
+    return np.abs(np.angle(eigenvalues[:, 0] * eigenvalues[:, 1].conj()))
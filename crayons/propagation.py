@@ -1,6 +1,5 @@
 import numpy as np
 from collections.abc import Callable, Iterable
-from scipy.optimize import root_scalar, root
 from dataclasses import dataclass, field, InitVar
 from warnings import warn
 
@@ -17,7 +16,9 @@ class Ray:
     vector: list = field(init=False)
 
     def __post_init__(self, x, y, z, l, m, n):
-        object.__setattr__(self, "vector", np.array([x, y, z, l, m, n]))
+        object.__setattr__(
+            self, "vector", np.array(np.broadcast_arrays(x, y, z, l, m, n))
+        )
 
     def __getitem__(self, key):
         return self.vector[key]
@@ -46,6 +47,29 @@ class Ray:
         return Ray(*self.vector * other)
 
 
+def rotation_matrix(angles) -> np.ndarray:
+    """Matrices of extrinsic x, y, z rotations by ``angles`` in degrees.
+
+    Equivalent to ``Rotation.from_euler("xyz", angles, degrees=True)`` of
+    scipy, vectorized over the leading axes of ``angles``.
+    """
+    ax, ay, az = np.moveaxis(np.radians(np.asarray(angles, dtype=float)), -1, 0)
+    ca, sa = np.cos(ax), np.sin(ax)
+    cb, sb = np.cos(ay), np.sin(ay)
+    cc, sc = np.cos(az), np.sin(az)
+    return np.moveaxis(
+        np.array(
+            [
+                [cb * cc, sa * sb * cc - ca * sc, ca * sb * cc + sa * sc],
+                [cb * sc, sa * sb * sc + ca * cc, ca * sb * sc - sa * cc],
+                [-sb, sa * cb, ca * cb],
+            ]
+        ),
+        (0, 1),
+        (-2, -1),
+    )
+
+
 def find_intersection(
     ray: Ray,
     sag: Callable,
@@ -66,6 +90,8 @@ def find_intersection(
             * angle[:2]
         )
 
+    from scipy.optimize import root_scalar
+
     solve = root_scalar(equation, x0=t, fprime=True)
     if solve.converged:
         return (solve.root) * angle + position - np.array((0, 0, t))
@@ -99,3 +125,72 @@ def refraction(ray: Ray, normal: Iterable[3], n2: float = 1) -> Ray:
         warn("Total reflection")
         return None
     return Ray(*np.r_[ray[:3], -cosout * n2], ray.wavelength)
+
+
+def find_intersection_bundle(
+    position: np.ndarray,
+    cosine: np.ndarray,
+    sag_and_gradient: Callable,
+    params: np.ndarray,
+    start: np.ndarray = None,
+    tol: float = 1e-12,
+    max_iter: int = 32,
+    iterations: np.ndarray = None,
+):
+    """Vectorized Newton intersection of a bundle with a surface.
+
+    ``position`` and ``cosine`` are (3, N) arrays in the local frame of the
+    surface. The fused kernel is called once per iteration on the rays that
+    have not converged yet. Returns the ray parameters, the sag gradient at
+    the intersections and the convergence mask. When given, the integer
+    array ``iterations`` is incremented for every ray at each iteration.
+    """
+    px, py, pz = position
+    cx, cy, cz = cosine
+    if start is None:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            start = -pz / cz
+    param = np.array(start, dtype=float)
+    dx = np.full_like(param, np.nan)
+    dy = np.full_like(param, np.nan)
+    converged = np.zeros(param.shape, dtype=bool)
+    active = np.flatnonzero(np.isfinite(param))
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        if iterations is not None:
+            iterations[active] += 1
+        s = param[active]
+        acx, acy, acz = cx[active], cy[active], cz[active]
+        sag, gx, gy = sag_and_gradient(
+            px[active] + s * acx, py[active] + s * acy, params
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            step = (pz[active] + s * acz - sag) / (acz - gx * acx - gy * acy)
+        param[active] = s - step
+        dx[active] = gx
+        dy[active] = gy
+        done = np.abs(step) <= tol * (1 + np.abs(s))
+        converged[active[done]] = True
+        active = active[~done & np.isfinite(step)]
+    return param, dx, dy, converged
+
+
+def refraction_bundle(cosine: np.ndarray, dx: np.ndarray, dy: np.ndarray, n2):
+    """Vectorized counterpart of ``refraction`` from the sag gradient.
+
+    ``cosine`` is a (3, N) array scaled by the incident index. Returns the
+    refracted cosines scaled by ``n2`` and a mask of the rays that were not
+    totally reflected.
+    """
+    normal = np.array([dx, dy, -np.ones_like(dx)])
+    normal /= np.sqrt(np.einsum("ij,ij->j", normal, normal))
+    n1 = np.sqrt(np.einsum("ij,ij->j", cosine, cosine))
+    mu = n1 / n2
+    cosin = cosine / n1
+    product_normal = np.einsum("ij,ij->j", normal, cosin)
+    root = 1 - mu**2 * (1 - product_normal**2)
+    ok = root >= 0
+    with np.errstate(invalid="ignore"):
+        cosout = np.sqrt(root) * normal + mu * (product_normal * normal - cosin)
+    return -cosout * n2, ok
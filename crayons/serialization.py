@@ -0,0 +1,162 @@
+"""Compact binary format of ``System``.
+
+Layout (little endian)::
+
+    magic         8 bytes   b"CRAYONS" + format version
+    header        24 bytes  surfaces, wavelengths, stop, reference
+                            wavelength, metadata length
+    wavelengths   f8[n]
+    weights       f8[n]
+    surfaces      surface_dtype[m]  numeric surface table
+    metadata      utf-8 JSON        types, materials, comments and the
+                                    remaining surface args
+
+Every section is 8-byte aligned so the arrays are read with zero-copy
+``np.frombuffer`` views of the input buffer (bytes or mmap). Gradient-index
+materials are stored with their parameters and base material.
+"""
+
+from dataclasses import fields
+import json
+import struct
+import numpy as np
+
+from .grin import GradientIndex
+from .materials import Material
+
+version = 1
+magic = b"CRAYONS" + bytes([version])
+__header = struct.Struct("<IIiiQ")
+surface_dtype = np.dtype(
+    [
+        ("thickness", "<f8"),
+        ("decenter", "<f8", 3),
+        ("rotation", "<f8", 3),
+        ("positionning", "<i8"),  # -1 for "loc"
+        ("type", "<i4"),
+        ("material", "<i4"),
+    ]
+)
+
+
+def __json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def __material_record(material):
+    if isinstance(material, GradientIndex):
+        record = {f.name: getattr(material, f.name) for f in fields(material)}
+        record["base"] = __material_record(material.base)
+        return {"grin": record}
+    return {f.name: getattr(material, f.name) for f in fields(material)}
+
+
+def __material(record):
+    if "grin" in record:
+        grin = dict(record["grin"])
+        grin["base"] = __material(grin["base"])
+        grin["radial"], grin["axial"] = tuple(grin["radial"]), tuple(grin["axial"])
+        return GradientIndex(**grin)
+    for key in ("B", "C"):
+        if record[key] is not None:
+            record[key] = tuple(record[key])
+    return Material(**record)
+
+
+def dumps(system) -> bytes:
+    surfaces = system.surfaces
+    types, materials = [], []
+    table = np.zeros(len(surfaces), dtype=surface_dtype)
+    for i, surface in enumerate(surfaces):
+        if surface.type not in types:
+            types.append(surface.type)
+        if surface.material not in materials:
+            materials.append(surface.material)
+        table[i] = (
+            surface.thickness,
+            surface.args["decenter"],
+            surface.args["rotation"],
+            -1 if surface.positionning == "loc" else surface.positionning,
+            types.index(surface.type),
+            materials.index(surface.material),
+        )
+    metadata = json.dumps(
+        {
+            "types": types,
+            "materials": [__material_record(m) for m in materials],
+            "comments": [surface.comment for surface in surfaces],
+            "args": [
+                {
+                    key: value
+                    for key, value in surface.args.items()
+                    if key not in ("decenter", "rotation")
+                }
+                for surface in surfaces
+            ],
+        },
+        separators=(",", ":"),
+        default=__json_default,
+    ).encode()
+    metadata += b" " * (-len(metadata) % 8)
+    wavelengths = np.asarray(system.wavelengths, dtype="<f8")
+    return b"".join(
+        (
+            magic,
+            __header.pack(
+                len(surfaces),
+                len(wavelengths),
+                system.stop,
+                system.reference_wavelength,
+                len(metadata),
+            ),
+            wavelengths.tobytes(),
+            np.asarray(system.wavelengths_weights, dtype="<f8").tobytes(),
+            table.tobytes(),
+            metadata,
+        )
+    )
+
+
+def loads(buffer):
+    from .system import System, Surface
+
+    assert bytes(buffer[:7]) == magic[:7], "Not a crayons system"
+    assert buffer[7] == version, f"Unsupported format version {buffer[7]}"
+    n_surfaces, n_wavelengths, stop, reference, n_metadata = __header.unpack_from(
+        buffer, len(magic)
+    )
+    offset = len(magic) + __header.size
+    wavelengths = np.frombuffer(buffer, "<f8", n_wavelengths, offset)
+    offset += wavelengths.nbytes
+    weights = np.frombuffer(buffer, "<f8", n_wavelengths, offset)
+    offset += weights.nbytes
+    table = np.frombuffer(buffer, surface_dtype, n_surfaces, offset)
+    offset += table.nbytes
+    metadata = json.loads(bytes(buffer[offset : offset + n_metadata]))
+    materials = [__material(material) for material in metadata["materials"]]
+
+    surfaces = []
+    for row, comment, args in zip(
+        table.tolist(), metadata["comments"], metadata["args"]
+    ):
+        thickness, decenter, rotation, positionning, type, material = row
+        args["decenter"] = np.array(decenter)
+        args["rotation"] = np.array(rotation)
+        surfaces.append(
+            Surface(
+                type=metadata["types"][type],
+                comment=comment,
+                args=args,
+                thickness=thickness,
+                material=materials[material],
+                positionning="loc" if positionning == -1 else positionning,
+            )
+        )
+    system = System(stop=stop, reference_wavelength=reference, surfaces=surfaces)
+    system.wavelengths = wavelengths.copy()
+    system.wavelengths_weights = weights.copy()
+    return system
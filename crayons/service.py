@@ -0,0 +1,154 @@
+"""Asyncio front-end tracing concurrent small requests in micro-batches.
+
+Requests for the same registered system and starting surface are queued,
+coalesced for at most ``max_delay`` seconds or ``max_batch`` rays, traced as
+one bundle in an executor and split back so every caller gets the
+``BundleTrace`` of its own rays.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import numpy as np
+
+from .propagation import Ray
+from .trace import BundleTrace, TracePlan
+
+
+@dataclass
+class TraceService:
+    """Micro-batching trace service, to be used as an async context manager.
+
+    Batches run in ``executor``, a thread pool of ``workers`` threads by
+    default, at most ``workers`` at a time. A process pool also works for
+    plans that can be pickled (no aperture masks). ``batches`` records the
+    number of rays of every traced batch.
+    """
+
+    max_batch: int = 2**14
+    max_delay: float = 0.002
+    workers: int = 2
+    executor: object = field(default=None)
+    plans: dict = field(default_factory=dict)
+    batches: list = field(default_factory=list)
+
+    def __post_init__(self):
+        self.queues = {}
+        self.tasks = []
+        self.running = set()
+        self.owned = self.executor is None
+
+    async def __aenter__(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers)
+        self.slots = asyncio.Semaphore(self.workers)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        for queue in self.queues.values():
+            await queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.queues, self.tasks = {}, []
+        if self.owned:
+            self.executor.shutdown()
+            self.executor = None
+
+    def register(self, name, system):
+        """Compile ``system`` under ``name``; a ``TracePlan`` is used as is."""
+        self.plans[name] = system if isinstance(system, TracePlan) else system.compile()
+
+    async def trace(self, name, ray: Ray, key: int = 0) -> BundleTrace:
+        """Trace ``ray`` through the system ``name`` from surface ``key``."""
+        plan = self.plans[name]
+        vector = np.array(np.broadcast_arrays(*ray.vector), dtype=float).reshape(6, -1)
+        wavelength = np.broadcast_to(
+            (
+                plan.wavelengths[plan.reference_wavelength]
+                if ray.wavelength is None
+                else ray.wavelength
+            ),
+            vector.shape[1:],
+        )
+        if (name, key) not in self.queues:
+            self.queues[name, key] = asyncio.Queue()
+            self.tasks.append(asyncio.create_task(self.__batcher(name, key)))
+        future = asyncio.get_running_loop().create_future()
+        await self.queues[name, key].put((vector, wavelength, future))
+        return await future
+
+    async def __batcher(self, name, key):
+        queue = self.queues[name, key]
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await queue.get()]
+            size = requests[0][0].shape[1]
+            deadline = loop.time() + self.max_delay
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    requests.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                size += requests[-1][0].shape[1]
+            await self.slots.acquire()
+            task = asyncio.create_task(self.__dispatch(name, key, requests))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def __dispatch(self, name, key, requests):
+        queue = self.queues[name, key]
+        try:
+            vector = np.concatenate([r[0] for r in requests], axis=1)
+            wavelength = np.concatenate([r[1] for r in requests])
+            self.batches.append(vector.shape[1])
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                self.plans[name].trace,
+                Ray(*vector, wavelength),
+                key,
+            )
+            start = 0
+            for request_vector, _, future in requests:
+                part = slice(start, start + request_vector.shape[1])
+                start = part.stop
+                if not future.cancelled():
+                    future.set_result(
+                        BundleTrace(
+                            ray=Ray(
+                                *result.ray.vector[:, part], result.ray.wavelength[part]
+                            ),
+                            valid=result.valid[part],
+                        )
+                    )
+        except Exception as error:
+            for _, _, future in requests:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            self.slots.release()
+            for _ in requests:
+                queue.task_done()
+
+
+@dataclass
+class LocalClient:
+    """In-process client of a ``TraceService`` bound to one system."""
+
+    service: TraceService
+    name: str
+    key: int = 0
+
+    async def trace(self, ray: Ray) -> BundleTrace:
+        return await self.service.trace(self.name, ray, self.key)
+
+    async def propagate(self, ray: Ray):
+        """Final (6,) vector of a single ray, None if it is blocked."""
+        result = await self.trace(ray)
+        return result.ray.vector[:, 0] if result.valid[0] else None
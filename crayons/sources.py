@@ -0,0 +1,166 @@
+"""Monte Carlo sources emitting chunked ``Ray`` bundles.
+
+Sources sample positions on the first traced surface and direction cosines
+around the z axis with a ``numpy`` generator, one chunk at a time, so only a
+chunk of rays ever exists in memory. Wavelengths are drawn from an optional
+``Spectrum``; rays then carry equal weights and detectors should not weight
+wavelengths again.
+"""
+
+from dataclasses import dataclass, field
+import numpy as np
+
+from .propagation import Ray
+from .analysis import Irradiance
+
+
+@dataclass
+class Spectrum:
+    """Discrete spectrum sampled in proportion to its ``weights``."""
+
+    wavelengths: np.ndarray
+    weights: np.ndarray = field(default=None)
+
+    def __post_init__(self):
+        self.wavelengths = np.atleast_1d(np.asarray(self.wavelengths, dtype=float))
+        weights = (
+            np.ones_like(self.wavelengths)
+            if self.weights is None
+            else np.atleast_1d(np.asarray(self.weights, dtype=float))
+        )
+        assert weights.shape == self.wavelengths.shape, "One weight per wavelength"
+        self.weights = weights / weights.sum()
+
+    @classmethod
+    def from_system(cls, system):
+        return cls(system.wavelengths, system.wavelengths_weights)
+
+    def sample(self, n_rays: int, rng: np.random.Generator):
+        return rng.choice(self.wavelengths, n_rays, p=self.weights)
+
+
+@dataclass
+class Source:
+    """Collimated beam along z from the (x, y) ``center``, base of the sources.
+
+    Subclasses override ``positions`` and ``directions``.
+    """
+
+    center: tuple = (0, 0)
+    spectrum: Spectrum = field(default=None)
+    power: float = 1
+
+    def positions(self, n_rays: int, rng: np.random.Generator):
+        return np.broadcast_to(np.reshape(self.center, (2, 1)), (2, n_rays))
+
+    def directions(self, n_rays: int, rng: np.random.Generator):
+        return np.broadcast_to(np.reshape((0, 0, 1), (3, 1)), (3, n_rays))
+
+    def sample(self, n_rays: int, rng: np.random.Generator) -> Ray:
+        x, y = self.positions(n_rays, rng)
+        l, m, n = self.directions(n_rays, rng)
+        wavelength = (
+            None if self.spectrum is None else self.spectrum.sample(n_rays, rng)
+        )
+        return Ray(x, y, 0, l, m, n, wavelength)
+
+    def emit(self, n_rays: int, chunk_size: int = 2**16, seed=None):
+        """Yield ``n_rays`` rays as bundles of at most ``chunk_size`` rays.
+
+        The same ``seed`` always yields the same rays.
+        """
+        rng = np.random.default_rng(seed)
+        for start in range(0, int(n_rays), chunk_size):
+            yield self.sample(min(chunk_size, int(n_rays) - start), rng)
+
+
+def cone(cos_min, n_rays: int, rng: np.random.Generator, lambertian: bool = False):
+    """Direction cosines inside a cone around z of half-angle arccos(cos_min).
+
+    Directions are uniform in solid angle, or weighted by cos(theta) when
+    ``lambertian``.
+    """
+    if lambertian:
+        sin_theta = np.sqrt(rng.random(n_rays) * (1 - cos_min**2))
+        cos_theta = np.sqrt(1 - sin_theta**2)
+    else:
+        cos_theta = 1 - rng.random(n_rays) * (1 - cos_min)
+        sin_theta = np.sqrt(1 - cos_theta**2)
+    phi = 2 * np.pi * rng.random(n_rays)
+    return np.array([sin_theta * np.cos(phi), sin_theta * np.sin(phi), cos_theta])
+
+
+@dataclass
+class PointSource(Source):
+    """Isotropic point emitting into a cone of ``half_angle`` degrees."""
+
+    half_angle: float = 10
+
+    def directions(self, n_rays: int, rng: np.random.Generator):
+        return cone(np.cos(np.radians(self.half_angle)), n_rays, rng)
+
+
+@dataclass
+class LambertianSource(Source):
+    """Lambertian disk of ``radius`` emitting up to ``half_angle`` degrees."""
+
+    radius: float = 1
+    half_angle: float = 90
+
+    def positions(self, n_rays: int, rng: np.random.Generator):
+        r = self.radius * np.sqrt(rng.random(n_rays))
+        phi = 2 * np.pi * rng.random(n_rays)
+        return np.array([r * np.cos(phi), r * np.sin(phi)]) + np.reshape(
+            self.center, (2, 1)
+        )
+
+    def directions(self, n_rays: int, rng: np.random.Generator):
+        return cone(np.cos(np.radians(self.half_angle)), n_rays, rng, lambertian=True)
+
+
+@dataclass
+class GaussianBeam(Source):
+    """Gaussian beam of 1/e^2 ``waist`` radius and ``divergence`` in degrees.
+
+    Positions and angles are normally distributed with standard deviations of
+    half the 1/e^2 radius and half-angle.
+    """
+
+    waist: float = 1
+    divergence: float = 0.1
+
+    def positions(self, n_rays: int, rng: np.random.Generator):
+        return rng.normal(0, self.waist / 2, (2, n_rays)) + np.reshape(
+            self.center, (2, 1)
+        )
+
+    def directions(self, n_rays: int, rng: np.random.Generator):
+        tx, ty = np.tan(rng.normal(0, np.radians(self.divergence) / 2, (2, n_rays)))
+        return np.array([tx, ty, np.ones(n_rays)])
+
+
+def simulate(
+    system,
+    source: Source,
+    detector: Irradiance = None,
+    target_noise: float = 0.01,
+    max_rays: int = 10**9,
+    chunk_size: int = 2**16,
+    seed=None,
+    key: int = 0,
+    polarization: bool = False,
+) -> Irradiance:
+    """Trace ``source`` rays chunk by chunk until the detector is smooth enough.
+
+    Stops once ``detector.relative_noise()`` is below ``target_noise`` or
+    after ``max_rays`` rays. ``detector.irradiance(source.power)`` then gives
+    the flux per unit area.
+    """
+    if detector is None:
+        detector = Irradiance()
+    plan = system.compile()
+    for chunk in source.emit(max_rays, chunk_size, seed):
+        detector.add(plan.trace(chunk, key=key, polarization=polarization))
+        if detector.relative_noise() <= target_noise:
+            break
+    return detector
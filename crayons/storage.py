@@ -0,0 +1,143 @@
+"""Out-of-core ray bundles stored in memory-mapped ``.npy`` files.
+
+A ``RayFile`` holds one record per ray (x, y, z, l, m, n, wavelength, valid)
+so traces can be written chunk by chunk into the mapped file and read back,
+from any process, without loading the whole bundle. Fields are strided views
+of the map, never copies.
+"""
+
+from pathlib import Path
+import numpy as np
+
+from .propagation import Ray
+from .trace import BundleTrace
+from .analysis import chunks
+
+ray_dtype = np.dtype(
+    [(name, "<f8") for name in ("x", "y", "z", "l", "m", "n", "wavelength")]
+    + [("valid", "?")]
+)
+
+
+class RayFile:
+    """Bundle of rays mapped from a ``.npy`` file of ``ray_dtype`` records."""
+
+    def __init__(self, filename, mode: str = "r"):
+        self.filename = Path(filename)
+        self.records = np.load(self.filename, mmap_mode=mode)
+        assert self.records.dtype == ray_dtype, "Not a ray file"
+
+    @classmethod
+    def create(cls, filename, n_rays: int):
+        np.lib.format.open_memmap(
+            filename, mode="w+", dtype=ray_dtype, shape=(int(n_rays),)
+        ).flush()
+        return cls(filename, mode="r+")
+
+    @classmethod
+    def from_ray(cls, filename, ray: Ray, chunk_size: int = 2**20):
+        """Write a ``Ray`` bundle, all rays being flagged as valid."""
+        vector = np.broadcast_arrays(*ray.vector)
+        n_rays = np.size(vector[0])
+        wavelength = np.broadcast_to(
+            np.nan if ray.wavelength is None else ray.wavelength, (n_rays,)
+        )
+        file = cls.create(filename, n_rays)
+        for start in range(0, n_rays, chunk_size):
+            part = slice(start, start + chunk_size)
+            file.write(
+                start,
+                Ray(*(np.ravel(v)[part] for v in vector), wavelength[part]),
+                np.ones(len(wavelength[part]), dtype=bool),
+            )
+        file.flush()
+        return file
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getattr__(self, name):
+        if name in ray_dtype.names:
+            return self.records[name]
+        raise AttributeError(name)
+
+    def write(self, start: int, ray: Ray, valid: np.ndarray):
+        vector = np.broadcast_arrays(*ray.vector)
+        stop = start + np.size(vector[0])
+        for name, values in zip(ray_dtype.names, vector):
+            self.records[name][start:stop] = values
+        self.records["wavelength"][start:stop] = (
+            np.nan if ray.wavelength is None else ray.wavelength
+        )
+        self.records["valid"][start:stop] = valid
+
+    def flush(self):
+        if isinstance(self.records, np.memmap):
+            self.records.flush()
+
+    def bundle(self, start: int = 0, stop: int = None, reference=None) -> BundleTrace:
+        """Rays ``start:stop`` as an in-memory ``BundleTrace``.
+
+        Rays stored without wavelength (NaN) get the ``reference`` wavelength.
+        Without it, they are only allowed when no ray has a wavelength.
+        """
+        records = self.records[start:stop]
+        wavelength = np.array(records["wavelength"])
+        missing = np.isnan(wavelength)
+        if reference is not None:
+            wavelength[missing] = reference
+        elif np.all(missing):
+            wavelength = None
+        else:
+            assert not np.any(missing), "A reference wavelength is required"
+        return BundleTrace(
+            ray=Ray(*(records[name] for name in ray_dtype.names[:6]), wavelength),
+            valid=np.array(records["valid"]),
+        )
+
+    def chunks(self, chunk_size: int = 2**16, reference=None):
+        """Yield the file as ``BundleTrace`` chunks of ``chunk_size`` rays.
+
+        Chunks can be binned directly by ``Irradiance.add``. ``reference`` is
+        passed to ``bundle``.
+        """
+        for start in range(0, len(self), chunk_size):
+            yield self.bundle(start, start + chunk_size, reference)
+
+
+def trace_to_file(
+    plan,
+    rays,
+    filename,
+    key: int = 0,
+    chunk_size: int = 2**16,
+    n_rays: int = None,
+) -> RayFile:
+    """Trace ``rays`` chunk by chunk into the ray file ``filename``.
+
+    ``plan`` is a ``System`` or a compiled ``TracePlan``. ``rays`` is a
+    ``RayFile``, a ``Ray`` bundle or an iterable of ``Ray`` chunks whose
+    total ``n_rays`` must then be given. Rays invalid in an input file stay
+    invalid. Returns the output file opened read-only.
+    """
+    if hasattr(plan, "compile"):
+        plan = plan.compile()
+    if isinstance(rays, Ray):
+        n_rays = np.size(np.broadcast_arrays(*rays.vector)[0])
+        rays = chunks(rays, chunk_size)
+    elif isinstance(rays, RayFile):
+        n_rays = len(rays)
+        rays = rays.chunks(chunk_size, plan.wavelengths[plan.reference_wavelength])
+    assert n_rays is not None, "n_rays is required for an iterable of chunks"
+    output = RayFile.create(filename, n_rays)
+    start = 0
+    for chunk in rays:
+        if isinstance(chunk, BundleTrace):
+            chunk, valid = chunk.ray, chunk.valid
+        else:
+            valid = True
+        traced = plan.trace(chunk, key=key)
+        output.write(start, traced.ray, traced.valid & valid)
+        start += len(traced.valid)
+    output.flush()
+    return RayFile(filename)
@@ -0,0 +1,139 @@
+"""Search of catalog glasses replacing the material of a surface.
+
+Indices of every catalog glass are computed at the system wavelengths in one
+array, and every candidate is scored at once by a batched paraxial marginal
+ray trace: the relative change of the system power and the change of the
+axial color against the current material, in units of the focal length.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+
+from .materials import Material, catalog_indices
+from .paraxial import indices, marginal_ray, surface_profiles
+
+
+@dataclass
+class Substitution:
+    """Candidate glasses for the material of ``surfaces``, best first.
+
+    ``glasses`` are (catalog, name) pairs with their (glasses, wavelengths)
+    ``indices``, the system ``power`` and ``axial_color`` (longest minus
+    shortest wavelength focus) they give and their ``score``.
+    ``curvature_change`` is the change of the paraxial curvature of the first
+    surface restoring the power, zero for candidates not re-optimized.
+    """
+
+    surfaces: list
+    glasses: list
+    indices: np.ndarray
+    power: np.ndarray
+    axial_color: np.ndarray
+    score: np.ndarray
+    curvature_change: np.ndarray
+
+    def material(self, rank: int = 0) -> Material:
+        catalog, name = self.glasses[rank]
+        return Material(name=name, catalog=catalog)
+
+    def apply(self, system, rank: int = 0):
+        """Set the glass of ``rank`` in ``system`` with its curvature change."""
+        material = self.material(rank)
+        for key in self.surfaces:
+            system.surfaces[key].material = material
+        args = system.surfaces[self.surfaces[0]].args
+        args["c"] = args.get("c", 0) + self.curvature_change[rank]
+
+
+def __paraxial_color(n, thickness, curvature, short, long, reference):
+    """Power at the reference wavelength and axial color of (S, G, W) ``n``."""
+    y, u = marginal_ray(n, thickness, curvature)
+    power = -n[-1, :, reference] * u[-1, :, reference] / y[0, :, reference]
+    focus = -y[-1] / u[-1]
+    return power, focus[:, long] - focus[:, short]
+
+
+def glass_substitution(
+    system,
+    key: int,
+    catalogs=None,
+    color_weight: float = 1,
+    reoptimize: int = 0,
+) -> Substitution:
+    """Rank the catalog glasses replacing the material after surface ``key``.
+
+    The material is replaced on ``key`` and the following surfaces sharing
+    it. ``catalogs`` are names of ``glass_catalog``, all by default. The
+    score is the root sum square of the relative power change and of the
+    axial color change, weighted by ``color_weight``, in focal lengths. With
+    ``reoptimize``, the best candidates get the curvature of surface ``key``
+    solved to restore the power, all in one batched trace, and are ranked
+    again on their remaining color change.
+    """
+    wavelengths = np.atleast_1d(np.asarray(system.wavelengths, dtype=float))
+    short, long = np.argmin(wavelengths), np.argmax(wavelengths)
+    reference = system.reference_wavelength
+    material = system.surfaces[key].material
+    surfaces = [key]
+    while (
+        surfaces[-1] + 1 < len(system.surfaces)
+        and system.surfaces[surfaces[-1] + 1].material == material
+    ):
+        surfaces.append(surfaces[-1] + 1)
+
+    glasses, candidates = catalog_indices(wavelengths, catalogs)
+    usable = np.all(np.isfinite(candidates) & (candidates >= 1), axis=1)
+    glasses = [glass for glass, ok in zip(glasses, usable) if ok]
+    candidates = candidates[usable]
+    assert len(glasses), "No usable glass in the catalogs"
+
+    nominal = indices(system, wavelengths)
+    thickness = np.array([s.thickness for s in system.surfaces], dtype=float)
+    curvature, _ = surface_profiles(system)
+    power0, color0 = __paraxial_color(
+        nominal[:, None], thickness, curvature, short, long, reference
+    )
+    n = np.repeat(nominal[:, None], len(glasses), axis=1)
+    n[surfaces] = candidates
+
+    def score(power, color):
+        return np.hypot(
+            (power - power0) / power0, color_weight * (color - color0) * power0
+        )
+
+    power, color = __paraxial_color(n, thickness, curvature, short, long, reference)
+    scores = score(power, color)
+    change = np.zeros(len(glasses))
+    if reoptimize:
+        best = np.argsort(scores)[:reoptimize]
+        # the power is affine in a single curvature, one secant step solves it
+        steps = np.array([0, 1e-3 * max(abs(curvature[key]), 1e-3)])
+        batch = np.repeat(curvature[:, None], len(best) * 2, axis=1)
+        batch[key] += np.repeat(steps, len(best))
+        trial, _ = __paraxial_color(
+            np.tile(n[:, best], (1, 2, 1)),
+            thickness,
+            batch[:, :, None],
+            short,
+            long,
+            reference,
+        )
+        trial = trial.reshape(2, -1)
+        change[best] = (power0 - trial[0]) * steps[1] / (trial[1] - trial[0])
+        batch = np.repeat(curvature[:, None], len(best), axis=1)
+        batch[key] += change[best]
+        power[best], color[best] = __paraxial_color(
+            n[:, best], thickness, batch[:, :, None], short, long, reference
+        )
+        scores[best] = score(power[best], color[best])
+
+    order = np.argsort(scores)
+    return Substitution(
+        surfaces=surfaces,
+        glasses=[glasses[i] for i in order],
+        indices=candidates[order],
+        power=power[order],
+        axial_color=color[order],
+        score=scores[order],
+        curvature_change=change[order],
+    )
@@ -1,3 +1,12 @@
-from .catalog import surfaces_catalog
+from .catalog import surfaces_catalog, register_surface, FreeformBasis
+from .apertures import (
+    aperture_catalog,
+    args_signature,
+    compile_aperture,
+    compile_apertures,
+)
+from .grid import GridSag, load_grid, spline_coefficients
 
 del catalog
+del apertures
+del grid
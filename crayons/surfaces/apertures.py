@@ -0,0 +1,128 @@
+import copy
+import numpy as np
+
+
+def __offset(x, y, aperture):
+    dx, dy = aperture.get("decenter", (0, 0))
+    return np.asarray(x) - dx, np.asarray(y) - dy
+
+
+def circular_mask(aperture):
+    cir2 = aperture["cir"] ** 2
+
+    def mask(x, y):
+        x, y = __offset(x, y, aperture)
+        return x * x + y * y <= cir2
+
+    return mask
+
+
+def elliptical_mask(aperture):
+    rex2, rey2 = aperture["rex"] ** 2, aperture["rey"] ** 2
+
+    def mask(x, y):
+        x, y = __offset(x, y, aperture)
+        return x * x / rex2 + y * y / rey2 <= 1
+
+    return mask
+
+
+def rectangular_mask(aperture):
+    rex, rey = aperture["rex"], aperture["rey"]
+
+    def mask(x, y):
+        x, y = __offset(x, y, aperture)
+        return (np.abs(x) <= rex) & (np.abs(y) <= rey)
+
+    return mask
+
+
+def annular_mask(aperture):
+    inner2, outer2 = aperture["inner"] ** 2, aperture["outer"] ** 2
+
+    def mask(x, y):
+        x, y = __offset(x, y, aperture)
+        radius2 = x * x + y * y
+        return (radius2 >= inner2) & (radius2 <= outer2)
+
+    return mask
+
+
+def polygon_mask(aperture):
+    """Even-odd point-in-polygon test against a precomputed edge table.
+
+    Horizontal edges never cross a scanline and are dropped; every other
+    edge stores its start point, end ordinate and inverse slope so the test
+    is one vector operation per edge on the whole bundle.
+    """
+    vertices = np.asarray(aperture["vertices"], dtype=float)
+    start, end = vertices, np.roll(vertices, -1, axis=0)
+    keep = start[:, 1] != end[:, 1]
+    start, end = start[keep], end[keep]
+    edges = np.c_[
+        start[:, 0],
+        start[:, 1],
+        end[:, 1],
+        (end[:, 0] - start[:, 0]) / (end[:, 1] - start[:, 1]),
+    ]
+
+    def mask(x, y):
+        x, y = __offset(x, y, aperture)
+        inside = np.zeros(np.shape(x), dtype=bool)
+        for xa, ya, yb, inverse_slope in edges:
+            inside ^= ((ya > y) != (yb > y)) & (x < xa + (y - ya) * inverse_slope)
+        return inside
+
+    return mask
+
+
+aperture_catalog = {
+    "circular": circular_mask,
+    "elliptical": elliptical_mask,
+    "rectangular": rectangular_mask,
+    "annular": annular_mask,
+    "polygon": polygon_mask,
+}
+
+
+def compile_aperture(aperture):
+    """Vectorized predicate, True where rays pass, for one aperture dict.
+
+    ``aperture["type"]`` selects the shape in ``aperture_catalog``, an
+    optional ``decenter`` shifts it and ``obscuration=True`` inverts it.
+    """
+    assert aperture["type"] in aperture_catalog, "Aperture type must be in catalog"
+    # the predicate keeps its own copy, later edits of the dict don't leak in
+    aperture = copy.deepcopy(aperture)
+    mask = aperture_catalog[aperture["type"]](aperture)
+    if aperture.get("obscuration", False):
+        return lambda x, y: ~mask(x, y)
+    return mask
+
+
+def compile_apertures(apertures):
+    """Predicate combining a list of aperture dicts, None when empty."""
+    masks = [compile_aperture(aperture) for aperture in apertures]
+    if not masks:
+        return None
+    if len(masks) == 1:
+        return masks[0]
+
+    def mask(x, y):
+        passed = masks[0](x, y)
+        for other in masks[1:]:
+            passed &= other(x, y)
+        return passed
+
+    return mask
+
+
+def args_signature(value):
+    """Hashable snapshot of surface args or apertures, equal while unchanged."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, args_signature(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(args_signature(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return (value.shape, value.dtype.str, value.tobytes())
+    return value
@@ -1,6 +1,6 @@
 import numpy as np
-from scipy.spatial.transform import Rotation as R
 
+from ..propagation import rotation_matrix
 
 # def add_tilt_sag(func):
 #     def wrapper(x, y, **kwargs):
@@ -54,9 +54,7 @@ def add_tilt_norm(func):
         else:
             tilt = kwargs["rotation"]
             kwargs.pop("rotation", None)
-            points = R.from_euler("xyz", tilt, degrees=True).apply(
-                np.c_[x, y, np.zeros_like(x)]
-            )
+            points = np.c_[x, y, np.zeros_like(x)] @ rotation_matrix(tilt).T
         return func(*points.T[:2], **kwargs).T
 
     return wrapper
@@ -73,33 +71,49 @@ def __sag_sph(x, y, c=0, **kwargs):
         return np.where(root > 0, cradiussq / (1 + np.sqrt(root)), np.nan)
 
 
+def __sag_asp_and_gradient(x, y, c=0, k=0, coef=None):
+    """Even asphere sag and its x/y partial derivatives.
+
+    The polynomial ``sum(coef[i] * r**(2 * (i + 1)))`` and its derivative with
+    respect to r**2 are evaluated together with Horner's scheme so only arrays
+    the size of ``x`` are allocated, whatever the number of coefficients.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    radius2 = x * x + y * y
+    root = 1 - (1 + k) * c**2 * radius2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sroot = np.sqrt(np.where(root > 0, root, np.nan))
+        sag = c * radius2 / (1 + sroot)
+        dsag = 0.5 * c / sroot  # d(sag) / d(radius2)
+    if coef is not None and len(coef) > 0:
+        poly = np.full_like(radius2, coef[-1])
+        dpoly = np.full_like(radius2, len(coef) * coef[-1])
+        for i in range(len(coef) - 2, -1, -1):
+            poly *= radius2
+            poly += coef[i]
+            dpoly *= radius2
+            dpoly += (i + 1) * coef[i]
+        poly *= radius2
+        sag += poly
+        dsag += dpoly
+    dsag *= 2
+    return sag, x * dsag, y * dsag
+
+
 @add_aperture
 def __sag_asp(x, y, c=0, k=0, coef=None, **kwargs):
     assert np.shape(x) == np.shape(y)
-    if c == 0:
-        return np.zeros_like(x)
-    if coef is None and k == 0:
-        return __sag_sph(x, y, c=c, **kwargs)
-    radius2 = np.asarray(x) ** 2 + np.asarray(y) ** 2
-    root = 1 - ((1 + k) * c**2 * radius2)
-    with np.errstate(invalid="ignore"):
-        return np.where(
-            root > 0,
-            ((c * radius2) / (1 + np.sqrt(root)))
-            + (
-                np.dot(
-                    coef,
-                    np.power(
-                        np.tile(radius2, [len(coef), 1])
-                        * np.ones_like(coef).reshape(-1, 1),
-                        (np.arange(len(coef)) + 1).reshape(-1, 1),
-                    ),
-                )
-                if coef is not None
-                else 0
-            ),
-            np.nan,
-        )
+    return __sag_asp_and_gradient(x, y, c=c, k=k, coef=coef)[0]
+
+
+@add_aperture
+def __sag_asp_norm(x, y, c=0, k=0, coef=None, **kwargs):
+    assert np.shape(x) == np.shape(y)
+    _, dx, dy = __sag_asp_and_gradient(x, y, c=c, k=k, coef=coef)
+    vec = np.array([dx, dy, -np.ones_like(dx)])
+    vec /= np.linalg.norm(vec, axis=0)  # normalisation
+    return vec
 
 
 @add_aperture
@@ -121,7 +135,286 @@ def __sag_sph_norm(x, y, c=0, **kwargs):
     return vec
 
 
-surfaces_catalog = {
-    "sph": {"kwargs": ["c"], "sag": __sag_sph, "normal": __sag_sph_norm},
-    "asp": {"kwargs": ["c"], "sag": __sag_asp, "normal": __sag_sph_norm},
-}
+def __sph_sag_and_gradient(x, y, params):
+    return __sag_asp_and_gradient(x, y, c=params[0])
+
+
+def __asp_sag_and_gradient(x, y, params):
+    return __sag_asp_and_gradient(x, y, c=params[0], k=params[1], coef=params[2:])
+
+
+def __pack_sph(args):
+    return np.array([args.get("c", 0)], dtype=float)
+
+
+def __pack_asp(args):
+    coef = args.get("coef")
+    return np.r_[
+        args.get("c", 0), args.get("k", 0), coef if coef is not None else []
+    ].astype(float)
+
+
+def __conic_intersection(position, cosine, params):
+    """Ray parameter of the intersection with the base conic of the surface.
+
+    Exact for spheres and conics, a starting point for Newton's method when
+    polynomial terms are present.
+    """
+    c = params[0]
+    k1 = 1 + (params[1] if len(params) > 1 else 0)
+    px, py, pz = position
+    dx, dy, dz = cosine
+    a = c * (dx * dx + dy * dy + k1 * dz * dz)
+    b = dz - c * (px * dx + py * dy + k1 * pz * dz)
+    cc = c * (px * px + py * py + k1 * pz * pz) - 2 * pz
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return cc / (b + np.copysign(np.sqrt(b * b - a * cc), b))
+
+
+def __conic_bounds(params):
+    c = params[0]
+    k1 = 1 + (params[1] if len(params) > 1 else 0)
+    if np.ndim(c):
+        # parameters of every ray in multi-configuration plans
+        with np.errstate(invalid="ignore", divide="ignore"):
+            bounds = 1 / (np.abs(c) * np.sqrt(k1))
+        return np.where((c == 0) | (k1 <= 0), np.inf, bounds)
+    if c == 0 or k1 <= 0:
+        return np.inf
+    return 1 / (abs(c) * np.sqrt(k1))
+
+
+def __zernike_terms(x, y, nterms):
+    """Yield value and x/y derivatives of the first ``nterms`` Zernike terms.
+
+    Terms follow the ANSI single index (cosine for m >= 0, sine for m < 0)
+    without normalisation factor. Each term is written ``Q(r**2) * T(x, y)``
+    where ``T`` is the real or imaginary part of ``(x + iy)**|m|``, so both
+    factors come from recurrences on the previous orders and the gradient has
+    no singularity at the origin.
+    """
+    radius2 = x * x + y * y
+    ones, zeros = np.ones_like(radius2), np.zeros_like(radius2)
+    cos_m, sin_m = [ones], [zeros]  # real and imaginary parts of (x + iy)**m
+    level1, level2 = {}, {}  # Q and dQ/d(r**2) of orders n - 1 and n - 2
+    n, j = 0, 0
+    while True:
+        if n > 0:
+            cos_m.append(cos_m[-1] * x - sin_m[-1] * y)
+            sin_m.append(cos_m[-2] * y + sin_m[-1] * x)
+        level = {}
+        for m in range(n % 2, n + 1, 2):
+            if m == n:
+                level[m] = (ones, zeros)
+            elif m == 0:
+                q1, dq1 = level1[1]
+                level[m] = (
+                    2 * radius2 * q1 - level2[0][0],
+                    2 * q1 + 2 * radius2 * dq1 - level2[0][1],
+                )
+            else:
+                qa, dqa = level1[m - 1]
+                qb, dqb = level1[m + 1]
+                level[m] = (
+                    qa + radius2 * qb - level2[m][0],
+                    dqa + qb + radius2 * dqb - level2[m][1],
+                )
+        for m in range(-n, n + 1, 2):
+            if j == nterms:
+                return
+            q, dq = level[abs(m)]
+            if m == 0:
+                yield q, 2 * x * dq, 2 * y * dq
+            else:
+                a = abs(m)
+                if m > 0:
+                    t, tx, ty = cos_m[a], a * cos_m[a - 1], -a * sin_m[a - 1]
+                else:
+                    t, tx, ty = sin_m[a], a * sin_m[a - 1], a * cos_m[a - 1]
+                yield q * t, 2 * x * dq * t + q * tx, 2 * y * dq * t + q * ty
+            j += 1
+        level2, level1 = level1, level
+        n += 1
+
+
+def __xy_terms(x, y, nterms):
+    """Yield value and x/y derivatives of the first ``nterms`` monomials.
+
+    Monomials ``x**i * y**j`` are ordered by total degree starting at 1 (x, y,
+    x**2, xy, y**2, ...); powers are built incrementally.
+    """
+    ones, zeros = np.ones_like(x), np.zeros_like(x)
+    x_pow, y_pow = [ones], [ones]
+    count, degree = 0, 1
+    while True:
+        x_pow.append(x_pow[-1] * x)
+        y_pow.append(y_pow[-1] * y)
+        for j in range(degree + 1):
+            if count == nterms:
+                return
+            i = degree - j
+            yield (
+                x_pow[i] * y_pow[j],
+                i * x_pow[i - 1] * y_pow[j] if i else zeros,
+                j * x_pow[i] * y_pow[j - 1] if j else zeros,
+            )
+            count += 1
+        degree += 1
+
+
+freeform_terms = {"zernike": __zernike_terms, "xyp": __xy_terms}
+
+
+def __freeform_sag_and_gradient(terms, x, y, params):
+    sag, dx, dy = __sag_asp_and_gradient(x, y, c=params[0], k=params[1])
+    norm_radius, coef = params[2], params[3:]
+    for a, (value, tx, ty) in zip(
+        coef, terms(np.asarray(x) / norm_radius, np.asarray(y) / norm_radius, len(coef))
+    ):
+        if np.any(a != 0):
+            sag += a * value
+            dx += (a / norm_radius) * tx
+            dy += (a / norm_radius) * ty
+    return sag, dx, dy
+
+
+def __zernike_sag_and_gradient(x, y, params):
+    return __freeform_sag_and_gradient(__zernike_terms, x, y, params)
+
+
+def __xyp_sag_and_gradient(x, y, params):
+    return __freeform_sag_and_gradient(__xy_terms, x, y, params)
+
+
+def __pack_freeform(args):
+    coef = args.get("coef")
+    return np.r_[
+        args.get("c", 0),
+        args.get("k", 0),
+        args.get("norm_radius", 1),
+        coef if coef is not None else [],
+    ].astype(float)
+
+
+class FreeformBasis:
+    """Freeform basis matrices cached on a fixed sampling grid.
+
+    Evaluating a ``zernike`` or ``xyp`` surface on the same ``x``, ``y``
+    points for many coefficient sets (e.g. during optimization) reduces to
+    matrix-vector products with the stored (nterms, N) basis matrices.
+    ``sag_and_gradient`` takes the same packed parameters as the catalog
+    kernel.
+    """
+
+    def __init__(self, type, x, y, nterms, norm_radius=1):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.norm_radius = norm_radius
+        terms = list(
+            freeform_terms[type](self.x / norm_radius, self.y / norm_radius, nterms)
+        )
+        self.value = np.array([t[0] for t in terms])
+        self.dx = np.array([t[1] for t in terms]) / norm_radius
+        self.dy = np.array([t[2] for t in terms]) / norm_radius
+
+    def sag_and_gradient(self, params):
+        assert params[2] == self.norm_radius, "Normalization radius mismatch"
+        coef = params[3:]
+        assert len(coef) <= len(self.value), "More coefficients than basis terms"
+        sag, dx, dy = surfaces_catalog["asp"]["sag_and_gradient"](
+            self.x, self.y, params[:2]
+        )
+        sag += coef @ self.value[: len(coef)]
+        dx += coef @ self.dx[: len(coef)]
+        dy += coef @ self.dy[: len(coef)]
+        return sag, dx, dy
+
+
+def register_surface(
+    name,
+    sag_and_gradient,
+    pack,
+    kwargs=(),
+    intersection=None,
+    bounds=None,
+    sag=None,
+    normal=None,
+):
+    """Add a surface type to ``surfaces_catalog``.
+
+    ``pack(args)`` turns the ``Surface.args`` dict into the flat parameter
+    array handed to the fused kernel ``sag_and_gradient(x, y, params)``, which
+    returns the sag and its x and y derivatives. ``intersection(position,
+    cosine, params)`` optionally returns the ray parameter of the intersection
+    (exact, or a starting point refined by Newton's method) and
+    ``bounds(params)`` the radius beyond which the sag is undefined. Scalar
+    ``sag`` and ``normal`` functions are derived from the kernel when omitted.
+    """
+    if sag is None:
+
+        @add_aperture
+        def sag(x, y, **kwargs):
+            return sag_and_gradient(
+                np.asarray(x, dtype=float), np.asarray(y, dtype=float), pack(kwargs)
+            )[0]
+
+    if normal is None:
+
+        @add_aperture
+        def normal(x, y, **kwargs):
+            _, dx, dy = sag_and_gradient(
+                np.asarray(x, dtype=float), np.asarray(y, dtype=float), pack(kwargs)
+            )
+            vec = np.array([dx, dy, -np.ones_like(dx)])
+            vec /= np.linalg.norm(vec, axis=0)  # normalisation
+            return vec
+
+    surfaces_catalog[name] = {
+        "kwargs": list(kwargs),
+        "sag": sag,
+        "normal": normal,
+        "sag_and_gradient": sag_and_gradient,
+        "pack": pack,
+        "intersection": intersection,
+        "bounds": bounds if bounds is not None else lambda params: np.inf,
+    }
+    return surfaces_catalog[name]
+
+
+surfaces_catalog = {}
+register_surface(
+    "sph",
+    __sph_sag_and_gradient,
+    __pack_sph,
+    kwargs=["c"],
+    intersection=__conic_intersection,
+    bounds=__conic_bounds,
+    sag=__sag_sph,
+    normal=__sag_sph_norm,
+)
+register_surface(
+    "asp",
+    __asp_sag_and_gradient,
+    __pack_asp,
+    kwargs=["c", "k", "coef"],
+    intersection=__conic_intersection,
+    bounds=__conic_bounds,
+    sag=__sag_asp,
+    normal=__sag_asp_norm,
+)
+register_surface(
+    "zernike",
+    __zernike_sag_and_gradient,
+    __pack_freeform,
+    kwargs=["c", "k", "norm_radius", "coef"],
+    intersection=__conic_intersection,
+    bounds=__conic_bounds,
+)
+register_surface(
+    "xyp",
+    __xyp_sag_and_gradient,
+    __pack_freeform,
+    kwargs=["c", "k", "norm_radius", "coef"],
+    intersection=__conic_intersection,
+    bounds=__conic_bounds,
+)
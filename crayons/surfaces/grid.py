@@ -0,0 +1,152 @@
+from functools import lru_cache
+from pathlib import Path
+import os
+import tempfile
+import numpy as np
+
+from .catalog import register_surface, surfaces_catalog
+
+__block = 256  # rows or columns prefiltered at once
+
+
+def spline_coefficients(file):
+    """Memory-mapped cubic B-spline coefficients of the height map ``file``.
+
+    Coefficients are computed once, block by block so the map is never fully
+    loaded, and stored next to the data as ``<stem>.bspline.npy``; they are
+    recomputed unless they are newer than the data file.
+    """
+    from scipy.ndimage import spline_filter1d
+
+    file = Path(file)
+    cached = file.with_suffix(".bspline.npy")
+    if cached.exists() and cached.stat().st_mtime_ns > file.stat().st_mtime_ns:
+        return np.load(cached, mmap_mode="r")
+    heights = np.load(file, mmap_mode="r")
+    # written under a temporary name so readers never see a partial file
+    handle, temporary = tempfile.mkstemp(
+        prefix=f".{cached.name}.", suffix=".npy", dir=cached.parent
+    )
+    os.close(handle)
+    try:
+        coefficients = np.lib.format.open_memmap(
+            temporary, mode="w+", dtype=float, shape=heights.shape
+        )
+        for start in range(0, heights.shape[0], __block):
+            rows = slice(start, start + __block)
+            coefficients[rows] = spline_filter1d(
+                heights[rows], order=3, axis=1, mode="mirror", output=float
+            )
+        for start in range(0, heights.shape[1], __block):
+            columns = slice(start, start + __block)
+            coefficients[:, columns] = spline_filter1d(
+                coefficients[:, columns], order=3, axis=0, mode="mirror", output=float
+            )
+        coefficients.flush()
+        del coefficients
+        os.replace(temporary, cached)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return np.load(cached, mmap_mode="r")
+
+
+@lru_cache(maxsize=64)
+def __load_grid(file, mtime, size):
+    return np.load(file, mmap_mode="r"), spline_coefficients(file)
+
+
+def load_grid(file):
+    """Memory-mapped height map and spline coefficients, shared per file.
+
+    Shared while the file is unchanged: a rewritten file is loaded again.
+    """
+    stat = os.stat(file)
+    return __load_grid(file, stat.st_mtime_ns, stat.st_size)
+
+
+def __mirror(index, size):
+    index = np.abs(index)
+    return np.where(index > size - 1, 2 * (size - 1) - index, index)
+
+
+def __bspline_weights(t):
+    s = 1 - t
+    t2 = t * t
+    weights = (
+        s * s * s / 6,
+        (3 * t2 * t - 6 * t2 + 4) / 6,
+        (-3 * t2 * t + 3 * t2 + 3 * t + 1) / 6,
+        t2 * t / 6,
+    )
+    derivatives = (-s * s / 2, (3 * t2 - 4 * t) / 2, (-3 * t2 + 2 * t + 1) / 2, t2 / 2)
+    return weights, derivatives
+
+
+class GridSag:
+    """Sag defined by a height map sampled on a regular grid.
+
+    The map is a 2D ``.npy`` file (rows along y) centred on the vertex with
+    sample spacings ``dx`` and ``dy``, added to a conic base (``c``, ``k``).
+    Data and spline coefficients stay memory-mapped and are shared by all
+    surfaces using the same file; evaluation gathers the 4x4 coefficient
+    neighbourhood of every ray, so only the touched pages are read. Points
+    outside the map have a NaN sag.
+    """
+
+    def __init__(self, file, dx=1, dy=None, c=0, k=0):
+        self.heights, self.coefficients = load_grid(str(Path(file).resolve()))
+        self.dx = dx
+        self.dy = dx if dy is None else dy
+        self.base = np.array([c, k], dtype=float)
+
+
+def __grid_sag_and_gradient(x, y, params):
+    ny, nx = params.coefficients.shape
+    u = np.asarray(x, dtype=float) / params.dx + (nx - 1) / 2
+    v = np.asarray(y, dtype=float) / params.dy + (ny - 1) / 2
+    inside = (u >= 0) & (u <= nx - 1) & (v >= 0) & (v <= ny - 1)
+    u, v = np.where(inside, u, 0), np.where(inside, v, 0)
+    i = np.clip(np.floor(u).astype(int), 0, nx - 2)
+    j = np.clip(np.floor(v).astype(int), 0, ny - 2)
+    wu, du = __bspline_weights(u - i)
+    wv, dv = __bspline_weights(v - j)
+    sag, grad_u, grad_v = np.zeros_like(u), np.zeros_like(u), np.zeros_like(u)
+    for a in range(4):
+        row = __mirror(j + a - 1, ny)
+        row_sag, row_grad = np.zeros_like(u), np.zeros_like(u)
+        for b in range(4):
+            coefficient = params.coefficients[row, __mirror(i + b - 1, nx)]
+            row_sag += wu[b] * coefficient
+            row_grad += du[b] * coefficient
+        sag += wv[a] * row_sag
+        grad_u += wv[a] * row_grad
+        grad_v += dv[a] * row_sag
+    base, base_dx, base_dy = surfaces_catalog["asp"]["sag_and_gradient"](
+        x, y, params.base
+    )
+    sag = np.where(inside, sag + base, np.nan)
+    return sag, grad_u / params.dx + base_dx, grad_v / params.dy + base_dy
+
+
+def __pack_grid(args):
+    return GridSag(
+        args["file"],
+        dx=args.get("dx", 1),
+        dy=args.get("dy"),
+        c=args.get("c", 0),
+        k=args.get("k", 0),
+    )
+
+
+def __grid_intersection(position, cosine, params):
+    return surfaces_catalog["sph"]["intersection"](position, cosine, params.base)
+
+
+register_surface(
+    "grid",
+    __grid_sag_and_gradient,
+    __pack_grid,
+    kwargs=["file", "dx", "dy", "c", "k"],
+    intersection=__grid_intersection,
+)
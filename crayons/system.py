@@ -1,13 +1,13 @@
 from dataclasses import dataclass, field
 from collections.abc import Iterable
-from .materials import Material
-from .propagation import transfert, refraction, Ray
-from copy import copy
-from .surfaces import surfaces_catalog
+from .grin import GradientIndex
+from .materials import Material, refractive_index
+from .propagation import transfert, refraction, rotation_matrix, Ray
+from .surfaces import surfaces_catalog, args_signature, compile_apertures
+from .trace import TracePlan, TraceStats
+import os
+import time
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.spatial.transform import Rotation as R
-import tabulate
 
 # @dataclass(frozen=True)
 # class Aperture:
@@ -28,7 +28,6 @@ class Surface:
         assert self.type in surfaces_catalog.keys(), "Surface type must be in catalog"
         assert self.material, "Material must be specified"
         object.__setattr__(self, "sag_func", surfaces_catalog[self.type])
-        # TODO add support for custom surfaces
         # TODO assert kwargs
         default_args = {
             "decenter": np.array([0, 0, 0]),
@@ -38,13 +37,73 @@ class Surface:
         default_args.update(self.args)
         self.args = default_args
 
+    @property
+    def params(self):
+        return self.sag_func["pack"](self.args)
+
+    @property
+    def aperture_mask(self):
+        """Compiled aperture predicate, cached until the apertures change."""
+        signature = args_signature(self.args["aperture"])
+        cached = self.__dict__.get("_aperture_mask")
+        if cached is None or cached[0] != signature:
+            cached = (signature, compile_apertures(self.args["aperture"]))
+            self.__dict__["_aperture_mask"] = cached
+        return cached[1]
+
     @property
     def direction_cosine(self):
-        return R.from_euler("xyz", self.args["rotation"], degrees=True).apply([0, 0, 1])
+        return rotation_matrix(self.args["rotation"])[:, 2]
+
+    def signature(self):
+        """Hashable key of the surface, equal while it is unchanged.
+
+        The drawing ``semi_diameter`` is left out and a sag ``file`` counts
+        with its modification time and size.
+        """
+        args = {k: v for k, v in self.args.items() if k != "semi_diameter"}
+        file = args.get("file")
+        if isinstance(file, (str, os.PathLike)) and os.path.exists(file):
+            stat = os.stat(file)
+            args["file"] = (os.fspath(file), stat.st_mtime_ns, stat.st_size)
+        return (
+            self.type,
+            args_signature(args),
+            self.thickness,
+            self.material,
+            self.positionning,
+        )
+
+
+class __Wavelengths:
+    """Wavelength properties of ``System``.
+
+    Kept in a base class so they don't replace the defaults of the dataclass
+    fields of the same names.
+    """
+
+    @property
+    def wavelengths(self):
+        return self._wavelengths
+
+    @wavelengths.setter
+    def wavelengths(self, value):
+        self._wavelengths = np.atleast_1d(value)
+        self._wavelengths_weights = np.ones_like(self.wavelengths)
+
+    @property
+    def wavelengths_weights(self):
+        return self._wavelengths_weights
+
+    @wavelengths_weights.setter
+    def wavelengths_weights(self, value):
+        if value is None or hasattr(value, "__next__"):
+            value = np.ones_like(self._wavelengths) * (1 if value is None else value)
+        self._wavelengths_weights = np.atleast_1d(value)
 
 
 @dataclass(repr=True)
-class System:
+class System(__Wavelengths):
     stop: int = 1
     wavelengths: float or Iterable = field(
         default_factory=lambda: [
@@ -53,11 +112,8 @@ class System:
     )
     surface_pointer = 0
     reference_wavelength: int = 0
-    wavelengths_weights: float or Iterable = field(
-        default_factory=lambda: [
-            1,
-        ]
-    )
+    # ones by default, a factory so the base class property is not shadowed
+    wavelengths_weights: float or Iterable = field(default_factory=lambda: None)
     surfaces: list[Surface] = field(
         default_factory=lambda: list(
             [
@@ -69,6 +125,8 @@ class System:
     )
 
     def __repr__(self):
+        import tabulate
+
         data_print = "System data\n" + tabulate.tabulate(
             [
                 [
@@ -100,24 +158,28 @@ class System:
         )
         return data_print + surface_print
 
-    @property
-    def wavelengths(self):
-        return self._wavelengths
+    def to_bytes(self):
+        from .serialization import dumps
 
-    @wavelengths.setter
-    def wavelengths(self, value):
-        self._wavelengths = np.atleast_1d(value)
-        self._wavelengths_weights = np.ones_like(self.wavelengths)
+        return dumps(self)
 
-    @property
-    def wavelengths_weights(self):
-        return self._wavelengths_weights
+    @classmethod
+    def from_bytes(cls, buffer):
+        from .serialization import loads
 
-    @wavelengths_weights.setter
-    def wavelengths_weights(self, value):
-        if "__next__" in dir(value):
-            value = np.ones_like(self._wavelengths) * value
-        self._wavelengths_weights = np.atleast_1d(value)
+        return loads(buffer)
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def __reduce__(self):
+        return (System.from_bytes, (self.to_bytes(),))
 
     def __getitem__(self, key):
         return self.surfaces[key]
@@ -151,58 +213,133 @@ class System:
             self, "surfaces", self.surfaces[:key] + self.surfaces[key + 1 :]
         )
 
-    def propagate(self, ray: tuple, key: int = 0, reverse: bool = False):
+    def propagate(
+        self,
+        ray: tuple,
+        key: int = 0,
+        reverse: bool = False,
+        stats: TraceStats = None,
+    ):
+        assert not any(
+            isinstance(s.material, GradientIndex) for s in self.surfaces
+        ), "Gradient-index media are only traced by System.trace"
+        if stats is None:
+            return self.__propagate(ray, key, reverse)
+        stats.start(len(self.surfaces), 1)
+        cache = refractive_index.cache_info()
+        try:
+            return self.__propagate(ray, key, reverse, stats)
+        finally:
+            after = refractive_index.cache_info()
+            stats.index_hits += after.hits - cache.hits
+            stats.index_misses += after.misses - cache.misses
+
+    def __propagate(self, ray, key, reverse, stats=None):
         propagation_array = []
-        current_ray = copy(ray)
+        wavelength = (
+            ray.wavelength
+            if ray.wavelength
+            else self.wavelengths[self.reference_wavelength]
+        )
+        current_ray = Ray(*ray.vector, wavelength)
         current_ray[2] = self.surfaces[key].sag_func["sag"](
             current_ray[0], current_ray[1], **self.surfaces[key].args
         )
-        current_ray.normalize(
-            self.surfaces[key].material.index(
-                current_ray.wavelength
-                if current_ray.wavelength
-                else self.wavelengths[self.reference_wavelength]
-            )
-        )
+        current_ray.normalize(self.surfaces[key].material.index(wavelength))
         coords, angle = self.get_global_vertex_coordinates()
-        for suri, sur in enumerate(self.surfaces):
-            current_ray[:3] += sur.args["decenter"]
+        for suri in range(key, -1, -1) if reverse else range(key, len(self.surfaces)):
+            sur = self.surfaces[suri]
+            tick = None if stats is None else time.perf_counter()
+            if reverse:
+                if suri != key:
+                    current_ray[:3] -= self.surfaces[suri + 1].args["decenter"]
+            else:
+                current_ray[:3] += sur.args["decenter"]
             # rotate ray in local coordinates
-            surface_rot = R.from_euler("xyz", angle[suri], degrees=True)
-            current_ray[:3], current_ray[3:] = surface_rot.apply(
-                np.c_[current_ray[:3], current_ray[3:]].T
-            )
+            current_ray[:3], current_ray[3:] = (
+                rotation_matrix(angle[suri]) @ np.c_[current_ray[:3], current_ray[3:]]
+            ).T
+            if suri == key:
+                thickness = 0
+            elif reverse:
+                thickness = -self.surfaces[suri].thickness
+            else:
+                thickness = self.surfaces[suri - 1].thickness
             current_ray = transfert(
                 current_ray,
                 lambda x, y: sur.sag_func["sag"](x, y, **sur.args),
                 lambda x, y: sur.sag_func["normal"](x, y, **sur.args),
-                (-1 if reverse else 1)
-                * self.surfaces[suri if reverse else suri - 1].thickness,
+                thickness,
             )
             if not current_ray:
-                return None
+                return self.__lost(stats, suri, tick, "failed")
+            aperture_mask = sur.aperture_mask
+            if aperture_mask is not None and not aperture_mask(
+                current_ray[0], current_ray[1]
+            ):
+                return self.__lost(stats, suri, tick, "vignetted")
+            if reverse:
+                propagation_array.append(
+                    np.concatenate(
+                        (
+                            rotation_matrix(-angle[suri])
+                            @ np.c_[current_ray[:3], current_ray[3:]]
+                        ).T
+                    )
+                )
+                if suri == 0:
+                    break
             current_ray = refraction(
                 current_ray,
-                sur.sag_func["normal"](
-                    ray[0],
-                    ray[1],
-                    **sur.args,
-                ),
+                sur.sag_func["normal"](current_ray[0], current_ray[1], **sur.args),
                 n2=self.surfaces[suri - 1 if reverse else suri].material.index(
-                    self.wavelengths[self.reference_wavelength]
+                    wavelength
                 ),
             )
-            surface_rot = R.from_euler("xyz", -angle[suri], degrees=True)
-            current_ray[:3], current_ray[3:] = surface_rot.apply(
-                np.c_[current_ray[:3], current_ray[3:]].T
-            )
             if not current_ray:
-                return None
+                return self.__lost(stats, suri, tick, "failed")
+            current_ray[:3], current_ray[3:] = (
+                rotation_matrix(-angle[suri]) @ np.c_[current_ray[:3], current_ray[3:]]
+            ).T
 
             if not reverse:
                 propagation_array.append(current_ray.vector)
+            if stats is not None:
+                stats.time[suri] += time.perf_counter() - tick
+                for callback in stats.callbacks:
+                    callback(stats, suri, np.array([True]))
         return np.array(propagation_array)[:: -1 if reverse else 1]
 
+    @staticmethod
+    def __lost(stats, suri, tick, counter):
+        if stats is not None:
+            stats.time[suri] += time.perf_counter() - tick
+            getattr(stats, counter)[suri] += 1
+            for callback in stats.callbacks:
+                callback(stats, suri, np.array([False]))
+        return None
+
+    def compile(self):
+        return TracePlan.from_system(self)
+
+    def trace(
+        self,
+        ray: Ray,
+        key: int = 0,
+        history: bool = False,
+        stats: TraceStats = None,
+        polarization: bool = False,
+        opl: bool = False,
+    ):
+        return self.compile().trace(
+            ray,
+            key=key,
+            history=history,
+            stats=stats,
+            polarization=polarization,
+            opl=opl,
+        )
+
     # def propagate(self, ray: tuple, key: int = 0, reverse: bool = False):
     #     # if key is None:
     #     #     key = 0
@@ -309,12 +446,109 @@ class System:
             direction_list.append(direction_list[-1])
             vertex_position_list.append(
                 vertex_position_list[-1]
-                + R.from_euler("xyz", direction_list[-1], degrees=True).apply([0, 0, 1])
-                * sur.thickness
+                + rotation_matrix(direction_list[-1])[:, 2] * sur.thickness
             )
         return vertex_position_list, direction_list
 
-    def plot(self, rays: tuple[Ray] = None, key: int = None, default_radius=1, ax=None):
+    def profile(self, key: int, radius: float = 1, coords=None, angle=None):
+        """Global (x, y, z) points of the meridional profile of a surface.
+
+        Profiles are cached per surface geometry and placement so redrawing a
+        layout only evaluates the sags that changed.
+        """
+        if coords is None or angle is None:
+            coords, angle = self.get_global_vertex_coordinates()
+        sur = self.surfaces[key]
+        cache = self.__dict__.setdefault("_profile_cache", {})
+        cache_key = (
+            sur.signature(),
+            radius,
+            tuple(coords[key]),
+            tuple(angle[key]),
+        )
+        if cache_key not in cache:
+            if len(cache) > 1024:
+                cache.clear()
+            domain = np.linspace(-radius, radius, 100)
+            cache[cache_key] = (
+                np.c_[
+                    np.zeros_like(domain),
+                    domain,
+                    sur.sag_func["sag"](np.zeros_like(domain), domain, **sur.args),
+                ]
+                @ rotation_matrix(angle[key]).T
+                + coords[key]
+            )
+        return cache[cache_key]
+
+    def plot_rays(
+        self, rays, key: int = 0, ax=None, max_rays: int = 1000, color="tab:blue"
+    ):
+        """Draw a traced bundle as a single ``LineCollection``.
+
+        ``rays`` is a ``Ray`` bundle or an iterable of ``Ray``; bundles larger
+        than ``max_rays`` are decimated evenly before tracing. Only rays
+        reaching the last surface are drawn.
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection
+
+        if ax is None:
+            fig, ax = plt.subplots(1, 1)
+        if isinstance(rays, Ray):
+            vector = np.array(np.broadcast_arrays(*rays.vector), dtype=float)
+            wavelength = rays.wavelength
+            vector = vector.reshape(6, -1)
+        else:
+            rays = list(rays)
+            vector = np.array([ray.vector for ray in rays], dtype=float).T
+            wavelength = np.array(
+                [
+                    (
+                        ray.wavelength
+                        if ray.wavelength
+                        else self.wavelengths[self.reference_wavelength]
+                    )
+                    for ray in rays
+                ]
+            )
+        if vector.shape[1] > max_rays:
+            selection = np.linspace(0, vector.shape[1] - 1, max_rays).astype(int)
+            vector = vector[:, selection]
+            if np.ndim(wavelength):
+                wavelength = np.asarray(wavelength)[selection]
+        bundle = self.trace(Ray(*vector, wavelength), key=key, history=True)
+        coords, angle = self.get_global_vertex_coordinates()
+        surfaces = slice(key, len(self.surfaces))
+        angle = np.array(angle[surfaces], dtype=float)
+        # history points are unrotated: back to local, then placed as profiles
+        placement = rotation_matrix(angle) @ np.swapaxes(rotation_matrix(-angle), 1, 2)
+        points = (
+            placement @ bundle.history[:, :3, bundle.valid]
+            + np.array(coords[surfaces])[:, :, None]
+        )
+        lines = LineCollection(
+            points[:, 2:0:-1].transpose(2, 0, 1), colors=color, linewidths=0.5
+        )
+        ax.add_collection(lines)
+        ax.autoscale_view()
+        return lines
+
+    def plot(
+        self,
+        rays: tuple[Ray] = None,
+        key: int = None,
+        default_radius=None,
+        ax=None,
+        max_rays: int = 1000,
+    ):
+        """Draw the meridional layout, ``rays`` being traced from ``key``.
+
+        Surfaces are drawn up to ``default_radius`` when given, otherwise up
+        to their ``semi_diameter`` (see ``analysis.clear_apertures``) or 1.
+        """
+        import matplotlib.pyplot as plt
+
         if ax is None:
             fig, ax = plt.subplots(1, 1)
         coords, angle = self.get_global_vertex_coordinates()
@@ -322,29 +556,11 @@ class System:
         prevX = False
         prevDomain = False
         previndex = False
-        # if rays:
-        #     for ray in rays if ("__iter__" in dir(rays)) else (rays,):
-        #         propagation_array = self.propagate(ray, key)
-        #         ax.plot(
-        #             propagation_array[:, 2] + thick,
-        #             propagation_array[:, 1],
-        #         )
+        if rays is not None:
+            self.plot_rays(rays, key=key if key else 0, ax=ax, max_rays=max_rays)
         for suri, sur in enumerate(self.surfaces, start=0):
-            domain = np.linspace(
-                -default_radius if default_radius else -1,
-                default_radius if default_radius else 1,
-                100,
-            )
-            rotated = (
-                R.from_euler("xyz", angle[suri], degrees=True).apply(
-                    np.c_[
-                        np.zeros_like(domain),
-                        domain,
-                        sur.sag_func["sag"](np.zeros_like(domain), domain, **sur.args),
-                    ],
-                )
-                + coords[suri]
-            )
+            radius = default_radius or sur.args.get("semi_diameter") or 1
+            rotated = self.profile(suri, radius, coords, angle)
             x1 = rotated[:, 2]
             domain = rotated[:, 1]
             if (
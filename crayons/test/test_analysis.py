@@ -0,0 +1,173 @@
+from dataclasses import replace
+import unittest
+import numpy as np
+import matplotlib.pyplot as plt
+from crayons import Material, Ray, Surface
+from crayons.analysis import (
+    Irradiance,
+    chunks,
+    clear_apertures,
+    field_map,
+    pupil_grid,
+)
+from crayons.benchmark import cooke_triplet
+from crayons.polarization import transmission
+from crayons.test.test_trace import singlet
+
+
+class TestIrradiance(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.rays = Ray(
+            rng.uniform(-0.4, 0.4, 5000),
+            rng.uniform(-0.4, 0.4, 5000),
+            0,
+            0,
+            0,
+            1,
+            wavelength=rng.choice([486.1327, 587.5618, 656.2725], 5000),
+        )
+
+    def test_matches_histogram2d(self):
+        s = singlet()
+        s.wavelengths = [486.1327, 587.5618, 656.2725]
+        s.wavelengths_weights = [1, 2, 3]
+        energy = np.linspace(0.5, 1, 5000)
+        irradiance = Irradiance.from_system(s, bins=32, extent=(-0.5, 0.5, -0.5, 0.5))
+        irradiance.trace(s, self.rays, chunk_size=1000, weights=energy)
+        bundle = s.trace(self.rays)
+        weights = energy * np.select(
+            [bundle.ray.wavelength == lam for lam in s.wavelengths], [1, 2, 3]
+        )
+        reference, _, _ = np.histogram2d(
+            bundle.ray[1][bundle.valid],
+            bundle.ray[0][bundle.valid],
+            bins=32,
+            range=[[-0.5, 0.5], [-0.5, 0.5]],
+            weights=weights[bundle.valid],
+        )
+        self.assertTrue(np.allclose(irradiance.image, reference))
+        self.assertEqual(irradiance.rays, 5000)
+
+    def test_weights_and_transmission(self):
+        s = singlet()
+        energy = np.linspace(0.5, 1, 5000)
+        extent = (-0.5, 0.5, -0.5, 0.5)
+        weighted = Irradiance(bins=32, extent=extent).trace(
+            s, self.rays, weights=energy, polarization=True
+        )
+        bundle = s.trace(self.rays, polarization=True)
+        transmitted = transmission(bundle.prt)
+        self.assertTrue(np.all(transmitted[bundle.valid] < 1))
+        reference = Irradiance(bins=32, extent=extent).add(
+            replace(bundle, prt=None), energy * transmitted
+        )
+        self.assertTrue(np.allclose(weighted.image, reference.image))
+
+    def test_chunks(self):
+        parts = list(chunks(self.rays, 2048))
+        self.assertEqual([p.vector.shape[1] for p in parts], [2048, 2048, 904])
+        self.assertTrue(
+            np.array_equal(np.hstack([p.vector for p in parts]), self.rays.vector)
+        )
+
+    def test_plot(self):
+        irradiance = Irradiance(bins=(16, 8)).trace(singlet(), self.rays)
+        self.assertEqual(irradiance.image.shape, (8, 16))
+        self.assertIsNotNone(irradiance.extent)
+        self.assertEqual(irradiance.plot().get_array().shape, (8, 16))
+        plt.close("all")
+
+
+class TestFieldMap(unittest.TestCase):
+    def test_cooke(self):
+        s = cooke_triplet()
+        fields = np.linspace(-20, 20, 5)
+        field_map_ = field_map(s, fields, fields, pupil_radius=5, pupil_samples=8)
+        self.assertEqual(field_map_.rms_radius.shape, (5, 5))
+        self.assertTrue(np.all(field_map_.transmitted == 1))
+        # rotational symmetry of the maps
+        for metric in ("rms_radius", "distortion", "field_curvature"):
+            values = getattr(field_map_, metric)
+            self.assertTrue(np.allclose(values, values.T, atol=1e-9))
+            self.assertTrue(np.allclose(values, values[::-1], atol=1e-9))
+        self.assertAlmostEqual(field_map_.distortion[2, 2], 0)
+        self.assertAlmostEqual(field_map_.astigmatism[2, 2], 0)
+        self.assertLess(field_map_.rms_radius[2, 2], field_map_.rms_radius[0, 0])
+        # chief ray heights follow f tan(theta) for a f = 50 mm triplet
+        self.assertAlmostEqual(
+            field_map_.chief[0, 2, 4] / np.tan(np.radians(20)), 50, delta=1
+        )
+
+    def test_matches_single_field_trace(self):
+        s = cooke_triplet()
+        field_map_ = field_map(s, [0], [10], pupil_radius=5, pupil_samples=8, aim=False)
+        pupil = pupil_grid(8) * 5
+        reference = []
+        for wavelength in s.wavelengths:
+            bundle = s.trace(
+                Ray(*pupil, 0, 0, np.tan(np.radians(10)), 1, wavelength=wavelength)
+            )
+            reference.append(bundle.ray.vector[:2])
+        reference = np.concatenate(reference, axis=1)
+        centroid = reference.mean(axis=1)
+        rms = np.sqrt(np.mean(np.sum((reference - centroid[:, None]) ** 2, axis=0)))
+        self.assertTrue(np.allclose(field_map_.centroid[:, 0, 0], centroid))
+        self.assertAlmostEqual(field_map_.rms_radius[0, 0], rms)
+
+
+class TestClearApertures(unittest.TestCase):
+    def test_cooke(self):
+        s = cooke_triplet()
+        apertures = clear_apertures(s, [0, 10, 20], pupil_radius=5, margin=0.5)
+        self.assertTrue(np.all(apertures.transmitted == 1))
+        # the 20 degrees chief ray lands at f tan(theta) for f = 50 mm
+        self.assertAlmostEqual(
+            apertures.semi_diameter[-1], 50 * np.tan(np.radians(20)), delta=1
+        )
+        for surface, radius in zip(s.surfaces, apertures.semi_diameter):
+            self.assertEqual(surface.args["semi_diameter"], radius + 0.5)
+        s.plot()
+        plt.close("all")
+
+    def test_incremental_update(self):
+        s = cooke_triplet()
+        clear_apertures(s, [0, 15], pupil_radius=5)
+        s.surfaces[6].args["c"] *= 1.05
+        s.surfaces[5].args["aperture"] = [{"type": "circular", "cir": 3}]
+        updated = clear_apertures(s, [0, 15], pupil_radius=5)
+        s.__dict__.pop("_clear_aperture_cache")
+        full = clear_apertures(s, [0, 15], pupil_radius=5)
+        self.assertTrue(np.allclose(updated.semi_diameter, full.semi_diameter))
+        self.assertTrue(np.allclose(updated.transmitted, full.transmitted))
+        self.assertLessEqual(full.semi_diameter[5], 3)
+        self.assertLess(full.transmitted[1], 1)
+
+    def test_incremental_material(self):
+        s = cooke_triplet()
+        glass = dict(B=(1.04, 0.23, 1.01), C=(0.006, 0.02, 103.6))
+        s.surfaces[5].material = Material(**glass)
+        before = clear_apertures(s, [0, 15], pupil_radius=5)
+        glass["B"] = (1.2, 0.23, 1.01)
+        s.surfaces[5].material = Material(**glass)
+        updated = clear_apertures(s, [0, 15], pupil_radius=5)
+        s.__dict__.pop("_clear_aperture_cache")
+        full = clear_apertures(s, [0, 15], pupil_radius=5)
+        self.assertTrue(np.allclose(updated.semi_diameter, full.semi_diameter))
+        self.assertFalse(np.allclose(before.semi_diameter, full.semi_diameter))
+        coef = np.zeros(2000)
+        surface = Surface("asp", args={"c": 0, "coef": coef})
+        signature = surface.signature()
+        coef[1000] = 1
+        self.assertNotEqual(surface.signature(), signature)
+
+    def test_incremental_tilted(self):
+        s = cooke_triplet()
+        s.surfaces[5].args["rotation"] = np.array([3, 1, 0])
+        s.surfaces[5].args["decenter"] = np.array([0, 0.2, 0])
+        clear_apertures(s, [0, 15], pupil_radius=5)
+        s.surfaces[6].args["c"] *= 1.05
+        updated = clear_apertures(s, [0, 15], pupil_radius=5)
+        s.__dict__.pop("_clear_aperture_cache")
+        full = clear_apertures(s, [0, 15], pupil_radius=5)
+        self.assertTrue(np.allclose(updated.semi_diameter, full.semi_diameter))
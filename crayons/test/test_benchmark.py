@@ -0,0 +1,27 @@
+import unittest
+import json
+import tempfile
+from pathlib import Path
+from crayons import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_fixtures(self):
+        self.assertEqual(len(benchmark.aspheric_zoom()), 33)
+        for system in (benchmark.singlet(), benchmark.cooke_triplet()):
+            self.assertTrue(system.trace(benchmark.bundle(100)).valid.all())
+
+    def test_run_and_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "bench.json"
+            code = benchmark.main(
+                ["--sizes", "100", "--repeat", "1", "--output", str(output)]
+            )
+            self.assertEqual(code, 0)
+            current = json.loads(output.read_text())
+        self.assertIn("trace/zoom30/100", current["results"])
+        self.assertGreater(current["results"]["trace/cooke/100"]["rays_per_second"], 0)
+        baseline = json.loads(json.dumps(current))
+        baseline["results"]["import/seq/cooke"]["seconds"] /= 10
+        regressions = benchmark.compare(current, baseline)
+        self.assertEqual([r[0] for r in regressions], ["import/seq/cooke"])
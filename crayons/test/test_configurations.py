@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+import numpy as np
+from crayons import Surface
+from crayons.benchmark import aspheric_zoom, bundle, cooke_triplet
+from crayons.configurations import MultiConfiguration
+
+
+class TestMultiConfiguration(unittest.TestCase):
+    def test_matches_configurations(self):
+        s = aspheric_zoom(10)
+        overrides = [
+            {
+                (3, "thickness"): 3 + 0.5 * i,
+                (6, "c"): 0.02 + 0.002 * i,
+                (8, "coef", 0): 1e-6 * (1 + i),
+                (9, "rotation", 0): 0.2 * i,
+                (10, "decenter", 1): 0.01 * i,
+            }
+            for i in range(4)
+        ]
+        multi = MultiConfiguration(s, overrides)
+        rays = bundle(200)
+        bundle_, configuration = multi.trace(rays, polarization=True)
+        self.assertEqual(len(configuration), 800)
+        for i in range(4):
+            reference = multi.configuration(i).trace(rays, polarization=True)
+            rays_i = configuration == i
+            self.assertTrue(np.array_equal(bundle_.valid[rays_i], reference.valid))
+            self.assertTrue(
+                np.allclose(bundle_.ray.vector[:, rays_i], reference.ray.vector)
+            )
+            self.assertTrue(np.allclose(bundle_.prt[rays_i], reference.prt))
+        # the shared system is left untouched
+        self.assertEqual(s.surfaces[3].thickness, 3)
+
+    def test_single_configuration(self):
+        s = cooke_triplet()
+        multi = MultiConfiguration(s)
+        plan = multi.compile()
+        self.assertEqual(plan.configurations, 1)
+        rays = bundle(100, radius=5)
+        bundle_, _ = multi.trace(rays, plan=plan)
+        self.assertTrue(np.allclose(bundle_.ray.vector, s.trace(rays).ray.vector))
+
+    def test_grid_surface(self):
+        with tempfile.TemporaryDirectory() as directory:
+            np.save(f"{directory}/map.npy", np.zeros((21, 21)))
+            s = cooke_triplet()
+            s[6] = Surface(
+                "grid",
+                args={"file": f"{directory}/map.npy", "dx": 2},
+                thickness=s[6].thickness,
+                material=s[6].material,
+            )
+            multi = MultiConfiguration(s, [{(6, "thickness"): t} for t in (40, 42)])
+            self.assertEqual(multi.compile().configurations, 2)
+            with self.assertRaisesRegex(AssertionError, "Surface 6"):
+                MultiConfiguration(s, [{(6, "c"): 0.01}, {}]).compile()
+
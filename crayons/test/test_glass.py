@@ -1,5 +1,8 @@
 from crayons.util import parse_agf
+from crayons.materials import GlassCatalog
 import unittest
+import tempfile
+from pathlib import Path
 
 
 class TestCatalog(unittest.TestCase):
@@ -10,6 +13,21 @@ class TestCatalog(unittest.TestCase):
         # self.assertEqual(catalog["BK7"]["n"], 1.5168)
         # self.assertEqual(catalog['BK7']['k'], 0.0000)
 
+    def test_lazy_catalog(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = Path(directory) / "TEST.xml"
+            file.write_text(
+                "<Catalog><Info/><Glasses><Glass><GlassName>G1</GlassName>"
+                "<DispersionCoefficients><Coefficient>1.0</Coefficient>"
+                "<Coefficient>0.01</Coefficient></DispersionCoefficients>"
+                "</Glass></Glasses></Catalog>"
+            )
+            catalog = GlassCatalog([file])
+            self.assertIn("TEST", catalog)
+            self.assertEqual(catalog.loaded, {})
+            self.assertEqual(catalog["TEST"]["G1"]["B"], (1.0,))
+            self.assertEqual(list(catalog), ["TEST"])
+
 
 if __name__ == "__main__":
     # unittest.main()
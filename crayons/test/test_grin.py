@@ -0,0 +1,83 @@
+import copy
+import pickle
+import unittest
+import numpy as np
+
+from crayons import Material, Ray, System
+from crayons.configurations import MultiConfiguration
+from crayons.grin import GradientIndex
+
+
+def rod(medium, length=10, c=0):
+    system = System()
+    system[1].material = medium
+    system[1].thickness = length
+    system[1].args["c"] = c
+    system[2].args["c"] = -c
+    return system
+
+
+class TestGradientIndex(unittest.TestCase):
+    def setUp(self):
+        self.base = Material(n=1.6)
+        self.rays = Ray(0, np.linspace(-0.5, 0.5, 11), 0, 0, 0.05, 1)
+
+    def test_uniform_medium(self):
+        homogeneous = rod(self.base, c=0.05).trace(self.rays, opl=True)
+        medium = GradientIndex(self.base, step=0.5)
+        gradient = rod(medium, c=0.05).trace(self.rays, opl=True)
+        self.assertTrue(gradient.valid.all())
+        np.testing.assert_allclose(
+            gradient.ray.vector, homogeneous.ray.vector, atol=1e-12
+        )
+        np.testing.assert_allclose(gradient.opl, homogeneous.opl, atol=1e-12)
+
+    def test_quarter_pitch_rod(self):
+        n0, g = 1.6, 0.1
+        length = np.pi / (2 * g)
+        heights = np.linspace(0, 0.02, 5)
+        for tolerance in (None, 1e-7):
+            medium = GradientIndex(
+                self.base, radial=(-n0 * g**2 / 2,), step=1, tolerance=tolerance
+            )
+            bundle = rod(medium, length).trace(Ray(0, heights, 0, 0, 0, 1), opl=True)
+            self.assertTrue(bundle.valid.all())
+            np.testing.assert_allclose(bundle.ray.vector[1], 0, atol=1e-6)
+            np.testing.assert_allclose(
+                bundle.ray.vector[4], -heights * g * n0, atol=1e-8
+            )
+            np.testing.assert_allclose(bundle.opl, n0 * length, rtol=1e-6)
+
+    def test_index_profile(self):
+        medium = GradientIndex(self.base, radial=(-0.01, 1e-4), axial=(0.02,))
+        position = np.array([[0, 1, 2], [0, 1, 0], [0, 0, 3]], dtype=float)
+        delta, gradient = medium.delta(position)
+        np.testing.assert_allclose(delta, [0, -0.02 + 4e-4, -0.04 + 16e-4 + 0.06])
+        np.testing.assert_allclose(gradient[:, 1], [-0.02 + 8e-4, -0.02 + 8e-4, 0.02])
+
+    def test_copies(self):
+        medium = GradientIndex(self.base, radial=(-0.008, 1e-5), step=0.5)
+        system = rod(medium, np.pi / (2 * 0.1))
+        system[0].material = GradientIndex(Material(B=(1, 0.2), C=(0.01, 100)))
+        for copied in (
+            copy.deepcopy(system),
+            pickle.loads(pickle.dumps(system)),
+            MultiConfiguration(system, [{(1, "thickness"): 5}]).configuration(0),
+        ):
+            self.assertEqual(copied[1].material, medium)
+            self.assertEqual(copied[0].material, system[0].material)
+        rays = Ray(0, 0.02, 0, 0, 0, 1)
+        self.assertTrue(
+            np.array_equal(
+                copy.deepcopy(system).trace(rays).ray.vector,
+                system.trace(rays).ray.vector,
+            )
+        )
+
+    def test_propagate(self):
+        with self.assertRaises(AssertionError):
+            rod(GradientIndex(self.base)).propagate(Ray(0, 0.02, 0, 0, 0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
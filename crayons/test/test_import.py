@@ -1,2 +1,199 @@
+import os
 import unittest
+import tempfile
+import numpy as np
+from crayons import file_import
+from crayons.file_import import (
+    bulk_import,
+    parse_seq,
+    parse_zmx_material,
+    read_zmx,
+    tokenize,
+)
+from crayons.materials import glass_catalog
 
+cooke = """! Cooke triplet
+LEN "Cooke"
+WL 486.1 587.6 656.3
+S 22.01359 3.25896 6204.6030
+CIR 10
+S -435.76044 6.00755
+S -22.21328 0.99997 6200.3640; STO
+S 20.29192 4.75041
+YDE 0.1; ADE 2
+S 79.68360 2.95208 6204.6030
+S -18.39533 42.20778 ! last lens surface
+GLB G2
+XDE 0.5
+"""
+
+zmx = """VERS 190513 80 123457 L123457
+MODE SEQ
+NAME Test lens
+UNIT MM X W X CM MR CPMM
+GCAT SCHOTT
+WAVM 1 0.4861327 1
+WAVM 2 0.5875618 2
+WAVM 3 0.6562725 1
+SURF 0
+  TYPE STANDARD
+  CURV 0.0 0 0 0 0 ""
+  DISZ INFINITY
+SURF 1
+  COMM "front"
+  TYPE STANDARD
+  CURV 4.5E-2 0 0 0 0 ""
+  GLAS SK16 0 0 1.6204 60.3 0 0 0 0 0 0
+  DISZ 3.25896
+  DIAM 10 1 0 0 1 ""
+SURF 2
+  STOP
+  TYPE EVENASPH
+  CURV -4.5E-2 0 0 0 0 ""
+  CONI -0.5
+  PARM 1 0
+  PARM 2 1E-5
+  PARM 3 -1E-7
+  GLAS ___BLANK 1 0 1.62 36.4 0 0 0 0 0 0
+  DISZ 1
+SURF 3
+  TYPE COORDBRK
+  PARM 1 0
+  PARM 2 0.1
+  PARM 3 2
+  DISZ 0
+SURF 4
+  TYPE STANDARD
+  CLAP 0 5 0
+  DISZ 42
+SURF 5
+  TYPE STANDARD
+  CURV 0.0 0 0 0 0 ""
+"""
+
+
+class TestImportSeq(unittest.TestCase):
+    def test_tokenize(self):
+        self.assertEqual(
+            list(tokenize("s 10 2 ! comment;yde 0.1\n\n! only comment")),
+            [("S", ["10", "2"]), ("YDE", ["0.1"])],
+        )
+
+    def test_parse_seq(self):
+        system = parse_seq(cooke)
+        self.assertEqual(len(system), 8)
+        self.assertEqual(system.stop, 3)
+        self.assertTrue(np.array_equal(system.wavelengths, [486.1, 587.6, 656.3]))
+        self.assertTrue(np.array_equal(system.wavelengths_weights, [1, 1, 1]))
+        self.assertAlmostEqual(system[1].args["c"], 1 / 22.01359)
+        self.assertEqual(system[1].args["aperture"], [{"type": "circular", "cir": 10}])
+        self.assertEqual(system[1].material.n, 1.6204)
+        self.assertEqual(system[2].material.name, "air")
+        self.assertTrue(np.array_equal(system[4].args["decenter"], [0, 0.1, 0]))
+        self.assertTrue(np.array_equal(system[4].args["rotation"], [2, 0, 0]))
+        self.assertTrue(np.array_equal(system[6].args["decenter"], [0.5, 0, 0]))
+        self.assertEqual(system[6].positionning, 2)
+        self.assertEqual(system[7].comment, "Image")
+
+    def test_rdm(self):
+        system = parse_seq("LEN\nRDM NO\nS 0.05 1\n")
+        self.assertEqual(system[1].args["c"], 0.05)
+
+    def test_file_import(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(f"{directory}/cooke.seq", "w") as f:
+                f.write(cooke)
+            self.assertEqual(
+                repr(file_import(f"{directory}/cooke.seq")), repr(parse_seq(cooke))
+            )
+            with self.assertRaises(AssertionError):
+                file_import(f"{directory}/cooke.txt")
+
+
+class TestImportZmx(unittest.TestCase):
+    def test_read_zmx(self):
+        system = read_zmx(zmx).build()
+        self.assertEqual(len(system), 6)
+        self.assertEqual(system.stop, 2)
+        self.assertTrue(np.allclose(system.wavelengths, [486.1327, 587.5618, 656.2725]))
+        self.assertTrue(np.array_equal(system.wavelengths_weights, [1, 2, 1]))
+        self.assertEqual(system[0].thickness, 0)
+        self.assertEqual(system[1].comment, "front")
+        self.assertEqual(system[1].args["c"], 4.5e-2)
+        self.assertEqual(system[1].args["semi_diameter"], 10)
+        self.assertEqual((system[1].material.n, system[1].material.vd), (1.6204, 60.3))
+        self.assertEqual(system[2].type, "asp")
+        self.assertEqual(system[2].args["k"], -0.5)
+        self.assertEqual(system[2].args["coef"], [0, 1e-5, -1e-7])
+        self.assertEqual(system[3].material, system[2].material)
+        self.assertTrue(np.array_equal(system[3].args["decenter"], [0, 0.1, 0]))
+        self.assertTrue(np.array_equal(system[3].args["rotation"], [2, 0, 0]))
+        self.assertEqual(system[4].args["aperture"], [{"type": "circular", "cir": 5}])
+        self.assertEqual(system[4].material.name, "air")
+        self.assertEqual(system[5].comment, "Image")
+
+    def test_unsupported(self):
+        with self.assertRaises(AssertionError):
+            read_zmx("MODE NSC\n")
+        with self.assertRaises(AssertionError):
+            read_zmx("SURF 0\n  TYPE TOROIDAL\n")
+
+    def test_truncated_glass(self):
+        with self.assertRaisesRegex(AssertionError, "GLAS N-BK7 0 0"):
+            read_zmx("SURF 0\nSURF 1\n  GLAS N-BK7 0 0\nSURF 2\n")
+        glass_catalog["TEST"] = {"N-BK7": {"n": 1.5168, "vd": 64.17}}
+        try:
+            material = parse_zmx_material(["N-BK7", "0", "0"])
+        finally:
+            del glass_catalog["TEST"]
+        self.assertEqual((material.name, material.catalog), ("N-BK7", "TEST"))
+
+    def test_file_import(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(f"{directory}/lens.ZMX", "w", encoding="utf-16") as f:
+                f.write(zmx)
+            self.assertEqual(
+                repr(file_import(f"{directory}/lens.ZMX")),
+                repr(read_zmx(zmx).build()),
+            )
+            results = bulk_import([f"{directory}/lens.ZMX"], cache_dir=directory)
+            self.assertEqual(repr(results[0].system), repr(read_zmx(zmx).build()))
+
+
+class TestBulkImport(unittest.TestCase):
+    def test_bulk_import(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filenames = []
+            for i, text in enumerate([cooke, "LEN\nS 10 1 UNKNOWN\n", cooke[:-20]]):
+                filenames.append(f"{directory}/lens{i}.seq")
+                with open(filenames[-1], "w") as f:
+                    f.write(text)
+            filenames.append(f"{directory}/missing.seq")
+            for processes, cached in ((2, False), (1, True)):
+                results = bulk_import(
+                    filenames, processes=processes, cache_dir=f"{directory}/cache"
+                )
+                self.assertEqual([r.filename for r in results], filenames)
+                self.assertEqual(repr(results[0].system), repr(parse_seq(cooke)))
+                self.assertEqual(results[0].cached, cached)
+                self.assertIsNone(results[1].system)
+                self.assertIsInstance(results[1].error, Exception)
+                self.assertIsNone(results[2].error)
+                self.assertIsInstance(results[3].error, OSError)
+
+    def test_unwritable_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = f"{directory}/lens.seq"
+            with open(filename, "w") as f:
+                f.write(cooke)
+            # a file where the cache directory should be
+            with open(f"{directory}/cache", "w") as f:
+                f.write("")
+            (result,) = bulk_import([filename], cache_dir=f"{directory}/cache")
+            self.assertIsNone(result.error)
+            self.assertEqual(repr(result.system), repr(parse_seq(cooke)))
+            self.assertEqual(sorted(os.listdir(directory)), ["cache", "lens.seq"])
+
+
+if __name__ == "__main__":
+    unittest.main()
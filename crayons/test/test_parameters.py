@@ -0,0 +1,57 @@
+import tempfile
+import unittest
+import numpy as np
+from crayons import Surface
+from crayons.benchmark import aspheric_zoom, bundle, cooke_triplet
+from crayons.parameters import ParameterBinding, packed_index
+from crayons.test.test_trace import singlet
+
+
+class TestParameterBinding(unittest.TestCase):
+    def test_matches_system(self):
+        s = cooke_triplet()
+        binding = ParameterBinding(
+            s,
+            [(i, "c") for i in range(1, 7)]
+            + [(2, "thickness"), (4, "decenter", 1), (5, "rotation", 0)],
+        )
+        values = binding.values + np.r_[0.001 * np.ones(6), 0.5, 0.05, 0.2]
+        binding.values = values
+        self.assertTrue(np.array_equal(binding.values, values))
+        rays = bundle(100, radius=5)
+        bound = binding.plan.trace(rays)
+        binding.update_system()
+        self.assertEqual(s.surfaces[4].args["decenter"][1], 0.05)
+        reference = s.trace(rays)
+        self.assertTrue(np.array_equal(bound.valid, reference.valid))
+        self.assertTrue(np.allclose(bound.ray.vector, reference.ray.vector))
+
+    def test_views(self):
+        s = aspheric_zoom()
+        binding = ParameterBinding(s, [(3, "k"), (3, "coef", 1), (7, "thickness")])
+        self.assertEqual(packed_index(s.surfaces[3], "coef", 1), 3)
+        binding.values = [-0.25, 1e-6, 2]
+        self.assertEqual(binding.plan.params[3][1], -0.25)
+        self.assertEqual(binding.plan.params[3][3], 1e-6)
+        self.assertEqual(binding.plan.thickness[7], 2)
+        self.assertTrue(np.shares_memory(binding.plan.params[3], binding.buffer))
+        # the surfaces are left untouched until update_system
+        self.assertNotEqual(s.surfaces[3].args["k"], -0.25)
+
+    def test_grid_surface(self):
+        with tempfile.TemporaryDirectory() as directory:
+            np.save(f"{directory}/map.npy", np.zeros((21, 21)))
+            s = singlet()
+            s[2] = Surface(
+                "grid",
+                args={"file": f"{directory}/map.npy", "dx": 0.1},
+                thickness=1.5,
+                material=s[2].material,
+            )
+            binding = ParameterBinding(s, [(1, "c"), (2, "thickness")])
+            binding.values = [0.1, 2]
+            rays = bundle(50)
+            bound = binding.plan.trace(rays)
+            binding.update_system()
+            reference = s.trace(rays)
+        self.assertTrue(np.allclose(bound.ray.vector, reference.ray.vector))
@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+from crayons import System, Surface, Material, Ray
+from crayons.paraxial import paraxial_trace, seidel, surface_profiles
+from crayons.benchmark import cooke_triplet
+
+
+def lens(k=0, a4=0):
+    s = System()
+    s[0].thickness = 1
+    s[1].args.update({"c": 0.02})
+    s[1].thickness = 3
+    s[1].material = Material(n=1.5, vd=50)
+    s.insert(Surface(type="asp", args={"c": -0.02, "k": k, "coef": [0, a4]}), 2)
+    s[2].thickness = paraxial_trace(s).image_distance[0]
+    return s
+
+
+class TestParaxial(unittest.TestCase):
+    def test_focal_length(self):
+        s = cooke_triplet()
+        trace = paraxial_trace(s)
+        self.assertAlmostEqual(-trace.y[0, 1] / trace.u[-1, 1], 50, delta=0.1)
+        self.assertTrue(np.allclose(trace.ybar[s.stop], 0))
+
+    def test_profiles(self):
+        s = lens(k=-1)
+        s[2].args["coef"] = [0.01, 1e-5]
+        curvature, deviation = surface_profiles(s)
+        self.assertAlmostEqual(curvature[2], -0.02 + 0.02)
+        self.assertAlmostEqual(deviation[2], 1e-5)
+
+
+class TestSeidel(unittest.TestCase):
+    def test_spherical_matches_trace(self):
+        for k, a4 in ((0, 0), (-1, 0), (0, 1e-5)):
+            s = lens(k, a4)
+            trace = paraxial_trace(s, 0.5)
+            coefficients = seidel(s, 0.5)
+            expected = coefficients.spherical.sum() / (2 * trace.n[-1] * trace.u[-1])
+            real = s.trace(Ray(0, 0.5, 0, 0, 0, 1)).ray[1][0]
+            self.assertAlmostEqual(real / expected[0], 1, delta=1e-2)
+
+    def test_distortion_matches_trace(self):
+        s = cooke_triplet()
+        s.wavelengths = [587.6]
+        s[-2].thickness += paraxial_trace(s).image_distance[0]
+        trace = paraxial_trace(s, 0.5, 2)
+        coefficients = seidel(s, 0.5, 2)
+        expected = coefficients.distortion.sum() / (2 * trace.n[-1] * trace.u[-1])
+        chief = s.trace(
+            Ray(0, trace.ybar[0], 0, 0, trace.ubar[0], 1), history=False
+        ).ray[1][0]
+        self.assertAlmostEqual((chief - trace.ybar[-1, 0]) / expected[0], 1, delta=1e-2)
+
+    def test_shapes_and_color(self):
+        s = cooke_triplet()
+        coefficients = seidel(s, 5, 20)
+        self.assertEqual(coefficients.spherical.shape, (len(s), 3))
+        self.assertEqual(coefficients.axial_color.shape, (len(s),))
+        self.assertTrue(np.all(coefficients.spherical[0] == 0))
+        # axial color from the paraxial focus shift between F and C
+        trace = paraxial_trace(s, 5)
+        short, long = trace.image_distance[[0, 2]]
+        ref = s.reference_wavelength
+        shift = coefficients.axial_color.sum() / (
+            trace.n[-1, ref] * trace.u[-1, ref] ** 2
+        )
+        self.assertAlmostEqual((long - short) / shift, 1, delta=0.05)
+        self.assertIn("petzval", coefficients.sums())
@@ -0,0 +1,85 @@
+import unittest
+import numpy as np
+from crayons import System, Ray, Material
+from crayons.polarization import (
+    fresnel_coefficients,
+    transmission,
+    diattenuation,
+    retardance,
+)
+from crayons.benchmark import cooke_triplet
+
+
+def interface(n=1.5):
+    s = System()
+    s[0].thickness = 1
+    s[1].material = Material(n=n)
+    s[2].material = Material(n=n)
+    return s
+
+
+class TestFresnel(unittest.TestCase):
+    def test_energy_conservation(self):
+        cos_i = np.linspace(0.1, 1, 10)
+        cos_t = np.sqrt(1 - (1 - cos_i**2) / 1.5**2)
+        rs, rp, ts, tp = fresnel_coefficients(cos_i, cos_t, 1, 1.5)
+        flux = 1.5 * cos_t / cos_i
+        self.assertTrue(np.allclose(rs**2 + flux * ts**2, 1))
+        self.assertTrue(np.allclose(rp**2 + flux * tp**2, 1))
+
+
+class TestPolarizationTrace(unittest.TestCase):
+    def test_normal_incidence(self):
+        bundle = interface().trace(Ray([0, 0.5], 0, 0, 0, 0, 1), polarization=True)
+        self.assertTrue(np.allclose(transmission(bundle.prt), 0.96))
+        self.assertTrue(np.allclose(diattenuation(bundle.prt), 0))
+
+    def test_brewster(self):
+        theta = np.arctan(1.5)
+        bundle = interface().trace(
+            Ray(0, 0, 0, 0, np.sin(theta), np.cos(theta)), polarization=True
+        )
+        cos_t = np.cos(np.arcsin(np.sin(theta) / 1.5))
+        rs, rp, _, _ = fresnel_coefficients(np.cos(theta), cos_t, 1, 1.5)
+        self.assertAlmostEqual(rp, 0)
+        self.assertTrue(np.allclose(transmission(bundle.prt), 1 - rs**2 / 2))
+        self.assertTrue(np.allclose(diattenuation(bundle.prt), rs**2 / (2 - rs**2)))
+
+    def test_cooke(self):
+        k_in = np.array([0, 0.2, 1])[:, None]
+        bundle = cooke_triplet().trace(
+            Ray(np.linspace(-4, 4, 5), 3, 0, *k_in), polarization=True
+        )
+        self.assertTrue(np.all(bundle.valid))
+        k_out = bundle.ray.cosine / np.linalg.norm(bundle.ray.cosine, axis=0)
+        self.assertTrue(
+            np.allclose(
+                np.einsum("nij,j->in", bundle.prt, k_in[:, 0] / np.linalg.norm(k_in)),
+                k_out,
+            )
+        )
+        delay = retardance(bundle.prt, bundle.transport, k_in * np.ones(5))
+        self.assertAlmostEqual(delay[2], 0)
+        self.assertTrue(np.allclose(delay, delay[::-1]))
+        self.assertTrue(np.all(transmission(bundle.prt) < 1))
+        self.assertIsNone(cooke_triplet().trace(Ray(0, 0, 0, 0, 0, 1)).prt)
+
+    def test_fold_mirror(self):
+        mirror = Material(n=-1)
+        s = System()
+        s[0].thickness = 10
+        s[1].material = mirror
+        s[1].args["rotation"] = np.array([45, 0, 0])
+        s[1].thickness = -10
+        s[2].material = mirror
+        s[2].args["rotation"] = np.array([45, 0, 0])
+        bundle = s.trace(Ray(0, np.linspace(-1, 1, 5), 0, 0, 0, 1), polarization=True)
+        self.assertTrue(np.all(bundle.valid))
+        prt = bundle.prt
+        self.assertTrue(np.all(np.isfinite(prt)))
+        # lossless: a real orthogonal matrix mapping k_in to k_out
+        self.assertTrue(np.allclose(prt @ np.swapaxes(prt, 1, 2), np.eye(3)))
+        self.assertTrue(np.allclose(transmission(prt), 1))
+        self.assertTrue(np.allclose(diattenuation(prt), 0))
+        k_out = bundle.ray.cosine / np.linalg.norm(bundle.ray.cosine, axis=0)
+        self.assertTrue(np.allclose(prt[:, :, 2].T, k_out))
@@ -139,5 +139,18 @@ class TestPropagationSph(unittest.TestCase):
         )
 
 
+class TestRotation(unittest.TestCase):
+    def test_rotation_matrix(self):
+        from scipy.spatial.transform import Rotation as R
+
+        angles = np.random.default_rng(0).uniform(-180, 180, (5, 3))
+        self.assertTrue(
+            np.allclose(
+                propagation.rotation_matrix(angles),
+                R.from_euler("xyz", angles, degrees=True).as_matrix(),
+            )
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import asyncio
+import numpy as np
+from crayons import Ray
+from crayons.service import TraceService, LocalClient
+from crayons.test.test_trace import singlet
+
+
+class TestTraceService(unittest.TestCase):
+    def test_micro_batching(self):
+        s = singlet()
+        rng = np.random.default_rng(0)
+        requests = [
+            Ray(rng.uniform(-0.5, 0.5, 3), rng.uniform(-0.5, 0.5, 3), 0, 0, 0.1, 1)
+            for _ in range(200)
+        ]
+
+        async def run():
+            async with TraceService(max_delay=0.01) as service:
+                service.register("singlet", s)
+                client = LocalClient(service, "singlet")
+                results = await asyncio.gather(*map(client.trace, requests))
+                single = await client.propagate(Ray(0.1, 0.2, 0, 0, 0.1, 1))
+            return service, results, single
+
+        service, results, single = asyncio.run(run())
+        self.assertEqual(sum(service.batches), 601)
+        self.assertLess(len(service.batches), 50)
+        plan = s.compile()
+        for ray, result in zip(requests, results):
+            reference = plan.trace(ray)
+            self.assertTrue(np.array_equal(result.valid, reference.valid))
+            self.assertTrue(np.allclose(result.ray.vector, reference.ray.vector))
+        self.assertTrue(
+            np.allclose(single, s.propagate(Ray(0.1, 0.2, 0, 0, 0.1, 1))[-1])
+        )
+
+    def test_errors_reach_callers(self):
+        async def run():
+            async with TraceService() as service:
+                service.register("singlet", singlet())
+                with self.assertRaises(KeyError):
+                    await service.trace("missing", Ray(0, 0, 0, 0, 0, 1))
+                return await service.trace("singlet", Ray(0, 0, 0, 0, 0, 1), key=1)
+
+        self.assertTrue(asyncio.run(run()).valid[0])
+
+    def test_failed_batch(self):
+        class Faulty:
+            """Plan failing on batches holding a ray at x = 999."""
+
+            def __init__(self, plan):
+                self.plan = plan
+
+            def __getattr__(self, name):
+                return getattr(self.plan, name)
+
+            def trace(self, ray, key=0):
+                if np.any(ray.vector[0] == 999):
+                    raise ValueError("bad ray")
+                return self.plan.trace(ray, key)
+
+        requests = [Ray(x, 0, 0, 0, 0, 1) for x in (0, 0.1, 999, 0.2)]
+
+        async def run():
+            async with TraceService(max_delay=0.05) as service:
+                service.plans["singlet"] = Faulty(singlet().compile())
+                client = LocalClient(service, "singlet")
+                failed = await asyncio.gather(
+                    *map(client.trace, requests), return_exceptions=True
+                )
+                later = await client.trace(Ray(0.1, 0, 0, 0, 0, 1))
+            return service, failed, later
+
+        service, failed, later = asyncio.run(run())
+        self.assertEqual(service.batches, [4, 1])
+        self.assertTrue(all(isinstance(error, ValueError) for error in failed))
+        self.assertTrue(later.valid[0])
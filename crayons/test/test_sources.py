@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from crayons import System
+from crayons.analysis import Irradiance
+from crayons.sources import (
+    Source,
+    Spectrum,
+    PointSource,
+    LambertianSource,
+    GaussianBeam,
+    simulate,
+)
+
+
+class TestSources(unittest.TestCase):
+    def test_seeded_chunks(self):
+        source = PointSource(half_angle=20, spectrum=Spectrum([500, 600], [1, 3]))
+        first = list(source.emit(1000, chunk_size=300, seed=3))
+        second = list(source.emit(1000, chunk_size=300, seed=3))
+        self.assertEqual([c.vector.shape[1] for c in first], [300, 300, 300, 100])
+        for a, b in zip(first, second):
+            self.assertTrue(np.array_equal(a.vector, b.vector))
+        rays = next(source.emit(10**5, chunk_size=10**5, seed=0))
+        self.assertGreaterEqual(rays.vector[5].min(), np.cos(np.radians(20)))
+        self.assertAlmostEqual(np.mean(rays.wavelength == 600), 0.75, places=2)
+
+    def test_distributions(self):
+        rng = np.random.default_rng(0)
+        beam = GaussianBeam(center=(1, 0), waist=2).sample(10**5, rng)
+        self.assertAlmostEqual(np.std(beam.vector[0]), 1, places=2)
+        self.assertAlmostEqual(np.mean(beam.vector[0]), 1, places=2)
+        disk = LambertianSource(radius=2).sample(10**5, rng)
+        self.assertLessEqual(np.hypot(*disk.vector[:2]).max(), 2)
+        # cos-weighted directions: <cos(theta)> = 2/3 over the hemisphere
+        self.assertAlmostEqual(np.mean(disk.vector[5]), 2 / 3, places=2)
+        collimated = Source(center=(0.5, 0)).sample(10, rng)
+        self.assertTrue(np.array_equal(collimated.vector[:, 0], [0.5, 0, 0, 0, 0, 1]))
+
+    def test_simulate(self):
+        s = System()
+        s[0].thickness = 5
+        s[1].thickness = 5
+        source = LambertianSource(radius=0.1, half_angle=30)
+        detector = simulate(
+            s,
+            source,
+            Irradiance(bins=32, extent=(-10, 10, -10, 10)),
+            target_noise=0.05,
+            chunk_size=2**14,
+            seed=1,
+        )
+        self.assertLessEqual(detector.relative_noise(), 0.05)
+        self.assertLess(detector.rays, 10**6)
+        # on-axis irradiance P / (pi d^2 sin^2(30 deg)) of a Lambertian source
+        center = detector.irradiance()[14:18, 14:18].mean()
+        self.assertAlmostEqual(center / (1 / (np.pi * 100 * 0.25)), 1, delta=0.1)
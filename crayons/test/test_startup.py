@@ -0,0 +1,40 @@
+import unittest
+import subprocess
+import sys
+
+heavy = ("matplotlib", "scipy", "tabulate", "pyparsing")
+budget = 3  # import time of crayons on top of numpy, in numpy import times
+
+
+class TestStartup(unittest.TestCase):
+    def test_lazy_imports(self):
+        loaded = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, crayons; print(' '.join(sys.modules))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        for module in heavy:
+            self.assertNotIn(module, loaded)
+
+    def test_import_time(self):
+        report = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import crayons"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stderr
+        cumulative = {}
+        for line in report.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                cumulative[fields[2].strip()] = int(fields[1])
+        self.assertIn("crayons", cumulative)
+        self.assertIn("numpy", cumulative)
+        # relative to numpy so that a loaded machine slows both alike
+        own = cumulative["crayons"] - cumulative["numpy"]
+        self.assertLess(own, budget * cumulative["numpy"])
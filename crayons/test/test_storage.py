@@ -0,0 +1,80 @@
+import unittest
+import tempfile
+import numpy as np
+from crayons import Ray
+from crayons.analysis import Irradiance, spot
+from crayons.storage import RayFile, trace_to_file
+from crayons.test.test_trace import singlet
+
+
+class TestRayFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.rays = Ray(
+            rng.uniform(-0.6, 0.6, 10000), rng.uniform(-0.6, 0.6, 10000), 0, 0, 0, 1
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_trace_to_file(self):
+        s = singlet()
+        s[2].args["aperture"].append({"type": "circular", "cir": 0.5})
+        filename = f"{self.directory.name}/rays.npy"
+        trace_to_file(s, self.rays, filename, chunk_size=3000)
+        reference = s.trace(self.rays)
+        stored = RayFile(filename)
+        self.assertIsInstance(stored.x, np.memmap)
+        self.assertEqual(len(stored), 10000)
+        self.assertTrue(np.array_equal(stored.valid, reference.valid))
+        valid = reference.valid
+        self.assertTrue(np.allclose(stored.x[valid], reference.ray[0][valid]))
+        self.assertTrue(np.allclose(stored.n[valid], reference.ray[5][valid]))
+
+        statistics = spot(stored.x, stored.y, stored.valid, chunk_size=1000)
+        x, y = reference.ray[0][valid], reference.ray[1][valid]
+        self.assertEqual(statistics.rays, valid.sum())
+        self.assertTrue(np.allclose(statistics.centroid, [x.mean(), y.mean()]))
+        self.assertAlmostEqual(
+            statistics.rms_radius,
+            np.sqrt(np.mean((x - x.mean()) ** 2 + (y - y.mean()) ** 2)),
+        )
+
+        extent = (-1, 1, -1, 1)
+        binned = Irradiance(bins=16, extent=extent)
+        for bundle in stored.chunks(4096):
+            binned.add(bundle)
+        traced = Irradiance(bins=16, extent=extent).trace(s, self.rays)
+        self.assertTrue(np.allclose(binned.image, traced.image))
+
+    def test_file_input(self):
+        s = singlet()
+        source = RayFile.from_ray(f"{self.directory.name}/in.npy", self.rays)
+        source.records["valid"][:10] = False
+        source.flush()
+        output = trace_to_file(
+            s, RayFile(source.filename), f"{self.directory.name}/out.npy"
+        )
+        self.assertFalse(np.any(output.valid[:10]))
+        self.assertEqual(
+            np.count_nonzero(output.valid),
+            np.count_nonzero(s.trace(self.rays).valid[10:]),
+        )
+
+    def test_mixed_wavelengths(self):
+        s = singlet()
+        s.wavelengths = [486.1327, 587.5618]
+        s.reference_wavelength = 1
+        rays = Ray(0, np.linspace(-0.5, 0.5, 6), 0, 0, 0.1, 1)
+        source = RayFile.from_ray(f"{self.directory.name}/in.npy", rays)
+        source.records["wavelength"][:3] = 486.1327
+        source.flush()
+        with self.assertRaises(AssertionError):
+            source.bundle()
+        output = trace_to_file(s, source, f"{self.directory.name}/out.npy")
+        wavelength = np.r_[[486.1327] * 3, [587.5618] * 3]
+        reference = s.trace(Ray(*rays.vector, wavelength))
+        self.assertTrue(np.all(output.valid))
+        self.assertTrue(np.array_equal(output.wavelength, wavelength))
+        self.assertTrue(np.allclose(output.x, reference.ray[0]))
@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+from crayons.benchmark import cooke_triplet
+from crayons.materials import Material, catalog_indices, glass_catalog
+from crayons.paraxial import paraxial_trace
+from crayons.substitution import glass_substitution
+
+
+class TestSubstitution(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        catalog = {
+            f"G{i}": {
+                "B": tuple(rng.uniform(0.2, 0.8, 3)),
+                "C": tuple(rng.uniform(1e3, 2e4, 3)),
+            }
+            for i in range(50)
+        }
+        # same glass as the first element of the triplet
+        catalog["MATCH"] = {"n": 1.6204, "vd": 60.30}
+        catalog["NEAR"] = {"n": 1.6204, "vd": 58.0}
+        catalog["FLINT"] = {"n": 1.6204, "vd": 36.40}
+        glass_catalog["TEST"] = catalog
+
+    def tearDown(self):
+        del glass_catalog["TEST"]
+
+    def test_catalog_indices(self):
+        wavelengths = [486.1, 587.6, 656.3]
+        glasses, indices = catalog_indices(wavelengths, ["TEST"])
+        self.assertEqual(indices.shape, (53, 3))
+        for (catalog, name), values in zip(glasses, indices):
+            material = Material(name=name, catalog=catalog)
+            self.assertTrue(
+                np.allclose(values, [material.index(lam) for lam in wavelengths])
+            )
+
+    def test_abbe_only_catalog(self):
+        glass_catalog["ABBE"] = {"MODEL": {"n": 1.5, "vd": 60}}
+        try:
+            glasses, indices = catalog_indices([486.1, 587.6], ["ABBE"])
+        finally:
+            del glass_catalog["ABBE"]
+        self.assertEqual(glasses, [("ABBE", "MODEL")])
+        self.assertEqual(indices.shape, (1, 2))
+        material = Material(n=1.5, vd=60)
+        self.assertTrue(
+            np.allclose(indices[0], [material.index(486.1), material.index(587.6)])
+        )
+
+    def test_ranking(self):
+        s = cooke_triplet()
+        substitution = glass_substitution(s, 1, catalogs=["TEST"])
+        self.assertEqual(substitution.surfaces, [1])
+        self.assertEqual(substitution.glasses[0], ("TEST", "MATCH"))
+        self.assertAlmostEqual(substitution.score[0], 0)
+        self.assertTrue(np.all(np.diff(substitution.score) >= 0))
+        self.assertLess(
+            substitution.glasses.index(("TEST", "NEAR")),
+            substitution.glasses.index(("TEST", "FLINT")),
+        )
+
+    def test_reoptimize(self):
+        s = cooke_triplet()
+        power = -paraxial_trace(s).u[-1, s.reference_wavelength]
+        substitution = glass_substitution(s, 5, catalogs=["TEST"], reoptimize=5)
+        self.assertTrue(np.count_nonzero(substitution.curvature_change) >= 4)
+        substitution.apply(s, 1)
+        self.assertEqual(s.surfaces[5].material, substitution.material(1))
+        self.assertAlmostEqual(-paraxial_trace(s).u[-1, s.reference_wavelength], power)
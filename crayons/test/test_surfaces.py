@@ -1,8 +1,12 @@
+import os
 import unittest
+import tempfile
 import numpy as np
-from crayons import surfaces, Ray
+from scipy.ndimage import map_coordinates
+from crayons import surfaces, Ray, Surface
 
 sph = surfaces.surfaces_catalog["sph"]
+asp = surfaces.surfaces_catalog["asp"]
 
 
 class TestRay(unittest.TestCase):
@@ -112,5 +116,273 @@ class TestSph(unittest.TestCase):
         )
 
 
+class TestAsp(unittest.TestCase):
+    def test_sag_sphere(self):
+        x, y = np.array([0, 0.5, 0.25, 1]), np.array([0, 0.5, 1.25, 1])
+        self.assertTrue(
+            np.allclose(
+                asp["sag"](x, y, c=0.75, rotation=[0, 0, 0]),
+                sph["sag"](x, y, c=0.75, rotation=[0, 0, 0]),
+                equal_nan=True,
+            )
+        )
+
+    def test_sag_conic_coef(self):
+        x, y = np.array([0, 0.5, 0.25, 1]), np.array([0, 0.5, 1.25, -1])
+        radius2 = x**2 + y**2
+        self.assertTrue(
+            np.allclose(
+                asp["sag"](x, y, c=0.2, k=-1, coef=[1e-2, -2e-3, 3e-4]),
+                0.1 * radius2 + 1e-2 * radius2 - 2e-3 * radius2**2 + 3e-4 * radius2**3,
+            )
+        )
+        self.assertTrue(np.allclose(asp["sag"](x, y, c=0, coef=[1e-2]), 1e-2 * radius2))
+
+    def test_sag_normal(self):
+        x, y = np.array([0, 0.5, 0.25, -0.7]), np.array([0, 0.5, 1.25, 0.3])
+        args = {"c": 0.3, "k": -0.6, "coef": [1e-2, -2e-3, 3e-4]}
+        eps = 1e-6
+        dx = (asp["sag"](x + eps, y, **args) - asp["sag"](x - eps, y, **args)) / (
+            2 * eps
+        )
+        dy = (asp["sag"](x, y + eps, **args) - asp["sag"](x, y - eps, **args)) / (
+            2 * eps
+        )
+        expected = np.array([dx, dy, -np.ones_like(dx)])
+        expected /= np.linalg.norm(expected, axis=0)
+        self.assertTrue(np.allclose(asp["normal"](x, y, **args), expected))
+        self.assertTrue(
+            np.allclose(
+                asp["normal"](0.38204497, 0.66486670, c=-0.25),
+                sph["normal"](0.38204497, 0.66486670, c=-0.25),
+            )
+        )
+
+
+class TestRegistry(unittest.TestCase):
+    def test_register_surface(self):
+        def cylinder(x, y, params):
+            c = params[0]
+            root = np.sqrt(1 - c**2 * y**2)
+            return c * y**2 / (1 + root), np.zeros_like(x), c * y / root
+
+        cyl = surfaces.register_surface(
+            "test_cyl",
+            cylinder,
+            lambda args: np.array([args.get("c", 0)], dtype=float),
+            kwargs=["c"],
+        )
+        self.assertIs(surfaces.surfaces_catalog["test_cyl"], cyl)
+        self.assertAlmostEqual(
+            cyl["sag"](0.3, 0.25, c=0.75), sph["sag"](0, 0.25, c=0.75)
+        )
+        self.assertTrue(
+            np.allclose(
+                cyl["normal"]([0.3], [0.25], c=0.75), sph["normal"]([0], [0.25], c=0.75)
+            )
+        )
+        surface = Surface(type="test_cyl", args={"c": 0.75})
+        self.assertTrue(np.array_equal(surface.params, [0.75]))
+        del surfaces.surfaces_catalog["test_cyl"]
+
+
+class TestAperture(unittest.TestCase):
+    def test_masks(self):
+        x = np.array([0, 0.9, 0.5, 1.5, 0.1])
+        y = np.array([0, 0, 0.8, 0, 0.1])
+        cases = [
+            ({"type": "circular", "cir": 1}, [1, 1, 1, 0, 1]),
+            ({"type": "elliptical", "rex": 2, "rey": 0.5}, [1, 1, 0, 1, 1]),
+            ({"type": "rectangular", "rex": 1, "rey": 1}, [1, 1, 1, 0, 1]),
+            ({"type": "annular", "inner": 0.2, "outer": 1}, [0, 1, 1, 0, 0]),
+            ({"type": "circular", "cir": 0.2, "obscuration": True}, [0, 1, 1, 1, 0]),
+            (
+                {"type": "circular", "cir": 1, "decenter": (1, 0)},
+                [1, 1, 1, 1, 1],
+            ),
+        ]
+        for aperture, expected in cases:
+            self.assertTrue(
+                np.array_equal(
+                    surfaces.compile_aperture(aperture)(x, y), np.array(expected, bool)
+                ),
+                aperture,
+            )
+
+    def test_polygon(self):
+        triangle = surfaces.compile_aperture(
+            {"type": "polygon", "vertices": [[0, 0], [2, 0], [0, 2]]}
+        )
+        self.assertTrue(
+            np.array_equal(
+                triangle(np.array([0.5, 1.5, -0.1, 0.9]), np.array([0.5, 1.5, 1, 0.9])),
+                [True, False, False, True],
+            )
+        )
+
+    def test_spider(self):
+        spider = surfaces.compile_apertures(
+            [
+                {"type": "circular", "cir": 1},
+                {"type": "circular", "cir": 0.3, "obscuration": True},
+                {
+                    "type": "polygon",
+                    "vertices": [[-1, -0.05], [1, -0.05], [1, 0.05], [-1, 0.05]],
+                    "obscuration": True,
+                },
+            ]
+        )
+        self.assertTrue(
+            np.array_equal(
+                spider(
+                    np.array([0, 0.5, 0.5, 0.95, 0.5]), np.array([0, 0, 0.5, 0.5, 0.2])
+                ),
+                [False, False, True, False, True],
+            )
+        )
+        self.assertIsNone(surfaces.compile_apertures([]))
+
+    def test_surface_mask_cache(self):
+        surface = Surface(args={"aperture": [{"type": "circular", "cir": 1}]})
+        mask = surface.aperture_mask
+        self.assertIs(surface.aperture_mask, mask)
+        surface.args["aperture"][0]["cir"] = 0.5
+        self.assertIsNot(surface.aperture_mask, mask)
+        self.assertFalse(surface.aperture_mask(0.7, 0))
+        self.assertTrue(mask(0.7, 0))
+
+
+class TestFreeform(unittest.TestCase):
+    x = np.array([0, 0.3, -0.5, 0.7, -0.2])
+    y = np.array([0, 0.4, 0.1, -0.6, -0.9])
+
+    def test_zernike_terms(self):
+        zernike = surfaces.surfaces_catalog["zernike"]
+        rho, theta = np.hypot(self.x, self.y), np.arctan2(self.y, self.x)
+        expected = {
+            3: rho**2 * np.sin(2 * theta),
+            4: 2 * rho**2 - 1,
+            7: (3 * rho**3 - 2 * rho) * np.sin(theta),
+            8: (3 * rho**3 - 2 * rho) * np.cos(theta),
+            12: 6 * rho**4 - 6 * rho**2 + 1,
+            13: (4 * rho**4 - 3 * rho**2) * np.cos(2 * theta),
+        }
+        for j, value in expected.items():
+            coef = np.zeros(j + 1)
+            coef[j] = 1
+            self.assertTrue(
+                np.allclose(
+                    zernike["sag"](self.x, self.y, coef=coef), value, atol=1e-12
+                ),
+                j,
+            )
+
+    def test_xy_terms(self):
+        xyp = surfaces.surfaces_catalog["xyp"]
+        self.assertTrue(
+            np.allclose(
+                xyp["sag"](self.x, self.y, norm_radius=2, coef=[0, 1, 0, 2, 0, 0, 3]),
+                self.y / 2 + 2 * self.x * self.y / 4 + 3 * self.x**2 * self.y / 8,
+            )
+        )
+
+    def test_gradient(self):
+        rng = np.random.default_rng(0)
+        for name in ("zernike", "xyp"):
+            kernel = surfaces.surfaces_catalog[name]["sag_and_gradient"]
+            params = np.r_[0.1, -0.5, 1.3, rng.normal(size=28) * 1e-2]
+            _, dx, dy = kernel(self.x, self.y, params)
+            eps = 1e-6
+            self.assertTrue(
+                np.allclose(
+                    dx,
+                    (
+                        kernel(self.x + eps, self.y, params)[0]
+                        - kernel(self.x - eps, self.y, params)[0]
+                    )
+                    / (2 * eps),
+                )
+            )
+            self.assertTrue(
+                np.allclose(
+                    dy,
+                    (
+                        kernel(self.x, self.y + eps, params)[0]
+                        - kernel(self.x, self.y - eps, params)[0]
+                    )
+                    / (2 * eps),
+                )
+            )
+
+    def test_basis(self):
+        rng = np.random.default_rng(0)
+        for name in ("zernike", "xyp"):
+            kernel = surfaces.surfaces_catalog[name]["sag_and_gradient"]
+            basis = surfaces.FreeformBasis(name, self.x, self.y, 36, norm_radius=1.3)
+            params = np.r_[0.1, -0.5, 1.3, rng.normal(size=30) * 1e-2]
+            self.assertTrue(
+                np.allclose(
+                    basis.sag_and_gradient(params), kernel(self.x, self.y, params)
+                )
+            )
+
+
+class TestGrid(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = f"{self.directory.name}/map.npy"
+        yy, xx = np.mgrid[0:120, 0:150]
+        self.heights = np.sin(xx / 20) * np.cos(yy / 30) * 1e-3
+        np.save(self.file, self.heights)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_sag_and_gradient(self):
+        grid = surfaces.surfaces_catalog["grid"]
+        params = grid["pack"]({"file": self.file, "dx": 0.01, "dy": 0.02})
+        rng = np.random.default_rng(0)
+        x, y = rng.uniform(-0.74, 0.74, 50), rng.uniform(-1.18, 1.18, 50)
+        sag, dx, dy = grid["sag_and_gradient"](x, y, params)
+        self.assertTrue(
+            np.allclose(
+                sag,
+                map_coordinates(
+                    self.heights,
+                    [y / 0.02 + 59.5, x / 0.01 + 74.5],
+                    order=3,
+                    mode="mirror",
+                ),
+            )
+        )
+        eps = 1e-6
+        self.assertTrue(
+            np.allclose(
+                dx,
+                (
+                    grid["sag_and_gradient"](x + eps, y, params)[0]
+                    - grid["sag_and_gradient"](x - eps, y, params)[0]
+                )
+                / (2 * eps),
+            )
+        )
+        self.assertTrue(np.isnan(grid["sag"](1, 0, file=self.file, dx=0.01)))
+        self.assertTrue(isinstance(params.coefficients, np.memmap))
+
+    def test_rewritten_file(self):
+        surface = Surface("grid", args={"file": self.file, "dx": 0.01})
+        signature = surface.signature()
+        heights, _ = surfaces.load_grid(self.file)
+        self.assertIs(surfaces.load_grid(self.file)[0], heights)
+        np.save(self.file, np.zeros((60, 80)))
+        heights, coefficients = surfaces.load_grid(self.file)
+        self.assertEqual(heights.shape, (60, 80))
+        self.assertNotEqual(surface.signature(), signature)
+        self.assertTrue(np.all(coefficients == 0))
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)), ["map.bspline.npy", "map.npy"]
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
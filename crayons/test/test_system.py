@@ -1,5 +1,8 @@
 import unittest
+import pickle
+import tempfile
 import numpy as np
+import matplotlib.pyplot as plt
 from crayons import System, Surface, Ray, Material
 
 
@@ -8,6 +11,15 @@ class TestSystem(unittest.TestCase):
         s = System()
         s.wavelengths = 587.56
 
+    def test_default_wavelengths(self):
+        s = System()
+        self.assertTrue(np.array_equal(s.wavelengths, [587.5618]))
+        self.assertTrue(np.array_equal(s.wavelengths_weights, [1]))
+        s = System(wavelengths=[486.1327, 587.5618, 656.2725])
+        self.assertTrue(np.array_equal(s.wavelengths_weights, [1, 1, 1]))
+        s = System(wavelengths=[486.1327, 656.2725], wavelengths_weights=[1, 3])
+        self.assertTrue(np.array_equal(s.wavelengths_weights, [1, 3]))
+
     def test_add_surface(self):
         s1 = System()
         s1.insert(Surface(type="sph", args={"c": -0.25}, thickness=1.5), 1)
@@ -180,6 +192,136 @@ class TestPlotSystem(unittest.TestCase):
         # raise NotImplementedError
         pass
 
+    def test_plot_rays(self):
+        s = System(
+            surfaces=[
+                Surface("sph", thickness=6, args={"c": 0}),
+                Surface(
+                    "sph",
+                    thickness=1,
+                    args={"c": 0.01},
+                    material=Material(n=1.5, vd=50),
+                ),
+                Surface(
+                    "sph", thickness=1, args={"c": 0}, material=Material(n=1.5, vd=50)
+                ),
+            ],
+            stop=1,
+        )
+        fig, ax = plt.subplots(1, 1)
+        lines = s.plot_rays(
+            Ray(0, np.linspace(-0.5, 0.5, 5000), 0, 0, 0.1, 1), ax=ax, max_rays=200
+        )
+        self.assertIn(lines, ax.collections)
+        self.assertEqual(len(lines.get_segments()), 200)
+        self.assertEqual(lines.get_segments()[0].shape, (3, 2))
+        s.plot((Ray(0, 0, 0, 0, 0, 1), Ray(0, 0.1, 0, 0, 0, 1)), ax=ax)
+        self.assertEqual(len(ax.collections[-1].get_segments()), 2)
+        self.assertIs(s.profile(1), s.profile(1))
+        s[1] = Surface("asp", thickness=1, args={"c": 0.01, "coef": np.zeros(2000)})
+        flat = s.profile(1)
+        s[1].args["coef"][1000] = 1e-3
+        self.assertIsNot(s.profile(1), flat)
+        plt.close(fig)
+
+    def test_plot_rays_fold_mirror(self):
+        mirror = Material(n=-1)
+        s = System(
+            surfaces=[
+                Surface("sph", thickness=10, args={"c": 0}),
+                Surface(
+                    "sph",
+                    thickness=-10,
+                    args={"c": 0, "rotation": np.array([45, 0, 0])},
+                    material=mirror,
+                ),
+                Surface(
+                    "sph",
+                    args={"c": 0, "rotation": np.array([45, 0, 0])},
+                    material=mirror,
+                ),
+            ],
+            stop=1,
+        )
+        fig, ax = plt.subplots(1, 1)
+        lines = s.plot_rays(Ray(0, np.linspace(-1, 1, 5), 0, 0, 0, 1), ax=ax)
+        points = np.array(lines.get_segments())
+        for surface in (1, 2):
+            # drawn hits lie on the drawn profile of the tilted surface
+            profile = s.profile(surface)[:, 2:0:-1]
+            direction = profile[-1] - profile[0]
+            offset = points[:, surface] - profile[0]
+            cross = direction[0] * offset[..., 1] - direction[1] * offset[..., 0]
+            self.assertTrue(np.allclose(cross, 0, atol=1e-9))
+        plt.close(fig)
+
+
+class TestSerialization(unittest.TestCase):
+    def system(self):
+        s = System(
+            surfaces=[
+                Surface("sph", thickness=6, args={"c": 0}),
+                Surface(
+                    "asp",
+                    thickness=1,
+                    args={
+                        "c": 0.01,
+                        "k": -1,
+                        "coef": np.array([1e-3, 1e-5]),
+                        "decenter": np.array([0, 0.1, 0]),
+                        "aperture": [{"type": "circular", "cir": 2.5}],
+                    },
+                    material=Material(n=1.5, vd=50),
+                ),
+                Surface(
+                    "sph",
+                    thickness=1,
+                    args={"c": 0, "rotation": np.array([2, 0, 0])},
+                    positionning=0,
+                    comment="Image",
+                ),
+            ],
+            stop=1,
+        )
+        s.wavelengths = [486.1, 587.6, 656.3]
+        s.wavelengths_weights = [0.5, 1, 0.5]
+        return s
+
+    def assertSystemEqual(self, s1, s2):
+        self.assertEqual(s1.stop, s2.stop)
+        self.assertTrue(np.array_equal(s1.wavelengths, s2.wavelengths))
+        self.assertTrue(np.array_equal(s1.wavelengths_weights, s2.wavelengths_weights))
+        self.assertEqual(len(s1), len(s2))
+        for a, b in zip(s1.surfaces, s2.surfaces):
+            self.assertEqual(
+                (a.type, a.comment, a.thickness, a.material, a.positionning),
+                (b.type, b.comment, b.thickness, b.material, b.positionning),
+            )
+            self.assertTrue(np.array_equal(a.params, b.params))
+            self.assertTrue(np.array_equal(a.args["decenter"], b.args["decenter"]))
+            self.assertTrue(np.array_equal(a.args["rotation"], b.args["rotation"]))
+            self.assertEqual(a.args["aperture"], b.args["aperture"])
+
+    def test_bytes(self):
+        s = self.system()
+        self.assertSystemEqual(s, System.from_bytes(s.to_bytes()))
+
+    def test_save_load(self):
+        s = self.system()
+        with tempfile.TemporaryDirectory() as directory:
+            s.save(f"{directory}/system.crayons")
+            self.assertSystemEqual(s, System.load(f"{directory}/system.crayons"))
+
+    def test_pickle(self):
+        s = self.system()
+        self.assertSystemEqual(s, pickle.loads(pickle.dumps(s)))
+
+    def test_version(self):
+        buffer = bytearray(self.system().to_bytes())
+        buffer[7] = 255
+        with self.assertRaises(AssertionError):
+            System.from_bytes(buffer)
+
 
 if __name__ == "__main__":
     unittest.main()
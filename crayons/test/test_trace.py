@@ -0,0 +1,132 @@
+import unittest
+import tempfile
+import numpy as np
+from crayons import System, Surface, Ray, Material, surfaces
+from crayons.trace import TraceStats
+
+
+def singlet():
+    s = System()
+    s.insert(
+        Surface(
+            type="asp",
+            args={"c": -0.25, "k": -0.5, "coef": [1e-2, 1e-3]},
+            thickness=1.5,
+        ),
+        2,
+    )
+    s[2].material = Material(**{"n": 1.5, "vd": 50})
+    s[3].material = Material(**{"n": 1.5, "vd": 50})
+    s[0].thickness = 1.5
+    s[1].thickness = 1.5
+    s[2].thickness = 1.5
+    s[0].args.update({"c": -0.25})
+    return s
+
+
+class TestTrace(unittest.TestCase):
+    bundle = Ray(
+        np.array([0, 0.1, -0.2, 0.25]),
+        np.array([-0.266052338, 0.2, 0.05, -0.1]),
+        0,
+        0,
+        0.17364818,
+        0.98480775,
+        wavelength=587.56,
+    )
+
+    def test_trace_matches_propagate(self):
+        s = singlet()
+        x = np.array([0, 0.1, -0.2, 0.25])
+        y = np.array([-0.266052338, 0.2, 0.05, -0.1])
+        bundle = s.trace(
+            Ray(x, y, 0, 0, 0.17364818, 0.98480775, wavelength=587.56), history=True
+        )
+        self.assertTrue(np.all(bundle.valid))
+        for i in range(len(x)):
+            ray = Ray(x[i], y[i], 0, 0, 0.17364818, 0.98480775, wavelength=587.56)
+            self.assertTrue(
+                np.allclose(s.propagate(ray), bundle.history[:, :, i], atol=1e-9)
+            )
+
+    def test_trace_invalid(self):
+        s = singlet()
+        s[2].args.update({"c": 2})
+        bundle = s.trace(Ray([0, 0], [0, 0.9], 0, 0, 0, 1))
+        self.assertTrue(np.array_equal(bundle.valid, [True, False]))
+
+    def test_compiled_plan(self):
+        s = singlet()
+        plan = s.compile()
+        ray = Ray(0.1, 0.2, 0, 0, 0.17364818, 0.98480775, wavelength=587.56)
+        self.assertTrue(
+            np.allclose(plan.trace(ray).ray.vector[:, 0], s.propagate(ray)[-1])
+        )
+
+    def test_trace_vignetting(self):
+        s = singlet()
+        s[2].args["aperture"].append({"type": "circular", "cir": 0.55})
+        s[2].args["aperture"].append(
+            {"type": "circular", "cir": 0.3, "obscuration": True}
+        )
+        bundle = s.trace(
+            Ray([0, 0, 0], [-0.266052338, 0, 0.1], 0, 0, 0.17364818, 0.98480775)
+        )
+        self.assertTrue(np.array_equal(bundle.valid, [False, True, False]))
+        ray = Ray(0, -0.266052338, 0, 0, 0.17364818, 0.98480775)
+        self.assertIsNone(s.propagate(ray))
+
+    def test_trace_grid(self):
+        with tempfile.TemporaryDirectory() as directory:
+            yy, xx = (np.mgrid[0:201, 0:201] - 100) * 0.01
+            np.save(
+                f"{directory}/map.npy",
+                surfaces.surfaces_catalog["sph"]["sag"](xx, yy, c=-0.25),
+            )
+            s = singlet()
+            s[2].args.update({"k": 0, "coef": None})
+            reference = s.trace(self.bundle)
+            s[2] = Surface(
+                "grid",
+                args={"file": f"{directory}/map.npy", "dx": 0.01},
+                thickness=1.5,
+                material=s[2].material,
+            )
+            bundle = s.trace(self.bundle)
+        self.assertTrue(np.all(bundle.valid))
+        self.assertTrue(np.allclose(bundle.ray.vector, reference.ray.vector, atol=1e-7))
+
+
+class TestTraceStats(unittest.TestCase):
+    def test_bundle_stats(self):
+        s = singlet()
+        s[2].args["aperture"].append({"type": "circular", "cir": 0.55})
+        s[2].args.update({"c": 2})
+        stats = TraceStats()
+        seen = []
+        stats.callbacks.append(lambda st, suri, valid: seen.append(valid.sum()))
+        s.trace(Ray([0, 0, 0.3, 0.5], [0, 0.9, 0, 0], 0, 0, 0, 1), stats=stats)
+        self.assertEqual((stats.traces, stats.rays), (1, 4))
+        self.assertTrue(np.array_equal(stats.failed, [0, 0, 1, 0]))
+        self.assertTrue(np.array_equal(stats.vignetted, [0, 0, 0, 0]))
+        self.assertEqual(seen, [4, 4, 3, 3])
+        self.assertTrue(np.all(stats.iterations[1:] > 0))
+        self.assertTrue(np.all(stats.max_iterations <= 32))
+        self.assertTrue(np.all(stats.time > 0))
+        s.trace(Ray(0, 0, 0, 0, 0, 1), stats=stats)
+        self.assertEqual((stats.traces, stats.rays), (2, 5))
+        self.assertIn("Newton", repr(stats))
+
+    def test_propagate_stats(self):
+        s = singlet()
+        s[2].args["aperture"].append({"type": "circular", "cir": 0.1})
+        stats = TraceStats()
+        s.propagate(Ray(0, 0.05, 0, 0, 0, 1), stats=stats)
+        self.assertIsNone(s.propagate(Ray(0, 0.2, 0, 0, 0, 1), stats=stats))
+        self.assertTrue(np.array_equal(stats.vignetted, [0, 0, 1, 0]))
+        self.assertEqual(stats.traces, 2)
+        self.assertGreater(stats.index_hits + stats.index_misses, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,400 @@
+from dataclasses import dataclass, field
+from collections.abc import Callable
+import time
+import numpy as np
+
+from .grin import GradientIndex, integrate
+from .materials import Material, refractive_index
+from .polarization import interface_matrices
+from .propagation import (
+    Ray,
+    find_intersection_bundle,
+    refraction_bundle,
+    rotation_matrix,
+)
+
+
+def material_indices(material: Material, wavelength: np.ndarray) -> np.ndarray:
+    """Index of ``material`` for every ray, computed once per distinct wavelength."""
+    lams, inverse = np.unique(wavelength, return_inverse=True)
+    return np.array([material.index(lam) for lam in lams.tolist()])[inverse]
+
+
+def local_indices(material, position: np.ndarray, wavelength: np.ndarray):
+    """Index of ``material`` for every ray at (3, N) local ``position``."""
+    index = material_indices(material, wavelength)
+    if isinstance(material, GradientIndex):
+        index = index + material.delta(position)[0]
+    return index
+
+
+@dataclass
+class BundleTrace:
+    """Result of tracing a bundle through a ``TracePlan``.
+
+    ``ray`` holds the bundle on the last traced surface, ``valid`` flags the
+    rays that reached it and ``history`` (when requested) stacks the (6, N)
+    ray vectors after each surface, as rows of ``System.propagate`` do.
+    With polarization, ``prt`` holds the (N, 3, 3) polarization ray-tracing
+    matrices of the path and ``transport`` their non-polarizing counterpart
+    (see ``crayons.polarization``). ``opl`` is the optical path length of
+    every ray from its start.
+    """
+
+    ray: Ray
+    valid: np.ndarray
+    history: np.ndarray = field(default=None)
+    prt: np.ndarray = field(default=None)
+    transport: np.ndarray = field(default=None)
+    opl: np.ndarray = field(default=None)
+
+
+@dataclass
+class TraceStats:
+    """Opt-in counters of a trace, accumulated over successive calls.
+
+    Per surface: wall ``time`` in seconds, summed and worst per-ray Newton
+    ``iterations``, rays lost by a ``failed`` intersection or total
+    reflection and rays ``vignetted`` by the surface bounds or apertures.
+    Index lookups are counted as hits and misses of the ``refractive_index``
+    cache. Every callback is called after each surface as
+    ``callback(stats, surface, valid)``.
+    """
+
+    callbacks: list[Callable] = field(default_factory=list)
+    traces: int = 0
+    rays: int = 0
+    time: np.ndarray = field(default=None)
+    iterations: np.ndarray = field(default=None)
+    max_iterations: np.ndarray = field(default=None)
+    failed: np.ndarray = field(default=None)
+    vignetted: np.ndarray = field(default=None)
+    index_hits: int = 0
+    index_misses: int = 0
+
+    def start(self, n_surfaces: int, n_rays: int):
+        if self.time is None or len(self.time) != n_surfaces:
+            self.reset(n_surfaces)
+        self.traces += 1
+        self.rays += n_rays
+
+    def reset(self, n_surfaces: int):
+        self.traces = self.rays = self.index_hits = self.index_misses = 0
+        self.time = np.zeros(n_surfaces)
+        self.iterations = np.zeros(n_surfaces, dtype=int)
+        self.max_iterations = np.zeros(n_surfaces, dtype=int)
+        self.failed = np.zeros(n_surfaces, dtype=int)
+        self.vignetted = np.zeros(n_surfaces, dtype=int)
+
+    @property
+    def index_hit_rate(self):
+        lookups = self.index_hits + self.index_misses
+        return self.index_hits / lookups if lookups else np.nan
+
+    @property
+    def slowest(self):
+        return int(np.argmax(self.time))
+
+    def __repr__(self):
+        import tabulate
+
+        return (
+            f"{self.traces} traces, {self.rays} rays, "
+            f"index cache hit rate {self.index_hit_rate:.1%}\n"
+            + tabulate.tabulate(
+                zip(
+                    range(len(self.time)),
+                    self.time * 1e3,
+                    self.iterations,
+                    self.max_iterations,
+                    self.failed,
+                    self.vignetted,
+                ),
+                headers=[" ", "Time (ms)", "Newton", "Max", "Failed", "Vign."],
+                tablefmt="fancy_grid",
+            )
+        )
+
+
+@dataclass
+class TracePlan:
+    """System compiled into packed arrays for bundle tracing.
+
+    Surface parameters are packed once by their catalog ``pack`` function so
+    every Newton iteration is a single call to the fused ``sag_and_gradient``
+    kernel on arrays, and apertures are compiled once into mask predicates
+    that flag vignetted rays as invalid.
+
+    Multi-configuration plans (see ``crayons.configurations``) carry a
+    leading configuration axis on ``thickness``, ``decenter`` and ``angles``
+    and on the ``params`` of the surfaces that differ between
+    configurations.
+    """
+
+    kernels: list
+    intersections: list
+    bounds: list
+    params: list
+    apertures: list
+    materials: list
+    thickness: np.ndarray
+    decenter: np.ndarray
+    angles: np.ndarray
+    wavelengths: np.ndarray
+    reference_wavelength: int = 0
+    rotation: np.ndarray = field(init=False)
+    unrotation: np.ndarray = field(init=False)
+    tilted: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.update_rotations()
+
+    @classmethod
+    def from_system(cls, system):
+        _, angles = system.get_global_vertex_coordinates()
+        return cls(
+            kernels=[s.sag_func["sag_and_gradient"] for s in system.surfaces],
+            intersections=[s.sag_func["intersection"] for s in system.surfaces],
+            bounds=[s.sag_func["bounds"] for s in system.surfaces],
+            params=[s.params for s in system.surfaces],
+            apertures=[s.aperture_mask for s in system.surfaces],
+            materials=[s.material for s in system.surfaces],
+            thickness=np.array([s.thickness for s in system.surfaces], dtype=float),
+            decenter=np.array(
+                [s.args["decenter"] for s in system.surfaces], dtype=float
+            ),
+            angles=np.array(angles[: len(system.surfaces)], dtype=float),
+            wavelengths=np.array(system.wavelengths, dtype=float),
+            reference_wavelength=system.reference_wavelength,
+        )
+
+    def update_rotations(self):
+        self.rotation = rotation_matrix(self.angles)
+        self.unrotation = rotation_matrix(-self.angles)
+        self.tilted = np.any(self.angles != 0, axis=-1)
+        if self.tilted.ndim == 2:
+            self.tilted = np.any(self.tilted, axis=0)
+
+    @property
+    def configurations(self):
+        return len(self.thickness) if self.thickness.ndim == 2 else 1
+
+    @staticmethod
+    def __at(values, configuration):
+        """Values of the configuration of every ray, rays on the last axis.
+
+        ``values`` has a leading configuration axis; values shared by all the
+        configurations are returned once.
+        """
+        if np.all(values == values[:1]):
+            return values[0]
+        return np.moveaxis(values[configuration], 0, -1)
+
+    @staticmethod
+    def __rotate(matrix, vectors):
+        if matrix.ndim == 2:
+            return matrix @ vectors
+        return np.einsum("ijn,jn->in", matrix, vectors)
+
+    def __len__(self):
+        return len(self.kernels)
+
+    def trace(
+        self,
+        ray: Ray,
+        key: int = 0,
+        history: bool = False,
+        stats: TraceStats = None,
+        polarization: bool = False,
+        configuration=0,
+        opl: bool = False,
+    ) -> BundleTrace:
+        """Trace a bundle from surface ``key`` to the last surface.
+
+        ``ray`` is a ``Ray`` whose components are arrays of N rays (scalars
+        are broadcast) and whose wavelength is a scalar, an array of N values
+        or None for the reference wavelength. Follows the conventions of
+        ``System.propagate``. Counters are accumulated in ``stats`` when given
+        and ``polarization`` composes the Fresnel PRT matrices of every ray.
+        ``configuration`` is the configuration index of every ray (or of the
+        whole bundle) of a multi-configuration plan. Rays are integrated
+        through ``GradientIndex`` media and ``opl`` accumulates their optical
+        path lengths.
+        """
+        vector = np.array(np.broadcast_arrays(*ray.vector), dtype=float)
+        vector = vector.reshape(6, -1)
+        n_rays = vector.shape[1]
+        if stats is not None:
+            stats.start(len(self), n_rays)
+            cache = refractive_index.cache_info()
+            iterations = np.zeros(n_rays, dtype=int)
+        wavelength = (
+            self.wavelengths[self.reference_wavelength]
+            if ray.wavelength is None
+            else ray.wavelength
+        )
+        wavelength = np.broadcast_to(np.asarray(wavelength, dtype=float), (n_rays,))
+        if self.thickness.ndim == 2:
+            configuration = np.broadcast_to(configuration, (n_rays,))
+
+            def select(values):
+                return self.__at(values, configuration)
+
+        else:
+
+            def select(values):
+                return values
+
+        def surface_params(suri):
+            params = self.params[suri]
+            return select(params) if np.ndim(params) == 2 else params
+
+        position, cosine = vector[:3], vector[3:]
+        params = surface_params(key)
+        position[2] = self.kernels[key](position[0], position[1], params)[0]
+        cosine *= local_indices(self.materials[key], position, wavelength) / np.sqrt(
+            np.einsum("ij,ij->j", cosine, cosine)
+        )
+        valid = np.isfinite(position[2])
+        path = np.zeros(n_rays) if opl else None
+        steps = [] if history else None
+        if polarization:
+            prt = np.broadcast_to(np.eye(3), (n_rays, 3, 3)).copy()
+            transport = prt.copy()
+        for suri in range(key, len(self)):
+            if stats is not None:
+                tick = time.perf_counter()
+                iterations[:] = 0
+                alive = np.count_nonzero(valid)
+            if suri != key and isinstance(self.materials[suri - 1], GradientIndex):
+                length, arrived = self.__gradient_index(
+                    suri, position, cosine, wavelength, select
+                )
+                valid &= arrived
+                if opl:
+                    path += length
+            params = surface_params(suri)
+            position += select(self.decenter[..., suri, :]).reshape(3, -1)
+            if self.tilted[suri]:
+                rotation = select(self.rotation[..., suri, :, :])
+                unrotation = select(self.unrotation[..., suri, :, :])
+                position[:] = self.__rotate(rotation, position)
+                cosine[:] = self.__rotate(rotation, cosine)
+            if suri != key:
+                position[2] -= select(self.thickness[..., suri - 1])
+            start = (
+                self.intersections[suri](position, cosine, params)
+                if self.intersections[suri] is not None
+                else None
+            )
+            param, dx, dy, converged = find_intersection_bundle(
+                position,
+                cosine,
+                self.kernels[suri],
+                params,
+                start=start,
+                iterations=None if stats is None else iterations,
+            )
+            valid &= converged
+            if stats is not None:
+                intersected = np.count_nonzero(valid)
+            position += np.where(converged, param, 0) * cosine
+            if opl:
+                path += np.where(converged, param, 0) * np.einsum(
+                    "ij,ij->j", cosine, cosine
+                )
+            bounds = self.bounds[suri](params)
+            if np.any(np.isfinite(bounds)):
+                valid &= position[0] ** 2 + position[1] ** 2 <= bounds**2
+            if self.apertures[suri] is not None:
+                valid &= self.apertures[suri](position[0], position[1])
+            if stats is not None:
+                unvignetted = np.count_nonzero(valid)
+            refracted = suri != key and self.materials[suri] != self.materials[suri - 1]
+            if refracted:
+                incident = cosine.copy()
+                index = local_indices(self.materials[suri], position, wavelength)
+                cosine[:], ok = refraction_bundle(cosine, dx, dy, index)
+                valid &= ok
+            if polarization and (refracted or self.tilted[suri]):
+                local = [np.eye(3), np.eye(3)]
+                if refracted:
+                    normal = np.array([dx, dy, -np.ones_like(dx)])
+                    n1 = np.sqrt(np.einsum("ij,ij->j", incident, incident))
+                    local = interface_matrices(incident, cosine, normal, n1, index)
+                if self.tilted[suri]:
+                    to_local, to_global = rotation, unrotation
+                    if to_local.ndim == 3:
+                        to_local = np.moveaxis(to_local, -1, 0)
+                        to_global = np.moveaxis(to_global, -1, 0)
+                    local = [to_global @ m @ to_local for m in local]
+                prt = local[0] @ prt
+                transport = local[1] @ transport
+            if self.tilted[suri]:
+                position[:] = self.__rotate(unrotation, position)
+                cosine[:] = self.__rotate(unrotation, cosine)
+            if history:
+                steps.append(vector.copy())
+            if stats is not None:
+                stats.time[suri] += time.perf_counter() - tick
+                stats.iterations[suri] += iterations.sum()
+                stats.max_iterations[suri] = max(
+                    stats.max_iterations[suri], iterations.max(initial=0)
+                )
+                stats.failed[suri] += (
+                    alive - intersected + unvignetted - np.count_nonzero(valid)
+                )
+                stats.vignetted[suri] += intersected - unvignetted
+                for callback in stats.callbacks:
+                    callback(stats, suri, valid)
+        if stats is not None:
+            after = refractive_index.cache_info()
+            stats.index_hits += after.hits - cache.hits
+            stats.index_misses += after.misses - cache.misses
+        return BundleTrace(
+            ray=Ray(*vector, wavelength),
+            valid=valid,
+            history=np.array(steps) if history else None,
+            prt=prt if polarization else None,
+            transport=transport if polarization else None,
+            opl=path,
+        )
+
+    def __gradient_index(self, suri, position, cosine, wavelength, select):
+        """Integrate the rays through the medium before surface ``suri``.
+
+        Rays are moved in place to just before the surface and their optical
+        path lengths are returned with the flags of the rays that got there.
+        """
+        medium = self.materials[suri - 1]
+        thickness = select(self.thickness[..., suri - 1])
+        decenter = select(self.decenter[..., suri, :]).reshape(3, -1)
+        params = self.params[suri]
+        params = select(params) if np.ndim(params) == 2 else params
+        to_medium = select(self.rotation[..., suri - 1, :, :])
+        from_medium = select(self.unrotation[..., suri - 1, :, :])
+        rotation = select(self.rotation[..., suri, :, :])
+
+        def rays_of(values, rays, ndim):
+            """Values of ``rays`` when given per ray, on the last axis."""
+            return values[..., rays] if np.ndim(values) > ndim else values
+
+        def crossing(points, rays):
+            points = self.__rotate(rays_of(from_medium, rays, 2), points)
+            points = points + (decenter[:, rays] if decenter.shape[1] > 1 else decenter)
+            points = self.__rotate(rays_of(rotation, rays, 2), points)
+            sag = self.kernels[suri](points[0], points[1], rays_of(params, rays, 1))[0]
+            return points[2] - rays_of(thickness, rays, 0) - sag
+
+        medium_position = self.__rotate(to_medium, position)
+        medium_cosine = self.__rotate(to_medium, cosine)
+        length, arrived = integrate(
+            medium,
+            medium_position,
+            medium_cosine,
+            material_indices(medium, wavelength),
+            crossing,
+        )
+        position[:] = self.__rotate(from_medium, medium_position)
+        cosine[:] = self.__rotate(from_medium, medium_cosine)
+        return length, arrived